@@ -0,0 +1,130 @@
+"""Entrada e execucao de lotes de imagens (/analyze/batch).
+
+As imagens podem vir como varios arquivos no multipart e/ou dentro de
+arquivos .zip. O conteudo de cada imagem so e lido quando ela entra na
+janela de processamento, entao a memoria fica limitada pelo tamanho da
+janela e nao pelo tamanho do lote.
+"""
+import asyncio
+import os
+import zipfile
+
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+# Mesmos formatos de uploads.ALLOWED_FORMATS
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+class BatchError(ValueError):
+    """Lote invalido como um todo (zip corrompido, imagens demais...)."""
+
+
+class BatchItem:
+    """Uma imagem do lote; `read()` carrega os bytes sob demanda."""
+
+    def __init__(self, name, reader):
+        self.name = name
+        self._reader = reader
+
+    async def read(self) -> bytes:
+        return await self._reader()
+
+
+def _is_zip(upload):
+    return upload.content_type in ZIP_CONTENT_TYPES or (upload.filename or "").lower().endswith(".zip")
+
+
+def _zip_items(upload, max_image_bytes):
+    try:
+        archive = zipfile.ZipFile(upload.file)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise BatchError(f"Zip invalido ({upload.filename}): {e}")
+    items = []
+    for info in archive.infolist():
+        name = info.filename
+        base = os.path.basename(name)
+        if info.is_dir() or name.startswith("__MACOSX/") or base.startswith(".") or not base.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+
+        async def read(info=info):
+            # O tamanho declarado no zip e checado antes de descompactar
+            if info.file_size > max_image_bytes:
+                raise ValueError(f"Imagem maior que {max_image_bytes} bytes")
+            return await asyncio.to_thread(archive.read, info)
+
+        items.append(BatchItem(f"{upload.filename}/{name}", read))
+    return items
+
+
+async def collect_items(uploads, max_images, max_image_bytes):
+    """Lista as imagens do lote (sem ler o conteudo), expandindo os zips na ordem recebida."""
+    items = []
+    for upload in uploads:
+        if _is_zip(upload):
+            items.extend(await asyncio.to_thread(_zip_items, upload, max_image_bytes))
+        elif upload.content_type and upload.content_type.startswith("image/"):
+            async def read(upload=upload):
+                if upload.size is not None and upload.size > max_image_bytes:
+                    raise ValueError(f"Imagem maior que {max_image_bytes} bytes")
+                return await upload.read()
+
+            items.append(BatchItem(upload.filename, read))
+        else:
+            raise BatchError(f"Arquivo deve ser uma imagem ou um .zip: {upload.filename}")
+        if len(items) > max_images:
+            raise BatchError(f"Maximo de {max_images} imagens por lote")
+    if not items:
+        raise BatchError("Nenhuma imagem no lote")
+    return items
+
+
+async def run_window(items, worker, window, ordered=True):
+    """Executa `worker(item)` com no maximo `window` itens em andamento.
+
+    Gera listas de (indice, item, resultado) prontas para envio: em ordem de
+    entrada (`ordered=True`) ou na ordem em que terminam. Cada lista junta
+    tudo o que ficou pronto ao mesmo tempo, para ser processado em lote.
+    Resultados sao (valor, erro, detalhes), o formato de
+    main.extract_skin_color; excecoes do worker viram erro do item.
+    """
+    source = iter(enumerate(items))
+    pending = {}
+    finished = {}
+    next_out = 0
+    exhausted = False
+
+    async def guarded(item):
+        try:
+            return await worker(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return None, str(e) or type(e).__name__, None
+
+    try:
+        while True:
+            # Resultados aguardando a vez (modo ordenado) tambem contam na janela
+            while not exhausted and len(pending) + len(finished) < window:
+                try:
+                    index, item = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[asyncio.ensure_future(guarded(item))] = (index, item)
+            if not pending:
+                break
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, item = pending.pop(task)
+                finished[index] = (item, task.result())
+            if ordered:
+                ready = []
+                while next_out in finished:
+                    ready.append((next_out, *finished.pop(next_out)))
+                    next_out += 1
+            else:
+                ready = [(index, *finished.pop(index)) for index in sorted(finished)]
+            if ready:
+                yield ready
+    finally:
+        for task in pending:
+            task.cancel()
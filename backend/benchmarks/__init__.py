@@ -0,0 +1 @@
+"""Benchmarks da API (executar a partir de backend/: python -m benchmarks.<nome>)."""
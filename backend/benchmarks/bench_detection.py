@@ -0,0 +1,63 @@
+"""Deteccao reduzida vs caminho original: latencia e concordancia da classificacao.
+
+Cada imagem de entrada e reamostrada para os lados pedidos e recodificada em
+JPEG; o caminho original (decode e deteccao em resolucao cheia) e comparado
+com o otimizado (decode reduzido + deteccao na copia pequena).
+
+Uso: python -m benchmarks.bench_detection --imagens fotos/*.jpg [--lados 1024 2048 4000]
+"""
+import argparse
+
+import cv2
+
+from benchmarks.common import measure, write_results
+from main import classify_monk_tone
+from vision import analyze_image_bytes
+
+
+def resized_jpeg(path, side):
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise SystemExit(f"Nao foi possivel ler {path}")
+    h, w = img.shape[:2]
+    scale = side / max(h, w)
+    img = cv2.resize(img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_CUBIC)
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 92])[1].tobytes()
+
+
+def run(paths, sides, detect_max_side, decode_min_side, repeats):
+    results = []
+    for side in sides:
+        entry = {"lado": side, "original": [], "otimizado": [], "mesmo_tom": 0, "deteccao_divergente": 0, "dif_rgb_max": 0, "imagens": len(paths)}
+        for path in paths:
+            contents = resized_jpeg(path, side)
+            legacy, _, _ = analyze_image_bytes(contents)
+            fast, _, _ = analyze_image_bytes(contents, detect_max_side, decode_min_side)
+            if legacy is None or fast is None:
+                entry["deteccao_divergente"] += int((legacy is None) != (fast is None))
+            else:
+                entry["mesmo_tom"] += int(classify_monk_tone(*legacy)["tom"] == classify_monk_tone(*fast)["tom"])
+                entry["dif_rgb_max"] = max(entry["dif_rgb_max"], max(abs(a - b) for a, b in zip(legacy, fast)))
+            entry["original"].append(measure(lambda: analyze_image_bytes(contents), repeats=repeats, warmup=1)["p50_ms"])
+            entry["otimizado"].append(measure(lambda: analyze_image_bytes(contents, detect_max_side, decode_min_side), repeats=repeats, warmup=1)["p50_ms"])
+        entry["original_p50_ms"] = round(sum(entry.pop("original")) / len(paths), 2)
+        entry["otimizado_p50_ms"] = round(sum(entry.pop("otimizado")) / len(paths), 2)
+        entry["speedup"] = round(entry["original_p50_ms"] / entry["otimizado_p50_ms"], 2)
+        results.append(entry)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--imagens", nargs="+", required=True)
+    parser.add_argument("--lados", type=int, nargs="+", default=[1024, 2048, 4000])
+    parser.add_argument("--detect-max-side", type=int, default=640)
+    parser.add_argument("--decode-min-side", type=int, default=1600)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--saida")
+    args = parser.parse_args()
+    write_results("deteccao", run(args.imagens, args.lados, args.detect_max_side, args.decode_min_side, args.repeticoes), args.saida)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Custo por requisicao do matching de produtos em catalogos de 10k, 100k e 1M linhas.
+
+Uso: python -m benchmarks.bench_matching [--tamanhos 10000 100000] [--saida res.json]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.common import measure, write_results
+from catalog import MATCH_METRICS, CatalogSnapshot
+
+
+def synthetic_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    colors = rng.integers(0, 256, size=(n, 3))
+    tipos = rng.choice(["base", "corretivo", "contorno"], size=n, p=[0.6, 0.25, 0.15])
+    return [
+        {"id": i, "hex_code": "#%02x%02x%02x" % tuple(c), "tipo": t}
+        for i, (c, t) in enumerate(zip(colors.tolist(), tipos.tolist()))
+    ]
+
+
+def run(sizes, repeats):
+    rng = np.random.default_rng(1)
+    results = []
+    for n in sizes:
+        rows = synthetic_rows(n)
+        start = time.perf_counter()
+        snapshot = CatalogSnapshot(rows)
+        build_ms = (time.perf_counter() - start) * 1000
+        del rows
+        snapshot.top_k((0, 0, 0), ("base",))  # monta o grupo antes de medir
+        entry = {"linhas": n, "montagem_snapshot_ms": round(build_ms, 1), "metricas": {}}
+        for metric in MATCH_METRICS:
+            skins = rng.integers(0, 256, size=(repeats + 3, 3)).tolist()
+            it = iter(skins)
+            entry["metricas"][metric] = measure(
+                lambda: snapshot.top_k(tuple(next(it)), ("base",), 5, metric), repeats=repeats)
+        results.append(entry)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeticoes", type=int, default=30)
+    parser.add_argument("--saida")
+    args = parser.parse_args()
+    write_results("matching", run(args.tamanhos, args.repeticoes), args.saida)
+
+
+if __name__ == "__main__":
+    main()
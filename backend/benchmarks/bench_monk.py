@@ -0,0 +1,111 @@
+"""Microbenchmark da classificacao Monk + subtom: loop original vs indice pre-calculado.
+
+Tambem confere que as respostas sao identicas numa amostra aleatoria de cores.
+
+Uso: python -m benchmarks.bench_monk [--amostra 100000] [--saida res.json]
+"""
+import argparse
+import colorsys
+import time
+
+import numpy as np
+
+from benchmarks.common import measure, write_results
+from main import MONK_SKIN_TONES, classify_monk_tone, determine_undertone, monk_index
+
+
+# ---------- implementacao original (referencia) ----------
+def _legacy_distance(rgb1, rgb2):
+    return np.sqrt(sum((a - b) ** 2 for a, b in zip(rgb1, rgb2)))
+
+
+def legacy_classify_monk_tone(r, g, b):
+    min_distance = float('inf')
+    closest_tone = MONK_SKIN_TONES[4]
+    for tone in MONK_SKIN_TONES:
+        distance = _legacy_distance((r, g, b), tone["rgb"])
+        if distance < min_distance:
+            min_distance = distance
+            closest_tone = tone
+    confidence = max(0, 100 - (min_distance / 441.67 * 100))
+    return {
+        "tom": closest_tone["tom"], "codigo": closest_tone["codigo"], "nome": closest_tone["nome"],
+        "hex_referencia": closest_tone["hex"], "fitzpatrick": closest_tone["fitzpatrick"],
+        "descricao": closest_tone["descricao"], "undertones_comuns": closest_tone["undertones"],
+        "dicas": closest_tone["dicas"], "confianca": round(confidence, 1)
+    }
+
+
+def legacy_undertone(r, g, b):
+    _, _, s = colorsys.rgb_to_hls(r / 255.0, g / 255.0, b / 255.0)
+    s = int(s * 100)
+    if r > b and (r - b) > 15:
+        undertone = "quente"
+    elif b > r and (b - r) > 15:
+        undertone = "frio"
+    else:
+        undertone = "neutro"
+    if g > (r + b) / 2 * 0.9 and g < (r + b) / 2 * 1.1 and s < 50:
+        if undertone in ["quente", "neutro"]:
+            undertone = "oliva"
+    return undertone
+
+
+def verify(sample):
+    rng = np.random.default_rng(0)
+    colors = rng.integers(0, 256, size=(sample, 3)).tolist()
+    mismatches = 0
+    for r, g, b in colors:
+        if classify_monk_tone(r, g, b) != legacy_classify_monk_tone(r, g, b) or \
+                determine_undertone(r, g, b)["tipo"] != legacy_undertone(r, g, b):
+            mismatches += 1
+    return mismatches
+
+
+def run(sample, repeats):
+    start = time.perf_counter()
+    monk_index.build()
+    build_ms = (time.perf_counter() - start) * 1000
+    rng = np.random.default_rng(1)
+    colors = rng.integers(0, 256, size=(1000, 3))
+    color_list = colors.tolist()
+
+    def legacy():
+        for r, g, b in color_list:
+            legacy_classify_monk_tone(r, g, b)
+            legacy_undertone(r, g, b)
+
+    def indexed():
+        for r, g, b in color_list:
+            classify_monk_tone(r, g, b)
+            determine_undertone(r, g, b)
+
+    legacy_stats = measure(legacy, repeats=repeats)
+    indexed_stats = measure(indexed, repeats=repeats)
+    batch_stats = measure(lambda: monk_index.classify_batch(colors), repeats=repeats)
+    per_call = lambda st: round(st["p50_ms"] * 1000 / len(color_list), 3)
+    return {
+        "montagem_indice_ms": round(build_ms, 1),
+        "indice": monk_index.stats(),
+        "us_por_cor": {
+            "original": per_call(legacy_stats),
+            "indice": per_call(indexed_stats),
+            "lote": per_call(batch_stats),
+        },
+        "speedup_por_chamada": round(legacy_stats["p50_ms"] / indexed_stats["p50_ms"], 2),
+        "divergencias": verify(sample),
+        "amostra_verificada": sample,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--amostra", type=int, default=100_000)
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--saida")
+    args = parser.parse_args()
+    write_results("monk", run(args.amostra, args.repeticoes), args.saida)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Microbenchmarks de cada funcao do pipeline de analise sobre o corpus sintetico.
+
+Por resolucao: decode (cheio e reduzido), deteccao do rosto, extracao da
+cor, amostragem (uma bochecha e varias regioes, sobre o rosto ja detectado)
+e o pipeline completo de visao, com a taxa de rostos encontrados. Depois,
+independentes da imagem: classificacao Monk, subtom e o ranking de produtos
+de /analyze-complete (todos os grupos de recomendacao) num catalogo sintetico.
+
+Uso: python -m benchmarks.bench_pipeline [--lados 320 640 1280 2560] [--produtos 2000] [--saida res.json]
+"""
+import argparse
+import itertools
+
+import numpy as np
+
+from benchmarks.bench_matching import synthetic_rows
+from benchmarks.common import measure, write_results
+from benchmarks.corpus import build_corpus
+from catalog import MATCH_METRICS, CatalogSnapshot
+from main import DECODE_MIN_SIDE, DETECT_MAX_SIDE, RECOMMENDATION_GROUPS, classify_monk_tone, determine_undertone
+from skin_sampling import sample_regions
+from vision import analyze_image_bytes, decode_image, detect_face, extract_skin_color_opencv, sample_cheek
+
+
+def catalog_rows(n, seed=0):
+    """Catalogo sintetico com os tipos de todos os grupos de recomendacao."""
+    tipos = [t for group in RECOMMENDATION_GROUPS.values() for t in group]
+    rng = np.random.default_rng(seed)
+    rows = synthetic_rows(n, seed)
+    for row, tipo in zip(rows, rng.choice(tipos, size=n).tolist()):
+        row["tipo"] = tipo
+    return rows
+
+
+def bench_images(corpus, sides, repeats):
+    results = []
+    for side in sides:
+        images = [item["bytes"] for item in corpus if item["lado"] == side]
+        decoded = [decode_image(b, DECODE_MIN_SIDE) for b in images]
+        faces = [(img, face) for img in decoded if (face := detect_face(img, DETECT_MAX_SIDE)) is not None]
+        it_full, it_reduced, it_all = (itertools.cycle(images) for _ in range(3))
+        it_detect, it_extract = (itertools.cycle(decoded) for _ in range(2))
+        it_cheek, it_regions = (itertools.cycle(faces) for _ in range(2))
+        results.append({
+            "lado": side,
+            "imagens": len(images),
+            "bytes_medio": int(sum(map(len, images)) / len(images)),
+            "rostos_detectados": len(faces),
+            "decode_cheio": measure(lambda: decode_image(next(it_full)), repeats=repeats),
+            "decode_reduzido": measure(lambda: decode_image(next(it_reduced), DECODE_MIN_SIDE), repeats=repeats),
+            "deteccao": measure(lambda: detect_face(next(it_detect), DETECT_MAX_SIDE), repeats=repeats),
+            "extracao_cor": measure(lambda: extract_skin_color_opencv(next(it_extract), None, DETECT_MAX_SIDE), repeats=repeats),
+            "amostragem_bochecha": measure(lambda: sample_cheek(*next(it_cheek)), repeats=repeats) if faces else None,
+            "amostragem_regioes": measure(lambda: sample_regions(*next(it_regions)), repeats=repeats) if faces else None,
+            "pipeline_visao": measure(lambda: analyze_image_bytes(next(it_all), DETECT_MAX_SIDE, DECODE_MIN_SIDE), repeats=repeats),
+        })
+    return results
+
+
+def bench_colors(n_products, repeats):
+    rng = np.random.default_rng(2)
+    skins = [tuple(c) for c in rng.normal([190, 150, 125], 35, size=(repeats + 3, 3)).clip(0, 255).astype(int).tolist()]
+    snapshot = CatalogSnapshot(catalog_rows(n_products))
+    it_monk, it_undertone = itertools.cycle(skins), itertools.cycle(skins)
+    results = {
+        "classify_monk_tone": measure(lambda: classify_monk_tone(*next(it_monk)), repeats=repeats),
+        "determine_undertone": measure(lambda: determine_undertone(*next(it_undertone)), repeats=repeats),
+        "ranking": {"produtos": n_products},
+    }
+    for metric in MATCH_METRICS:
+        it = itertools.cycle(skins)
+
+        def rank_all_groups():
+            rgb = next(it)
+            for tipos in RECOMMENDATION_GROUPS.values():
+                snapshot.top_k(rgb, tipos, 5, metric)
+
+        results["ranking"][metric] = measure(rank_all_groups, repeats=repeats)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lados", type=int, nargs="+", default=[320, 640, 1280, 2560])
+    parser.add_argument("--fundos", type=int, default=2)
+    parser.add_argument("--produtos", type=int, default=2000)
+    parser.add_argument("--repeticoes", type=int, default=30)
+    parser.add_argument("--saida")
+    args = parser.parse_args()
+    corpus = build_corpus(args.lados, backgrounds=args.fundos)
+    write_results("pipeline", {
+        "detect_max_side": DETECT_MAX_SIDE,
+        "decode_min_side": DECODE_MIN_SIDE,
+        "imagens": bench_images(corpus, args.lados, args.repeticoes),
+        "cores": bench_colors(args.produtos, args.repeticoes * 10),
+    }, args.saida)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Indice k-d tree vs varredura linear no top_k, em catalogos crescentes.
+
+Mede montagem do indice, latencia por consulta (por metrica indexada),
+memoria (indice + matrizes do grupo e pico por consulta) e confere que os
+dois caminhos retornam exatamente o mesmo ranking.
+
+Uso: python -m benchmarks.bench_shade_index [--tamanhos 10000 100000 1000000] [--saida res.json]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.bench_matching import synthetic_rows
+from benchmarks.common import measure, write_results
+from catalog import CatalogSnapshot
+from shade_index import INDEX_SPACES, KDTREE_AVAILABLE
+
+
+def skin_queries(n, seed=1):
+    """Cores de pele plausiveis (o catalogo e uniforme; as consultas nao)."""
+    rng = np.random.default_rng(seed)
+    return rng.normal([190, 150, 125], [35, 35, 35], size=(n, 3)).clip(0, 255).astype(int).tolist()
+
+
+def peak_query_bytes(snapshot, rgb, metric):
+    tracemalloc.start()
+    snapshot.top_k(rgb, ("base",), 5, metric)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def run(sizes, repeats, check):
+    results = []
+    for n in sizes:
+        rows = synthetic_rows(n)
+        linear = CatalogSnapshot(rows, use_index=False)
+        indexed = CatalogSnapshot(rows)
+        del rows
+        group = indexed._group(("base",))
+        entry = {
+            "linhas": n,
+            "linhas_grupo": len(group[0]),
+            "bytes_matrizes_grupo": int(group[1].nbytes + group[2].nbytes),
+            "metricas": {},
+        }
+        for metric, space in INDEX_SPACES.items():
+            start = time.perf_counter()
+            index = indexed._index(group, space)
+            build_ms = (time.perf_counter() - start) * 1000
+            linear.top_k((0, 0, 0), ("base",), 5, metric)
+            queries = skin_queries(repeats + 3)
+            divergent = sum(
+                [(p["id"], s) for p, s, _ in linear.top_k(tuple(q), ("base",), 5, metric)]
+                != [(p["id"], s) for p, s, _ in indexed.top_k(tuple(q), ("base",), 5, metric)]
+                for q in queries[:check]
+            )
+            it_linear, it_indexed = iter(queries), iter(queries)
+            entry["metricas"][metric] = {
+                "montagem_indice_ms": round(build_ms, 1),
+                "bytes_indice": index.nbytes() if index else None,
+                "pico_consulta_bytes": {
+                    "linear": peak_query_bytes(linear, tuple(queries[0]), metric),
+                    "indice": peak_query_bytes(indexed, tuple(queries[0]), metric),
+                },
+                "linear": measure(lambda: linear.top_k(tuple(next(it_linear)), ("base",), 5, metric), repeats=repeats),
+                "indice": measure(lambda: indexed.top_k(tuple(next(it_indexed)), ("base",), 5, metric), repeats=repeats),
+                "divergencias": divergent,
+                "amostra_verificada": min(check, len(queries)),
+            }
+        results.append(entry)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeticoes", type=int, default=50)
+    parser.add_argument("--verificar", type=int, default=30, help="consultas comparadas entre os dois caminhos")
+    parser.add_argument("--saida")
+    args = parser.parse_args()
+    if not KDTREE_AVAILABLE:
+        parser.error("scipy nao instalado: o indice k-d tree esta indisponivel")
+    write_results("shade_index", run(args.tamanhos, args.repeticoes, args.verificar), args.saida)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Utilitarios compartilhados pelos benchmarks: medicao e gravacao de resultados."""
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+
+def measure(fn, repeats=50, warmup=3):
+    """Executa `fn` repetidamente e retorna estatisticas de latencia em ms."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    stats = summarize(samples)
+    # Vazao de uma execucao serial (operacoes por segundo)
+    stats["ops_por_s"] = round(1000 / stats["media_ms"], 2) if stats["media_ms"] else None
+    return stats
+
+
+def summarize(samples_ms):
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "n": int(arr.size),
+        "media_ms": round(float(arr.mean()), 4),
+        "p50_ms": round(float(np.percentile(arr, 50)), 4),
+        "p95_ms": round(float(np.percentile(arr, 95)), 4),
+        "p99_ms": round(float(np.percentile(arr, 99)), 4),
+        "max_ms": round(float(arr.max()), 4),
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(name, results, output=None):
+    """Imprime e (opcionalmente) grava os resultados em JSON com metadados do ambiente."""
+    payload = {
+        "benchmark": name,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "maquina": platform.machine(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "resultados": results,
+    }
+    text = json.dumps(payload, indent=2, ensure_ascii=False)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    return payload
@@ -0,0 +1,131 @@
+"""Corpus sintetico de rostos para os benchmarks (sem fotos reais no repositorio).
+
+Cada imagem e um rosto desenhado (cabelo, sobrancelhas, olhos, nariz e boca
+sobre uma elipse sombreada) e colorido com um dos tons Monk. O desenho e
+um mapa de luminancia multiplicado pela cor da pele, entao o contraste que o
+classificador Haar enxerga e o mesmo em todos os tons; o fundo fica do lado
+oposto da luminancia da pele. Tudo e deterministico (semente fixa), entao o
+mesmo corpus sai em qualquer maquina.
+
+Uso: python -m benchmarks.corpus --saida corpus/ [--lados 320 640 1280 2560]
+"""
+import argparse
+import json
+import os
+
+import cv2
+import numpy as np
+
+from main import MONK_SKIN_TONES
+
+DEFAULT_SIDES = (320, 640, 1280, 2560)
+# Matizes de fundo (a luminancia e ajustada conforme a pele)
+BACKGROUND_HUES = ((90, 110, 140), (120, 140, 100), (140, 120, 130), (128, 128, 128))
+
+_CANVAS = 512
+
+
+def _luminance(rgb):
+    return 0.299 * rgb[0] + 0.587 * rgb[1] + 0.114 * rgb[2]
+
+
+def background_for(skin_rgb, hue_rgb):
+    """Fundo com a matiz pedida e luminancia bem separada da pele."""
+    lum = _luminance(skin_rgb)
+    target = lum - 110 if lum > 128 else lum + 60
+    scale = target / _luminance(hue_rgb)
+    return tuple(int(c) for c in np.clip(np.array(hue_rgb, dtype=np.float64) * scale, 0, 255))
+
+
+def _face_map():
+    """Mapa de luminancia do rosto (1.0 = pele sem sombra) e mascara do que nao e fundo."""
+    n = _CANVAS
+    cx, cy, fw, fh = n // 2, n // 2 + 10, 150, 195
+    lum = np.zeros((n, n), np.float32)
+    mask = np.zeros((n, n), np.uint8)
+    cv2.rectangle(mask, (cx - 55, cy + 150), (cx + 55, n), 255, -1)
+    cv2.ellipse(mask, (cx, cy), (fw, fh), 0, 0, 360, 255, -1)
+    lum[mask > 0] = 1.0
+    # Cabelo
+    cv2.ellipse(lum, (cx, cy - 70), (fw + 10, fh - 60), 0, 180, 360, 0.15, -1)
+    cv2.ellipse(mask, (cx, cy - 70), (fw + 10, fh - 60), 0, 180, 360, 255, -1)
+    for side in (-1, 1):
+        ex = cx + side * 58
+        cv2.ellipse(lum, (ex, cy - 55), (38, 10), 0, 180, 360, 0.2, 6)
+        cv2.ellipse(lum, (ex, cy - 22), (30, 14), 0, 0, 360, 1.05, -1)
+        cv2.circle(lum, (ex, cy - 22), 11, 0.15, -1)
+        cv2.ellipse(lum, (ex, cy - 22), (32, 16), 0, 0, 360, 0.55, 3)
+    cv2.line(lum, (cx - 6, cy - 10), (cx - 14, cy + 45), 0.75, 4)
+    cv2.ellipse(lum, (cx, cy + 50), (22, 9), 0, 0, 180, 0.5, 4)
+    cv2.ellipse(lum, (cx, cy + 100), (48, 16), 0, 0, 360, 0.55, -1)
+    cv2.line(lum, (cx - 48, cy + 100), (cx + 48, cy + 100), 0.3, 3)
+    # Sombreamento lateral
+    xx = np.arange(n)[None, :]
+    lum *= np.clip(1 - 0.25 * ((xx - cx) / fw) ** 2, 0.6, 1)
+    return lum, mask > 0
+
+
+def synthetic_face(side, skin_rgb, hue_rgb=BACKGROUND_HUES[0], seed=0):
+    """Imagem BGR quadrada de lado `side` com um rosto no tom `skin_rgb`."""
+    rng = np.random.default_rng(seed)
+    lum, inside = _face_map()
+    img = np.empty((_CANVAS, _CANVAS, 3), np.float32)
+    img[:] = background_for(skin_rgb, hue_rgb)[::-1]
+    img[inside] = lum[inside, None] * np.array(skin_rgb[::-1], np.float32)
+    img += rng.normal(0, 2, img.shape).astype(np.float32)
+    img = cv2.GaussianBlur(img.clip(0, 255), (5, 5), 0).astype(np.uint8)
+    interpolation = cv2.INTER_CUBIC if side > _CANVAS else cv2.INTER_AREA
+    return cv2.resize(img, (side, side), interpolation=interpolation)
+
+
+def synthetic_scene(side, seed=0):
+    """Imagem sem rosto (manchas e ruido): exercita a segunda passada da deteccao."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(8, 8, 3), dtype=np.uint8)
+    img = cv2.resize(small, (side, side), interpolation=cv2.INTER_CUBIC)
+    return (img.astype(np.int16) + rng.normal(0, 6, img.shape).astype(np.int16)).clip(0, 255).astype(np.uint8)
+
+
+def build_corpus(sides=DEFAULT_SIDES, tones=None, backgrounds=2, faceless=0, quality=90):
+    """Lista de imagens JPEG: {"nome", "lado", "tom", "rgb_pele", "bytes"}.
+
+    Um rosto por tom Monk, lado e fundo (ate `backgrounds` matizes), mais
+    `faceless` imagens sem rosto por lado. Sem rosto, `tom` e None.
+    """
+    tones = tones or [t["tom"] for t in MONK_SKIN_TONES]
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    corpus = []
+    for side in sides:
+        for tone in tones:
+            rgb = MONK_SKIN_TONES[tone - 1]["rgb"]
+            for b, hue in enumerate(BACKGROUND_HUES[:backgrounds]):
+                img = synthetic_face(side, rgb, hue, seed=side * 100 + tone * 10 + b)
+                corpus.append({"nome": f"mst{tone:02d}_{side}_f{b}.jpg", "lado": side, "tom": tone, "rgb_pele": rgb,
+                               "bytes": cv2.imencode(".jpg", img, params)[1].tobytes()})
+        for i in range(faceless):
+            img = synthetic_scene(side, seed=side + i)
+            corpus.append({"nome": f"sem_rosto_{side}_{i}.jpg", "lado": side, "tom": None, "rgb_pele": None,
+                           "bytes": cv2.imencode(".jpg", img, params)[1].tobytes()})
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--saida", required=True, help="diretorio das imagens e do manifest.json")
+    parser.add_argument("--lados", type=int, nargs="+", default=list(DEFAULT_SIDES))
+    parser.add_argument("--fundos", type=int, default=2, help=f"matizes de fundo por rosto (1-{len(BACKGROUND_HUES)})")
+    parser.add_argument("--sem-rosto", type=int, default=0, help="imagens sem rosto por lado")
+    args = parser.parse_args()
+    os.makedirs(args.saida, exist_ok=True)
+    manifest = []
+    for item in build_corpus(args.lados, backgrounds=args.fundos, faceless=args.sem_rosto):
+        with open(os.path.join(args.saida, item["nome"]), "wb") as f:
+            f.write(item.pop("bytes"))
+        manifest.append(item)
+    with open(os.path.join(args.saida, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"{len(manifest)} imagens em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
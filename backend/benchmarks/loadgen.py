@@ -0,0 +1,196 @@
+"""Teste de carga ponta a ponta de /analyze e /analyze-complete.
+
+Sem --url, sobe os stand-ins de Supabase/Gemini (benchmarks.standins) numa
+thread e a API num processo `uvicorn main:app` apontando para eles; as
+variaveis de ambiente atuais (VISION_EXECUTOR, DETECT_MAX_SIDE...) passam
+para a API, entao da para comparar configuracoes e commits. Com --url, usa
+uma API ja rodando.
+
+Cada endpoint roda numa fase separada. Em carga fechada (padrao) ha
+`--concorrencia` clientes enviando em sequencia; com `--taxa` a carga e
+aberta (requisicoes/s agendadas) e a latencia conta desde o horario
+agendado, para que filas no servidor nao escondam o atraso. Por padrao
+cada envio ganha bytes extras depois do fim do JPEG, para que o cache de
+resultados nao responda (--com-cache desliga isso).
+
+Uso: python -m benchmarks.loadgen [--endpoints analyze analyze-complete] [--duracao 30] [--concorrencia 8] [--saida res.json]
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+from benchmarks.common import summarize, write_results
+from benchmarks.corpus import build_corpus
+from benchmarks.standins import StandinServer, add_latency_args, app_from_args
+
+ENDPOINTS = {"analyze": "/analyze", "analyze-complete": "/analyze-complete"}
+
+
+class Phase:
+    """Resultados de uma fase: latencias das respostas 2xx, status e falhas de conexao."""
+
+    def __init__(self):
+        self.latencies_ms = []
+        self.statuses = {}
+        self.failures = 0
+        self.started = self.finished = None
+
+    def add(self, status, elapsed):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if 200 <= status < 300:
+            self.latencies_ms.append(elapsed * 1000)
+
+    def result(self):
+        duration = self.finished - self.started
+        ok = len(self.latencies_ms)
+        return {
+            "duracao_s": round(duration, 2),
+            "requisicoes": sum(self.statuses.values()) + self.failures,
+            "sucesso": ok,
+            "status": {str(k): v for k, v in sorted(self.statuses.items())},
+            "falhas_conexao": self.failures,
+            "vazao_rps": round(ok / duration, 2) if duration else None,
+            "latencia": summarize(self.latencies_ms) if ok else None,
+        }
+
+
+async def send(client, path, image, unique, phase, scheduled=None):
+    body = image["bytes"] + uuid.uuid4().bytes if unique else image["bytes"]
+    start = time.perf_counter() if scheduled is None else scheduled
+    try:
+        resp = await client.post(path, files={"image": (image["nome"], body, "image/jpeg")})
+    except httpx.HTTPError:
+        phase.failures += 1
+        return
+    phase.add(resp.status_code, time.perf_counter() - start)
+
+
+async def closed_loop(client, path, images, concurrency, duration, unique):
+    phase = Phase()
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            await send(client, path, next(images), unique, phase)
+
+    phase.started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    phase.finished = time.perf_counter()
+    return phase
+
+
+async def open_loop(client, path, images, rate, max_in_flight, duration, unique):
+    phase = Phase()
+    slots = asyncio.Semaphore(max_in_flight)
+
+    async def one(scheduled):
+        async with slots:
+            await send(client, path, next(images), unique, phase, scheduled)
+
+    tasks = []
+    phase.started = time.perf_counter()
+    for i in itertools.count():
+        scheduled = phase.started + i / rate
+        if scheduled - phase.started >= duration:
+            break
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        tasks.append(asyncio.create_task(one(scheduled)))
+    await asyncio.gather(*tasks)
+    phase.finished = time.perf_counter()
+    return phase
+
+
+def start_api(port, standins_url, env_overrides):
+    env = {**os.environ, "SUPABASE_URL": standins_url, "SUPABASE_KEY": "bench", "GOOGLE_API_KEY": "bench",
+           "GEMINI_BASE_URL": standins_url, **env_overrides}
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+                             "--log-level", "warning"], cwd=backend_dir, env=env)
+
+
+async def wait_ready(client, process=None, timeout=120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f"API encerrou durante o startup (codigo {process.returncode})")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.25)
+    raise SystemExit("API nao respondeu /health a tempo")
+
+
+async def run(args):
+    corpus = build_corpus(args.lados, backgrounds=args.fundos)
+    standins = api = None
+    url = args.url
+    if not url:
+        standins = StandinServer(app_from_args(args), args.porta_standins).start()
+        api = start_api(args.porta_api, standins.url, {})
+        url = f"http://127.0.0.1:{args.porta_api}"
+    limits = httpx.Limits(max_connections=max(args.concorrencia, 1), max_keepalive_connections=max(args.concorrencia, 1))
+    try:
+        async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+            await wait_ready(client, api)
+            phases = {}
+            for name in args.endpoints:
+                images = itertools.cycle(corpus)
+                # Aquecimento: cascades, indice Monk e snapshot do catalogo
+                for _ in range(args.aquecimento):
+                    await send(client, ENDPOINTS[name], next(images), not args.com_cache, Phase())
+                if args.taxa:
+                    phase = await open_loop(client, ENDPOINTS[name], images, args.taxa, args.concorrencia, args.duracao, not args.com_cache)
+                else:
+                    phase = await closed_loop(client, ENDPOINTS[name], images, args.concorrencia, args.duracao, not args.com_cache)
+                phases[name] = phase.result()
+            server_stats = (await client.get("/stats")).json()
+    finally:
+        if api is not None:
+            api.terminate()
+            api.wait(timeout=30)
+        if standins is not None:
+            standins.stop()
+    return {
+        "url": args.url or "local (stand-ins)",
+        "carga": {"modo": "aberta" if args.taxa else "fechada", "concorrencia": args.concorrencia, "taxa_rps": args.taxa,
+                  "duracao_s": args.duracao, "lados": args.lados, "imagens": len(corpus), "cache": args.com_cache},
+        "upstreams_simulados": None if args.url else {
+            "supabase_ms": [args.latencia_supabase_ms, args.jitter_supabase_ms, args.erros_supabase],
+            "gemini_ms": [args.latencia_gemini_ms, args.jitter_gemini_ms, args.erros_gemini],
+        },
+        "endpoints": phases,
+        "stats_servidor": server_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="API ja rodando (sem isso sobe API + stand-ins locais)")
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--duracao", type=float, default=30.0, help="segundos por endpoint")
+    parser.add_argument("--concorrencia", type=int, default=8, help="clientes (carga fechada) ou maximo em voo (aberta)")
+    parser.add_argument("--taxa", type=float, help="requisicoes/s em carga aberta")
+    parser.add_argument("--aquecimento", type=int, default=5)
+    parser.add_argument("--lados", type=int, nargs="+", default=[640, 1280])
+    parser.add_argument("--fundos", type=int, default=2)
+    parser.add_argument("--com-cache", action="store_true", help="reenvia os mesmos bytes (mede o cache de resultados)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--porta-api", type=int, default=8791)
+    parser.add_argument("--porta-standins", type=int, default=8790)
+    add_latency_args(parser)
+    parser.add_argument("--saida")
+    args = parser.parse_args()
+    write_results("carga", asyncio.run(run(args)), args.saida)
+
+
+if __name__ == "__main__":
+    main()
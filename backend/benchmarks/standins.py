@@ -0,0 +1,178 @@
+"""Servidores locais que substituem Supabase e Gemini nos testes de carga.
+
+O Supabase responde o subconjunto do PostgREST que a API usa (select,
+filtros eq/gt/gte/lte, order por id, limit e `Prefer: count=exact`) sobre
+um catalogo sintetico; o Gemini devolve uma imagem pequena fixa. Cada um
+tem latencia configuravel (base + jitter uniforme) e taxa de erro.
+
+Uso: python -m benchmarks.standins [--porta 8790] [--latencia-supabase-ms 20] [--latencia-gemini-ms 1500]
+"""
+import argparse
+import asyncio
+import base64
+import random
+import threading
+import time
+
+import cv2
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from benchmarks.bench_pipeline import catalog_rows
+
+
+class Latency:
+    """Atraso simulado: `base_ms` + uniforme(0, `jitter_ms`); falha com probabilidade `error_rate`."""
+
+    def __init__(self, base_ms=0.0, jitter_ms=0.0, error_rate=0.0):
+        self.base_ms = base_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    async def wait(self):
+        delay = self.base_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        return random.random() >= self.error_rate
+
+
+def _catalog(n):
+    """Catalogo sintetico com as colunas que a API le (ids em texto, ordenaveis)."""
+    rows = catalog_rows(n)
+    for row in rows:
+        i = row["id"]
+        row.update({"id": f"{i:08d}", "ativo": True, "marca": f"Marca {i % 7}", "linha": "Linha", "cor_nome": f"Cor {i}",
+                    "acabamento": ("matte", "glow", "natural")[i % 3], "preco": 20.0 + i % 80,
+                    "updated_at": "2024-01-01T00:00:00"})
+    return rows
+
+
+def _matches(row, column, expr):
+    op, _, value = expr.partition(".")
+    current = row.get(column)
+    if op == "eq":
+        return str(current).lower() == value.lower()
+    if current is None:
+        return False
+    if op in ("gt", "gte", "lte"):
+        other = value if isinstance(current, str) else float(value)
+        return {"gt": current > other, "gte": current >= other, "lte": current <= other}[op]
+    return True
+
+
+def create_app(products=2000, supabase=None, gemini=None):
+    supabase = supabase or Latency()
+    gemini = gemini or Latency()
+    rows = _catalog(products)
+    generated = base64.b64encode(cv2.imencode(".jpg", np.full((64, 64, 3), 200, np.uint8))[1].tobytes()).decode()
+    app = FastAPI(title="Stand-ins Supabase/Gemini")
+    app.state.calls = {"supabase": 0, "gemini": 0, "falhas": 0}
+
+    async def delayed(target, latency):
+        app.state.calls[target] += 1
+        if await latency.wait():
+            return None
+        app.state.calls["falhas"] += 1
+        return JSONResponse({"message": "erro simulado"}, status_code=503)
+
+    @app.get("/rest/v1/")
+    async def root():
+        return await delayed("supabase", supabase) or {}
+
+    @app.get("/rest/v1/produtos")
+    async def produtos(request: Request):
+        failure = await delayed("supabase", supabase)
+        if failure:
+            return failure
+        params = request.query_params
+        selected = [r for r in rows if all(_matches(r, k, v) for k, v in params.multi_items() if k not in ("select", "order", "limit"))]
+        order = params.get("order", "")
+        if order:
+            column, _, direction = order.partition(".")
+            selected.sort(key=lambda r: (r.get(column) is None, r.get(column) or ""), reverse=direction.startswith("desc"))
+        total = len(selected)
+        if "limit" in params:
+            selected = selected[:int(params["limit"])]
+        if params.get("select", "*") != "*":
+            columns = params["select"].split(",")
+            selected = [{c: r.get(c) for c in columns} for r in selected]
+        headers = {"content-range": f"0-{max(0, len(selected) - 1)}/{total}"} if "count=exact" in request.headers.get("prefer", "") else None
+        return JSONResponse(selected, headers=headers)
+
+    @app.post("/rest/v1/{table}")
+    async def insert(table: str, request: Request):
+        await request.body()
+        return await delayed("supabase", supabase) or JSONResponse([], status_code=201)
+
+    @app.post("/v1beta/models/{model}")
+    async def generate(model: str, request: Request):
+        await request.body()
+        failure = await delayed("gemini", gemini)
+        if failure:
+            return failure
+        return {"candidates": [{"content": {"parts": [{"inlineData": {"mimeType": "image/jpeg", "data": generated}}]}}]}
+
+    @app.get("/_calls")
+    async def calls():
+        return app.state.calls
+
+    return app
+
+
+class StandinServer:
+    """Roda os stand-ins numa thread (uvicorn) ate `stop()`."""
+
+    def __init__(self, app, port):
+        self.port = port
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, name="standins", daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout=10.0):
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError(f"Stand-ins nao subiram na porta {self.port}")
+            time.sleep(0.05)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def add_latency_args(parser):
+    parser.add_argument("--produtos", type=int, default=2000, help="linhas do catalogo sintetico")
+    parser.add_argument("--latencia-supabase-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-supabase-ms", type=float, default=10.0)
+    parser.add_argument("--erros-supabase", type=float, default=0.0, help="fracao de respostas 503")
+    parser.add_argument("--latencia-gemini-ms", type=float, default=1500.0)
+    parser.add_argument("--jitter-gemini-ms", type=float, default=500.0)
+    parser.add_argument("--erros-gemini", type=float, default=0.0)
+
+
+def app_from_args(args):
+    return create_app(
+        args.produtos,
+        Latency(args.latencia_supabase_ms, args.jitter_supabase_ms, args.erros_supabase),
+        Latency(args.latencia_gemini_ms, args.jitter_gemini_ms, args.erros_gemini),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--porta", type=int, default=8790)
+    add_latency_args(parser)
+    args = parser.parse_args()
+    print(f"Stand-ins em http://127.0.0.1:{args.porta} (SUPABASE_URL e GEMINI_BASE_URL)")
+    uvicorn.run(app_from_args(args), host="127.0.0.1", port=args.porta, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
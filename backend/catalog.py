@@ -0,0 +1,367 @@
+"""Cache em memoria do catalogo de produtos com indice de cores vetorizado."""
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from color_science import DELTA_E_METRICS, delta_e, srgb_to_lab
+from shade_index import INDEX_MIN_ROWS, INDEX_SPACES, KDTREE_AVAILABLE, ShadeIndex, fingerprint
+
+logger = logging.getLogger(__name__)
+
+MATCH_METRICS = ("rgb",) + DELTA_E_METRICS
+# Valores aceitos pelas colunas de produtos (CHECK do schema); so esses filtros ficam em cache
+FILTER_VALUES = {
+    "subtom": ("quente", "frio", "neutro", "oliva"),
+    "acabamento": ("matte", "glow", "natural", "acetinado"),
+}
+
+
+def _lab_column(p):
+    """Lab cadastrado no produto (lab_l/lab_a/lab_b) ou None se incompleto."""
+    try:
+        return tuple(float(p[k]) for k in ("lab_l", "lab_a", "lab_b"))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def parse_hex(hex_color):
+    """Converte '#rrggbb' em tupla RGB; retorna None se o valor for invalido."""
+    if not hex_color:
+        return None
+    hex_color = hex_color.lstrip("#")
+    if len(hex_color) != 6:
+        return None
+    try:
+        return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+    except ValueError:
+        return None
+
+
+class CatalogSnapshot:
+    """Versao imutavel do catalogo: linhas + matrizes RGB e Lab agrupadas por tipo.
+
+    O Lab de cada produto vem das colunas lab_l/lab_a/lab_b quando preenchidas
+    e, caso contrario, e convertido do hex uma unica vez na montagem.
+    Grupos grandes ganham um indice k-d tree (ver shade_index); indices de
+    grupos cujas cores nao mudaram sao reaproveitados do snapshot anterior.
+    """
+
+    def __init__(self, rows, marker=None, previous=None, use_index=True):
+        self.marker = marker
+        self.use_index = use_index
+        self.loaded_at = time.monotonic()
+        self.rows = []
+        colors = []
+        tipos = []
+        for p in rows:
+            rgb = parse_hex(p.get("hex_code"))
+            if rgb is None:
+                continue
+            self.rows.append(p)
+            colors.append(rgb)
+            tipos.append(p.get("tipo"))
+        self.rgb = np.array(colors, dtype=np.int64).reshape(-1, 3)
+        self.lab = srgb_to_lab(self.rgb)
+        for i, p in enumerate(self.rows):
+            lab = _lab_column(p)
+            if lab is not None:
+                self.lab[i] = lab
+        by_tipo = {}
+        for i, tipo in enumerate(tipos):
+            by_tipo.setdefault(tipo, []).append(i)
+        self._by_tipo = {t: np.array(idx, dtype=np.intp) for t, idx in by_tipo.items()}
+        self._groups = {}
+        self._indexes = {}
+        self.indexes_built = 0
+        self.indexes_reused = 0
+        self._previous_indexes = dict(previous._indexes) if previous is not None else {}
+        if previous is not None:
+            # Prepara os mesmos grupos/indices que estavam em uso
+            for (key, space) in previous._indexed_groups():
+                self._index(self._group(*key), space)
+        self._previous_indexes = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _group(self, tipos, filters=()):
+        """Indices (em ordem de catalogo) e matrizes RGB/Lab das linhas dos tipos pedidos.
+
+        `filters` sao pares (coluna, valores aceitos), ex: (("subtom", ("quente",)),).
+        Filtros fora de FILTER_VALUES sao calculados sem entrar no cache, que
+        assim fica limitado as combinacoes do schema.
+        """
+        key = (tuple(tipos), tuple(filters))
+        group = self._groups.get(key)
+        if group is None:
+            parts = [self._by_tipo[t] for t in key[0] if t in self._by_tipo]
+            idx = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.intp)
+            for column, accepted in key[1]:
+                idx = idx[[self.rows[i].get(column) in accepted for i in idx]].astype(np.intp)
+            group = (idx, self.rgb[idx], self.lab[idx], {})
+            if all(set(accepted) <= set(FILTER_VALUES.get(column, ())) for column, accepted in key[1]):
+                self._groups[key] = group
+        return group
+
+    def _indexed_groups(self):
+        # Copias: o snapshot novo le daqui numa thread enquanto consultas seguem no antigo
+        return [(key, space) for key, group in list(self._groups.items()) for space in list(group[3])]
+
+    def _index(self, group, space):
+        """k-d tree do grupo no espaco pedido (montado na primeira consulta) ou None."""
+        idx, rgb_matrix, lab_matrix, indexes = group
+        if not self.use_index or not KDTREE_AVAILABLE or len(idx) < INDEX_MIN_ROWS:
+            return None
+        index = indexes.get(space)
+        if index is None:
+            points = rgb_matrix if space == "rgb" else lab_matrix
+            fp = (space, fingerprint(points))
+            index = self._indexes.get(fp) or self._previous_indexes.get(fp)
+            if index is None:
+                index = ShadeIndex(points)
+                self.indexes_built += 1
+            elif fp not in self._indexes:
+                self.indexes_reused += 1
+            self._indexes[fp] = indexes[space] = index
+        return index
+
+    def index_stats(self):
+        return {
+            "disponivel": KDTREE_AVAILABLE and self.use_index,
+            "indices": len(self._indexes),
+            "montados": self.indexes_built,
+            "reaproveitados": self.indexes_reused,
+            "bytes": sum(index.nbytes() for index in self._indexes.values()),
+        }
+
+    def top_k(self, rgb, tipos, k=5, metric="rgb", filters=()):
+        """Retorna [(produto, match_score, distancia)] dos k produtos mais proximos.
+
+        Com metric="rgb" reproduz o ranking do loop original: score =
+        max(0, 100 - dist / 4.41) arredondado em 1 casa, ordem decrescente,
+        empates na ordem do catalogo. Com uma metrica Delta E (cie76, cie94,
+        ciede2000) o ranking segue o Delta E e score = max(0, 100 - delta_e).
+        `filters` restringe por outras colunas (ver _group).
+        """
+        return self.top_k_batch([rgb], tipos, k, metric, filters)[0]
+
+    def top_k_batch(self, rgbs, tipos, k=5, metric="rgb", filters=(), max_cells=2_000_000):
+        """top_k para varias cores de uma vez: uma matriz (cores x produtos) por bloco.
+
+        O resultado de cada cor e identico ao de top_k; `max_cells` limita o
+        tamanho das matrizes intermediarias. Em grupos indexados so os
+        candidatos devolvidos pela k-d tree sao pontuados.
+        """
+        if metric not in MATCH_METRICS:
+            raise ValueError(f"Metrica desconhecida: {metric}")
+        rgbs = np.asarray(rgbs, dtype=np.int64).reshape(-1, 3)
+        group = self._group(tipos, filters)
+        idx = group[0]
+        if len(idx) == 0:
+            return [[] for _ in range(len(rgbs))]
+        index = self._index(group, INDEX_SPACES[metric]) if metric in INDEX_SPACES else None
+        if index is not None and len(idx) > k:
+            return self._indexed_top_k(rgbs, group, index, k, metric)
+        results = []
+        step = max(1, max_cells // len(idx))
+        for start in range(0, len(rgbs), step):
+            results.extend(self._rank(rgbs[start:start + step], group, None, k, metric))
+        return results
+
+    def _rank(self, colors, group, positions, k, metric):
+        """Ranking exato das cores contra as linhas `positions` do grupo (None = todas)."""
+        idx, rgb_matrix, lab_matrix, _ = group
+        n = len(idx)
+        if positions is None:
+            positions = np.arange(n)
+        else:
+            rgb_matrix, lab_matrix = rgb_matrix[positions], lab_matrix[positions]
+        if metric == "rgb":
+            # |x - p|^2 = |x|^2 + |p|^2 - 2 x.p; inteiros pequenos, exato em float64
+            colors_f = colors.astype(np.float64)
+            products = rgb_matrix.astype(np.float64)
+            sq = (colors_f * colors_f).sum(axis=1)[:, None] + (products * products).sum(axis=1) - 2 * colors_f @ products.T
+            dist = np.sqrt(sq)
+            scores = np.round(np.maximum(0, 100 - dist / 4.41), 1)
+            # Chave composta (score desc, posicao asc) para desempate identico ao sort estavel
+            key = -np.rint(scores * 10).astype(np.int64) * n + positions
+        else:
+            # Lab cor a cor: converter o bloco num so matmul muda a ultima casa decimal
+            labs = np.stack([srgb_to_lab(color) for color in colors])
+            dist = delta_e(labs[:, None, :], lab_matrix[None, :, :], metric)
+            scores = np.round(np.maximum(0, 100 - dist), 1)
+            key = dist
+        m = len(positions)
+        results = []
+        for row in range(len(colors)):
+            row_key = key[row]
+            if m > k:
+                # Tudo ate o k-esimo valor, inclusive empates com ele, em ordem de posicao
+                best = np.flatnonzero(row_key <= np.partition(row_key, k - 1)[k - 1])
+            else:
+                best = np.arange(m)
+            # Sort estavel sobre indices crescentes: empates ficam na ordem do catalogo
+            best = best[np.argsort(row_key[best], kind="stable")[:k]]
+            results.append([(self.rows[idx[positions[i]]], float(scores[row, i]), float(dist[row, i])) for i in best.tolist()])
+        return results
+
+    def _indexed_top_k(self, rgbs, group, index, k, metric):
+        """Candidatos pela k-d tree + ranking exato so entre eles.
+
+        O raio da busca garante que os k melhores estao entre os candidatos:
+        - rgb: todos com score arredondado >= score do k-esimo vizinho;
+        - cie76: distancia euclidiana no proprio Lab;
+        - cie94: delta_e_76 <= S_C * delta_e_94, com S_C = 1 + 0.045 * C da pele.
+        """
+        n = len(group[0])
+        if metric == "rgb":
+            queries = rgbs.astype(np.float64)
+            kth = index.nearest(queries, k)[:, -1]
+            kth_score = np.round(np.maximum(0, 100 - kth / 4.41), 1)
+            radii = (100 - kth_score + 0.1) * 4.41
+            radii = np.where(kth_score > 0, radii, np.inf)
+        else:
+            queries = np.stack([srgb_to_lab(color) for color in rgbs])
+            if metric == "cie76":
+                radii = index.nearest(queries, k)[:, -1]
+            else:
+                # k vizinhos em cie76 dao um teto para o k-esimo melhor cie94
+                _, near = index.tree.query(queries, k=k)
+                near = np.asarray(near).reshape(len(rgbs), -1)
+                ceiling = delta_e(queries[:, None, :], group[2][near], metric).max(axis=1)
+                radii = ceiling * (1 + 0.045 * np.hypot(queries[:, 1], queries[:, 2]))
+            radii = radii * (1 + 1e-9) + 1e-9
+        results = []
+        for color, query, radius in zip(rgbs, queries, radii):
+            positions = None if not np.isfinite(radius) else index.within(query[None], [radius])[0]
+            if positions is not None and len(positions) > n // 2:
+                positions = None  # raio cobre quase tudo: varredura e mais barata
+            results.extend(self._rank(color[None], group, positions, k, metric))
+        return results
+
+
+class ProductCatalog:
+    """Mantem o catalogo de produtos ativos em memoria e o atualiza em segundo plano.
+
+    `loader` e uma corrotina que retorna as linhas de produtos ativos; `probe`,
+    opcional, retorna um marcador barato (ex: maior updated_at + contagem) usado
+    para detectar mudancas antes do fim do TTL.
+    """
+
+    def __init__(self, loader, probe=None, ttl=300.0, check_interval=30.0, use_index=True):
+        self._loader = loader
+        self.use_index = use_index
+        self._probe = probe
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._lock = asyncio.Lock()
+        self._background = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.last_error = None
+
+    def _age(self):
+        if self._snapshot is None:
+            return None
+        return time.monotonic() - self._snapshot.loaded_at
+
+    async def refresh(self):
+        """Recarrega o catalogo completo e troca o snapshot atomicamente.
+
+        Quem esperou o lock enquanto outro chamador recarregava recebe o
+        snapshot novo; um snapshot dentro do TTL e com o mesmo marcador
+        tambem e reaproveitado, entao chamadas concorrentes fazem uma carga so.
+        """
+        requested_at = time.monotonic()
+        async with self._lock:
+            snap = self._snapshot
+            if snap is not None and snap.loaded_at >= requested_at:
+                return snap
+            try:
+                marker = await self._probe() if self._probe else None
+                if snap is not None and self._age() < self.ttl and (self._probe is None or marker == snap.marker):
+                    return snap
+                rows = await self._loader()
+            except Exception as e:
+                self.refresh_errors += 1
+                self.last_error = str(e)
+                raise
+            # Montagem e indices k-d tree sao CPU: fora do event loop
+            self._snapshot = await asyncio.to_thread(CatalogSnapshot, rows, marker, previous=self._snapshot,
+                                                     use_index=self.use_index)
+            self.refreshes += 1
+            self.last_error = None
+            return self._snapshot
+
+    async def snapshot(self):
+        """Snapshot atual; so espera o Supabase se o cache estiver vazio.
+
+        Expirado, devolve o snapshot antigo na hora e recarrega em segundo
+        plano (uma recarga por vez).
+        """
+        snap = self._snapshot
+        if snap is not None and self._age() < self.ttl:
+            self.hits += 1
+            return snap
+        self.misses += 1
+        if snap is not None:
+            if self._background is None or self._background.done():
+                self._background = asyncio.create_task(self._refresh_in_background())
+            return snap
+        return await self.refresh()
+
+    async def _refresh_in_background(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            # O snapshot antigo continua servindo; o erro fica em stats()
+            logger.warning("Erro ao recarregar catalogo expirado: %s", e)
+
+    async def aclose(self):
+        """Cancela a recarga em segundo plano, se houver (shutdown)."""
+        if self._background is not None and not self._background.done():
+            self._background.cancel()
+            try:
+                await self._background
+            except asyncio.CancelledError:
+                pass
+
+    async def _changed(self):
+        if self._probe is None or self._snapshot is None:
+            return False
+        return await self._probe() != self._snapshot.marker
+
+    async def run_refresher(self):
+        """Loop de atualizacao em segundo plano (cancelar no shutdown)."""
+        while True:
+            try:
+                age = self._age()
+                if age is None or age >= self.ttl or await self._changed():
+                    await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Erro ao atualizar catalogo: %s", e)
+            await asyncio.sleep(self.check_interval)
+
+    def stats(self):
+        total = self.hits + self.misses
+        age = self._age()
+        return {
+            "produtos": len(self._snapshot) if self._snapshot else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "ultimo_erro": self.last_error,
+            "idade_segundos": round(age, 1) if age is not None else None,
+            "ttl_segundos": self.ttl,
+            "desatualizado": age is not None and age > self.ttl,
+            "indice_cores": self._snapshot.index_stats() if self._snapshot else None,
+        }
@@ -0,0 +1,125 @@
+"""Conversao sRGB -> CIELAB e formulas Delta E vetorizadas (NumPy).
+
+Todas as funcoes aceitam arrays com shape (..., 3) e fazem broadcasting, de
+modo que uma cor de pele (3,) pode ser comparada com o catalogo inteiro (N, 3)
+em uma unica chamada.
+"""
+import numpy as np
+
+# Branco de referencia D65 (observador 2 graus)
+D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+SRGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+
+_EPSILON = (6 / 29) ** 3
+_KAPPA = 3 * (6 / 29) ** 2
+
+DELTA_E_METRICS = ("cie76", "cie94", "ciede2000")
+
+
+def srgb_to_lab(rgb):
+    """Converte cores sRGB 0-255 com shape (..., 3) para CIELAB (D65)."""
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ SRGB_TO_XYZ.T / D65_WHITE
+    f = np.where(xyz > _EPSILON, np.cbrt(xyz), xyz / _KAPPA + 4 / 29)
+    return np.stack([
+        116 * f[..., 1] - 16,
+        500 * (f[..., 0] - f[..., 1]),
+        200 * (f[..., 1] - f[..., 2]),
+    ], axis=-1)
+
+
+def delta_e_76(lab1, lab2):
+    """Distancia euclidiana em Lab (CIE 1976)."""
+    diff = np.asarray(lab1, dtype=np.float64) - np.asarray(lab2, dtype=np.float64)
+    return np.sqrt((diff * diff).sum(axis=-1))
+
+
+def delta_e_94(lab1, lab2, k_l=1.0, k1=0.045, k2=0.015):
+    """CIE 1994 (constantes de artes graficas); `lab1` e a cor de referencia."""
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    d_l = lab1[..., 0] - lab2[..., 0]
+    c1 = np.hypot(lab1[..., 1], lab1[..., 2])
+    c2 = np.hypot(lab2[..., 1], lab2[..., 2])
+    d_c = c1 - c2
+    d_a = lab1[..., 1] - lab2[..., 1]
+    d_b = lab1[..., 2] - lab2[..., 2]
+    d_h2 = np.maximum(d_a * d_a + d_b * d_b - d_c * d_c, 0)
+    s_c = 1 + k1 * c1
+    s_h = 1 + k2 * c1
+    return np.sqrt((d_l / k_l) ** 2 + (d_c / s_c) ** 2 + d_h2 / (s_h * s_h))
+
+
+def delta_e_2000(lab1, lab2):
+    """CIEDE2000 (Sharma, Wu & Dalal 2005) com kL = kC = kH = 1."""
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    l1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    l2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+
+    c_bar = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    c_bar7 = c_bar ** 7
+    g = 0.5 * (1 - np.sqrt(c_bar7 / (c_bar7 + 25.0 ** 7)))
+    a1p = (1 + g) * a1
+    a2p = (1 + g) * a2
+    c1p = np.hypot(a1p, b1)
+    c2p = np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+
+    chroma_zero = (c1p * c2p) == 0
+    d_lp = l2 - l1
+    d_cp = c2p - c1p
+    d_hp = h2p - h1p
+    d_hp = np.where(d_hp > 180, d_hp - 360, np.where(d_hp < -180, d_hp + 360, d_hp))
+    d_hp = np.where(chroma_zero, 0, d_hp)
+    d_big_hp = 2 * np.sqrt(c1p * c2p) * np.sin(np.radians(d_hp / 2))
+
+    l_barp = (l1 + l2) / 2
+    c_barp = (c1p + c2p) / 2
+    h_sum = h1p + h2p
+    h_barp = np.where(
+        np.abs(h1p - h2p) <= 180, h_sum / 2,
+        np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2),
+    )
+    h_barp = np.where(chroma_zero, h_sum, h_barp)
+
+    t = (1 - 0.17 * np.cos(np.radians(h_barp - 30))
+         + 0.24 * np.cos(np.radians(2 * h_barp))
+         + 0.32 * np.cos(np.radians(3 * h_barp + 6))
+         - 0.20 * np.cos(np.radians(4 * h_barp - 63)))
+    d_theta = 30 * np.exp(-(((h_barp - 275) / 25) ** 2))
+    c_barp7 = c_barp ** 7
+    r_c = 2 * np.sqrt(c_barp7 / (c_barp7 + 25.0 ** 7))
+    l50 = (l_barp - 50) ** 2
+    s_l = 1 + 0.015 * l50 / np.sqrt(20 + l50)
+    s_c = 1 + 0.045 * c_barp
+    s_h = 1 + 0.015 * c_barp * t
+    r_t = -np.sin(np.radians(2 * d_theta)) * r_c
+
+    term_l = d_lp / s_l
+    term_c = d_cp / s_c
+    term_h = d_big_hp / s_h
+    return np.sqrt(term_l ** 2 + term_c ** 2 + term_h ** 2 + r_t * term_c * term_h)
+
+
+_DELTA_E_FUNCS = {
+    "cie76": delta_e_76,
+    "cie94": delta_e_94,
+    "ciede2000": delta_e_2000,
+}
+
+
+def delta_e(lab1, lab2, metric="ciede2000"):
+    """Delta E pela metrica escolhida (cie76, cie94 ou ciede2000)."""
+    try:
+        func = _DELTA_E_FUNCS[metric]
+    except KeyError:
+        raise ValueError(f"Metrica desconhecida: {metric}")
+    return func(lab1, lab2)
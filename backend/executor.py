@@ -0,0 +1,121 @@
+"""Executor limitado para o trabalho CPU-bound fora do event loop.
+
+Envolve um ThreadPoolExecutor ou ProcessPoolExecutor com um limite de
+tarefas pendentes (em execucao + na fila). Quando o limite e atingido,
+`run` falha imediatamente com `Overloaded` em vez de enfileirar sem fim,
+para que a API responda 503 rapido e os demais endpoints sigam livres.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from metrics import REGISTRY, record_stage
+
+EXECUTOR_KINDS = ("thread", "process")
+
+REJECTED = REGISTRY.counter("skin_vision_rejected_total", "Tarefas de visao recusadas com a fila cheia")
+
+
+class Overloaded(Exception):
+    """Fila do executor cheia."""
+
+
+class StageStats:
+    """Acumula contagem, tempo total e maximo por etapa (em segundos)."""
+
+    def __init__(self):
+        self._stages = {}
+
+    def record(self, timings):
+        for stage, seconds in timings.items():
+            count, total, worst = self._stages.get(stage, (0, 0.0, 0.0))
+            self._stages[stage] = (count + 1, total + seconds, max(worst, seconds))
+
+    def snapshot(self):
+        return {
+            stage: {
+                "n": count,
+                "media_ms": round(total / count * 1000, 2),
+                "max_ms": round(worst * 1000, 2),
+            }
+            for stage, (count, total, worst) in self._stages.items()
+        }
+
+
+def _timed_call(fn, args):
+    started = time.monotonic()
+    result = fn(*args)
+    return result, started
+
+
+class VisionExecutor:
+    def __init__(self, kind="thread", workers=None, max_pending=None, initializer=None, initargs=()):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Tipo de executor invalido: {kind}")
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self._initializer = initializer
+        self._initargs = initargs
+        self._pool = None
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.stages = StageStats()
+
+    def start(self):
+        if self._pool is not None:
+            return
+        pool_cls = ThreadPoolExecutor if self.kind == "thread" else ProcessPoolExecutor
+        kwargs = {"max_workers": self.workers, "initializer": self._initializer, "initargs": self._initargs}
+        if self.kind == "thread":
+            kwargs["thread_name_prefix"] = "vision"
+        self._pool = pool_cls(**kwargs)
+
+    async def warm_up(self, fn):
+        """Executa `fn` uma vez por worker para subir e aquecer todo o pool."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(loop.run_in_executor(self._pool, fn) for _ in range(self.workers)))
+
+    def shutdown(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, fn, *args):
+        """Executa `fn(*args)` no pool; levanta Overloaded se a fila estiver cheia."""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            REJECTED.inc()
+            raise Overloaded()
+        self.start()
+        self.pending += 1
+        submitted = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started = await loop.run_in_executor(self._pool, _timed_call, fn, args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        finished = time.monotonic()
+        self.completed += 1
+        self.stages.record({"fila": started - submitted, "total": finished - submitted})
+        record_stage("fila_visao", started - submitted)
+        return result
+
+    def stats(self):
+        return {
+            "tipo": self.kind,
+            "workers": self.workers,
+            "pendentes": self.pending,
+            "max_pendentes": self.max_pending,
+            "concluidas": self.completed,
+            "falhas": self.failed,
+            "rejeitadas": self.rejected,
+            "etapas": self.stages.snapshot(),
+        }
@@ -0,0 +1,120 @@
+"""Clientes HTTP compartilhados (um por upstream) com pool de conexoes e retry.
+
+Cada UpstreamClient mantem um unico httpx.AsyncClient durante a vida da
+aplicacao, reaproveitando conexoes TCP/TLS (keep-alive e, quando o pacote
+h2 esta instalado, HTTP/2). GETs sao repetidos com backoff exponencial e
+jitter em erros de transporte e respostas 502/503/504; POSTs nunca.
+"""
+import asyncio
+import random
+import time
+
+import httpx
+
+from metrics import REGISTRY
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+RETRY_STATUSES = {502, 503, 504}
+
+UPSTREAM_SECONDS = REGISTRY.histogram("skin_upstream_request_seconds", "Latencia das chamadas a cada upstream", ("upstream", "metodo"))
+UPSTREAM_RESPONSES = REGISTRY.counter("skin_upstream_responses_total", "Respostas recebidas de cada upstream por status", ("upstream", "status"))
+UPSTREAM_ERRORS = REGISTRY.counter("skin_upstream_errors_total", "Falhas de transporte e respostas 5xx por upstream", ("upstream", "tipo"))
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge("skin_upstream_in_flight", "Chamadas em andamento por upstream", ("upstream",))
+
+
+class UpstreamClient:
+    def __init__(self, name, base_url, headers=None, timeout=10.0, connect_timeout=5.0,
+                 max_connections=20, max_keepalive=10, keepalive_expiry=30.0,
+                 http2=True, retries=2, backoff=0.2):
+        self.name = name
+        self.base_url = base_url
+        self.headers = headers or {}
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.retries = retries
+        self.backoff = backoff
+        self._client = None
+        self.requests = 0
+        self.errors = 0
+        self.retried = 0
+        self.connections_opened = 0
+        self.total_seconds = 0.0
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url or "", headers=self.headers, timeout=self.timeout,
+                                             limits=self.limits, http2=self.http2)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _trace(self, event, info):
+        if event == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+
+    async def _send(self, method, url, **kwargs):
+        extensions = {**kwargs.pop("extensions", {}), "trace": self._trace}
+        start = time.perf_counter()
+        self.requests += 1
+        UPSTREAM_IN_FLIGHT.inc(upstream=self.name)
+        try:
+            resp = await self.client.request(method, url, extensions=extensions, **kwargs)
+        except httpx.HTTPError as e:
+            self.errors += 1
+            UPSTREAM_ERRORS.inc(upstream=self.name, tipo=type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.total_seconds += elapsed
+            UPSTREAM_IN_FLIGHT.dec(upstream=self.name)
+            UPSTREAM_SECONDS.observe(elapsed, upstream=self.name, metodo=method)
+        UPSTREAM_RESPONSES.inc(upstream=self.name, status=resp.status_code)
+        if resp.status_code >= 500:
+            UPSTREAM_ERRORS.inc(upstream=self.name, tipo=f"http_{resp.status_code}")
+        return resp
+
+    async def get(self, url, retries=None, **kwargs):
+        """GET idempotente com retry (backoff exponencial com jitter total)."""
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            last = attempt == retries
+            try:
+                resp = await self._send("GET", url, **kwargs)
+            except httpx.TransportError:
+                if last:
+                    raise
+            else:
+                if resp.status_code not in RETRY_STATUSES or last:
+                    return resp
+                self.errors += 1
+            self.retried += 1
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def post(self, url, **kwargs):
+        return await self._send("POST", url, **kwargs)
+
+    def stats(self):
+        reused = max(0, self.requests - self.connections_opened)
+        return {
+            "base_url": self.base_url,
+            "http2": self.http2,
+            "max_conexoes": self.limits.max_connections,
+            "max_keepalive": self.limits.max_keepalive_connections,
+            "requisicoes": self.requests,
+            "erros": self.errors,
+            "retries": self.retried,
+            "conexoes_abertas": self.connections_opened,
+            "taxa_reuso": round(reused / self.requests, 4) if self.requests else None,
+            "latencia_media_ms": round(self.total_seconds / self.requests * 1000, 2) if self.requests else None,
+        }
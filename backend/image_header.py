@@ -0,0 +1,75 @@
+"""Leitura do formato e das dimensoes de imagens direto do cabecalho, sem decodificar."""
+import struct
+
+# Marcadores SOF do JPEG que carregam as dimensoes (exclui DHT/JPG/DAC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_size(data):
+    i = 2
+    n = len(data)
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # bytes de preenchimento
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        if marker in (0xD9, 0xDA):  # fim da imagem / inicio dos dados
+            return None
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker in _JPEG_SOF:
+            if i + 9 > n:
+                return None
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def _png_size(data):
+    if len(data) < 24 or data[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", data[16:24])
+
+
+def _webp_size(data):
+    if len(data) < 30:
+        return None
+    chunk = data[12:16]
+    if chunk == b"VP8 ":
+        w, h = struct.unpack("<HH", data[26:30])
+        return w & 0x3FFF, h & 0x3FFF
+    if chunk == b"VP8L":
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    return None
+
+
+def detect_format(data):
+    """Formato pela assinatura dos primeiros bytes ("jpeg", "png", "webp") ou None."""
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def read_image_header(data):
+    """Retorna (formato, largura, altura) ou None se o formato nao for reconhecido.
+
+    Basta passar os primeiros KB do arquivo para PNG/WebP; no JPEG as
+    dimensoes podem vir depois de metadados EXIF grandes.
+    """
+    fmt = detect_format(data)
+    if fmt is None:
+        return None
+    size = {"jpeg": _jpeg_size, "png": _png_size, "webp": _webp_size}[fmt](data)
+    return (fmt,) + tuple(size) if size else None
@@ -0,0 +1,207 @@
+"""Jobs assincronos: armazenamento de estado e fila limitada de execucao.
+
+O POST responde na hora com o id do job e a parte rapida da analise; a
+geracao da imagem roda depois numa fila com limite de concorrencia. O
+estado fica num JobStore (em memoria por padrao); outro backend (Redis,
+Supabase...) so precisa implementar a mesma interface.
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import time
+import uuid
+
+from executor import Overloaded
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "pendente"
+JOB_RUNNING = "processando"
+JOB_DONE = "concluido"
+JOB_FAILED = "erro"
+FINAL_STATES = (JOB_DONE, JOB_FAILED)
+SHUTDOWN_ERROR = "Servidor reiniciando; envie a imagem novamente"
+
+
+class JobStore(ABC):
+    """Interface dos backends de jobs. Jobs sao dicts JSON-serializaveis."""
+
+    poll_interval = 1.0
+
+    @abstractmethod
+    async def create(self, job: dict) -> dict:
+        """Armazena o job novo e o retorna."""
+
+    @abstractmethod
+    async def get(self, job_id: str):
+        """Estado atual do job ou None (inexistente ou expirado)."""
+
+    @abstractmethod
+    async def update(self, job_id: str, **fields):
+        """Atualiza campos e `atualizado_em`; retorna o job ou None."""
+
+    @abstractmethod
+    async def wait(self, job_id: str, timeout: float, since=None):
+        """Aguarda ate o job mudar (ou `timeout`) e retorna o estado atual.
+
+        `since` e o `atualizado_em` ja visto pelo chamador: se o job mudou
+        desde entao, retorna na hora (a mudanca nao se perde entre a leitura
+        e a espera). Esta implementacao faz polling; backends sem notificacao
+        podem usa-la com `super().wait(...)`.
+        """
+        if since is not None:
+            job = await self.get(job_id)
+            if job is None or job["atualizado_em"] != since:
+                return job
+        await asyncio.sleep(min(timeout, self.poll_interval))
+        return await self.get(job_id)
+
+    def stats(self) -> dict:
+        return {}
+
+
+class InMemoryJobStore(JobStore):
+    """Jobs num dict do processo, com TTL e limite de entradas (os mais antigos saem primeiro)."""
+
+    def __init__(self, ttl=3600.0, max_jobs=1000):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._changed = {}
+
+    def _evict(self):
+        now = time.time()
+        for job_id in [j for j, job in self._jobs.items() if job["atualizado_em"] + self.ttl < now]:
+            self._remove(job_id)
+        while len(self._jobs) >= self.max_jobs:
+            self._remove(next(iter(self._jobs)))
+
+    def _remove(self, job_id):
+        self._jobs.pop(job_id, None)
+        event = self._changed.pop(job_id, None)
+        if event:
+            event.set()
+
+    async def create(self, job):
+        self._evict()
+        self._jobs[job["id"]] = job
+        self._changed[job["id"]] = asyncio.Event()
+        return job
+
+    async def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    async def update(self, job_id, **fields):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job.update(fields, atualizado_em=time.time())
+        # Acorda quem esta aguardando e arma um novo evento para a proxima mudanca
+        self._changed.pop(job_id).set()
+        self._changed[job_id] = asyncio.Event()
+        return job
+
+    async def wait(self, job_id, timeout, since=None):
+        job = self._jobs.get(job_id)
+        if job is None or (since is not None and job["atualizado_em"] != since):
+            return job
+        event = self._changed.get(job_id)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._jobs.get(job_id)
+
+    def stats(self):
+        by_status = {}
+        for job in self._jobs.values():
+            by_status[job["status"]] = by_status.get(job["status"], 0) + 1
+        return {"backend": "memoria", "jobs": len(self._jobs), "por_status": by_status}
+
+
+def new_job(result=None) -> dict:
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "status": JOB_PENDING,
+        "criado_em": now,
+        "atualizado_em": now,
+        "resultado": result,
+        "erro": None,
+    }
+
+
+class JobQueue:
+    """Fila limitada com N workers; `submit` falha com Overloaded quando cheia."""
+
+    def __init__(self, store: JobStore, concurrency=2, max_queued=50):
+        self.store = store
+        self.concurrency = concurrency
+        self._queue = asyncio.Queue(maxsize=max_queued)
+        self._workers = []
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def has_capacity(self):
+        return not self._queue.full()
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """Cancela os workers; jobs em execucao ou na fila terminam como `erro` (o cliente para de esperar)."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        while not self._queue.empty():
+            job_id, _ = self._queue.get_nowait()
+            self._queue.task_done()
+            await self._abort(job_id)
+
+    async def _abort(self, job_id):
+        self.failed += 1
+        try:
+            await self.store.update(job_id, status=JOB_FAILED, erro=SHUTDOWN_ERROR)
+        except Exception as e:
+            logger.warning("Nao foi possivel marcar o job %s como interrompido: %s", job_id, e)
+
+    def submit(self, job_id, work):
+        """Enfileira `work()` (corrotina que retorna os campos finais do job)."""
+        try:
+            self._queue.put_nowait((job_id, work))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise Overloaded()
+
+    async def _worker(self):
+        while True:
+            job_id, work = await self._queue.get()
+            try:
+                await self.store.update(job_id, status=JOB_RUNNING)
+                fields = await work()
+                await self.store.update(job_id, status=JOB_DONE, **fields)
+                self.processed += 1
+            except asyncio.CancelledError:
+                await self._abort(job_id)
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.exception("Erro no job %s: %s", job_id, e)
+                await self.store.update(job_id, status=JOB_FAILED, erro=str(e))
+            finally:
+                self._queue.task_done()
+
+    def stats(self):
+        return {
+            "concorrencia": self.concurrency,
+            "na_fila": self._queue.qsize(),
+            "max_fila": self._queue.maxsize,
+            "processados": self.processed,
+            "falhas": self.failed,
+            "rejeitados": self.rejected,
+            "armazenamento": self.store.stats(),
+        }
@@ -0,0 +1,182 @@
+"""Analise ao vivo da camera (WebSocket): rastreamento do rosto e tom suavizado.
+
+Cada frame custa no maximo uma deteccao numa imagem pequena; na maioria
+dos frames o rosto e apenas rastreado por template matching numa janela
+ao redor da posicao anterior. A bochecha e amostrada com passo fixo (no
+maximo `max_samples` pixels) e o tom exibido e a mediana robusta dos
+ultimos frames, com um indicador de estabilidade.
+
+`process_frame` e pura (estado entra e sai), entao roda tanto no pool de
+threads quanto no de processos do VisionExecutor.
+"""
+import math
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from uploads import UploadRejected, check_header
+from vision import decode_image, detect_face
+
+# Lado maior do template usado no rastreamento (o frame e reduzido na mesma escala)
+TEMPLATE_SIDE = 48
+# Correlacao minima (TM_CCOEFF_NORMED) para aceitar a posicao rastreada
+MIN_TRACK_SCORE = 0.6
+
+
+class TrackState:
+    """Estado do rastreamento de uma sessao (pequeno e serializavel)."""
+
+    def __init__(self):
+        self.box = None
+        self.template = None
+        self.scale = 1.0
+        self.frames_since_detect = 0
+
+
+def _reset_template(gray, state, box):
+    x, y, w, h = box
+    state.box = box
+    state.scale = min(1.0, TEMPLATE_SIDE / max(w, h))
+    patch = gray[y:y + h, x:x + w]
+    if state.scale < 1.0:
+        patch = cv2.resize(patch, (max(1, round(w * state.scale)), max(1, round(h * state.scale))), interpolation=cv2.INTER_AREA)
+    state.template = patch
+    state.frames_since_detect = 0
+
+
+def _track(gray, state):
+    """Procura o template numa janela 2x ao redor da caixa anterior; None se perdeu o rosto."""
+    x, y, w, h = state.box
+    height, width = gray.shape
+    x0, y0 = max(0, x - w // 2), max(0, y - h // 2)
+    x1, y1 = min(width, x + w + w // 2), min(height, y + h + h // 2)
+    region = gray[y0:y1, x0:x1]
+    if state.scale < 1.0:
+        region = cv2.resize(region, (max(1, round((x1 - x0) * state.scale)), max(1, round((y1 - y0) * state.scale))), interpolation=cv2.INTER_AREA)
+    th, tw = state.template.shape
+    if region.shape[0] < th or region.shape[1] < tw:
+        return None
+    _, score, _, (lx, ly) = cv2.minMaxLoc(cv2.matchTemplate(region, state.template, cv2.TM_CCOEFF_NORMED))
+    if score < MIN_TRACK_SCORE:
+        return None
+    nx = min(width - w, x0 + int(lx / state.scale))
+    ny = min(height - h, y0 + int(ly / state.scale))
+    return (max(0, nx), max(0, ny), w, h), float(score)
+
+
+def sample_cheeks(img, box, max_samples=2048):
+    """Cor media da pele na regiao das bochechas, com no maximo `max_samples` pixels.
+
+    Mesma regiao e mascara HSV do pipeline de foto; retorna (rgb, n_pixels) ou None.
+    """
+    x, y, w, h = box
+    cheek_region = img[y + int(h * 0.35):y + int(h * 0.65), x + int(w * 0.15):x + int(w * 0.85)]
+    if cheek_region.size == 0:
+        return None
+    step = max(1, math.ceil(math.sqrt(cheek_region.shape[0] * cheek_region.shape[1] / max_samples)))
+    cheek_region = cheek_region[::step, ::step]
+    hsv = cv2.cvtColor(cheek_region, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, np.array([0, 20, 70], dtype=np.uint8), np.array([50, 255, 255], dtype=np.uint8))
+    skin_pixels = cheek_region[mask > 0]
+    if len(skin_pixels) < 25:
+        return None
+    b, g, r = skin_pixels.mean(axis=0)
+    return (float(r), float(g), float(b)), len(skin_pixels)
+
+
+def process_frame(contents: bytes, state: TrackState, max_side=480, detect_max_side=320,
+                  redetect_every=30, max_samples=2048, max_pixels=4_000_000):
+    """Processa um frame: rastreia (ou detecta) o rosto e amostra a bochecha.
+
+    O formato e as dimensoes saem do cabecalho antes do decode (frames com
+    mais de `max_pixels` sao recusados) e JPEGs grandes ja sao lidos
+    reduzidos para perto de `max_side`.
+    Retorna (resultado, estado, tempos). `resultado` tem rosto, origem
+    ("rastreado"/"detectado"/None) e a cor do frame (ou None).
+    """
+    timings = {}
+    start = time.perf_counter()
+    try:
+        check_header(contents, max_pixels, complete=True)
+    except UploadRejected as e:
+        return {"erro": e.detail}, state, timings
+    img = decode_image(contents, max_side)
+    if img is None:
+        return {"erro": "Frame invalido"}, state, timings
+    height, width = img.shape[:2]
+    if max(height, width) > max_side:
+        scale = max_side / max(height, width)
+        img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    timings["decode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    box, source = None, None
+    if state.box is not None and state.frames_since_detect < redetect_every:
+        tracked = _track(gray, state)
+        if tracked is not None:
+            box, source = tracked[0], "rastreado"
+            state.box = box
+            state.frames_since_detect += 1
+    if box is None:
+        box = detect_face(img, detect_max_side)
+        if box is None:
+            state.box = state.template = None
+        else:
+            source = "detectado"
+            _reset_template(gray, state, box)
+    timings["rosto"] = time.perf_counter() - start
+
+    result = {"rosto": None, "origem": source, "cor": None}
+    if box is None:
+        return result, state, timings
+    start = time.perf_counter()
+    result["rosto"] = {"x": box[0], "y": box[1], "w": box[2], "h": box[3], "largura_frame": img.shape[1], "altura_frame": img.shape[0]}
+    sample = sample_cheeks(img, box, max_samples)
+    if sample is not None:
+        result["cor"], result["pixels"] = sample
+    timings["amostragem"] = time.perf_counter() - start
+    return result, state, timings
+
+
+class ToneSmoother:
+    """Estimativa robusta do tom a partir das cores dos ultimos frames.
+
+    Descarta frames cuja cor fica a mais de `outlier_k` MADs da mediana
+    (piscadas, mao na frente, mudanca brusca de luz) e devolve a mediana dos
+    restantes. A estabilidade vai de 0 a 1 conforme a dispersao e o numero
+    de frames aceitos.
+    """
+
+    def __init__(self, window=15, min_frames=5, stable_spread=6.0, outlier_k=3.0):
+        self.window = window
+        self.min_frames = min_frames
+        self.stable_spread = stable_spread
+        self.outlier_k = outlier_k
+        self._colors = deque(maxlen=window)
+
+    def reset(self):
+        self._colors.clear()
+
+    def add(self, rgb):
+        self._colors.append(rgb)
+
+    def estimate(self):
+        """Retorna (rgb, estabilidade, frames_aceitos) ou None sem amostras."""
+        if not self._colors:
+            return None
+        colors = np.array(self._colors, dtype=np.float64)
+        median = np.median(colors, axis=0)
+        distances = np.linalg.norm(colors - median, axis=1)
+        mad = np.median(distances)
+        inliers = colors[distances <= max(self.outlier_k * mad, 1.0)]
+        rgb = np.median(inliers, axis=0)
+        spread = float(np.median(np.linalg.norm(inliers - rgb, axis=1)))
+        fill = min(1.0, len(inliers) / self.min_frames)
+        stability = fill * max(0.0, 1.0 - spread / (2 * self.stable_spread))
+        return tuple(int(round(c)) for c in rgb), round(stability, 3), len(inliers)
+
+    def is_stable(self, stability, accepted):
+        return accepted >= self.min_frames and stability >= 0.5
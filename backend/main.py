@@ -1,8 +1,10 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from contextlib import asynccontextmanager
+import asyncio
 import cv2
 import numpy as np
 import httpx
@@ -10,23 +12,106 @@ import os
 import io
 import base64
 import colorsys
+import json
+import logging
+import math
+import time
 from dotenv import load_dotenv
 
-load_dotenv()
-
-app = FastAPI(title="SkinTone Matcher API")
+from batch import BatchError, collect_items, run_window
+from catalog import FILTER_VALUES, MATCH_METRICS, ProductCatalog
+from executor import Overloaded, VisionExecutor
+from http_clients import UpstreamClient
+from product_queries import CATALOG_COLUMNS, decode_cursor, encode_cursor, fetch_page, iter_pages, parse_columns, product_params
+from monk_index import UNDERTONE_CLASSES, MonkIndex
+from live import ToneSmoother, TrackState, process_frame
+from jobs import FINAL_STATES, JOB_FAILED, InMemoryJobStore, JobQueue, new_job
+from metrics import REGISTRY, ErrorCountingHandler, MetricsMiddleware, record_stages, stage
+from persistence import PersistenceQueue, analysis_record, recommendation_records
+from profiler import SamplingProfiler
+from result_cache import ResultCache, content_key
+from uploads import MULTIPART_OVERHEAD, UploadLimitMiddleware, UploadRejected, check_header, read_image_upload
+from vision import (NO_FACE_ERROR, analyze_image_bytes, analyze_image_regions, detector_pool_stats, downscale_for_upload,
+                    init_detector_pool, warm_up_detector)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+load_dotenv()
 
 # Config
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+CATALOG_TTL = float(os.getenv("CATALOG_TTL", "300"))
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "30"))
+CATALOG_SHADE_INDEX = os.getenv("CATALOG_SHADE_INDEX", "1") != "0"
+# Linhas por pagina nas leituras de produtos; deve ficar abaixo do max-rows do PostgREST (1000 no Supabase)
+PRODUCTS_PAGE_SIZE = int(os.getenv("PRODUCTS_PAGE_SIZE", "500"))
+VISION_EXECUTOR = os.getenv("VISION_EXECUTOR", "thread")
+VISION_WORKERS = int(os.getenv("VISION_WORKERS", "0")) or None
+VISION_MAX_PENDING = int(os.getenv("VISION_MAX_PENDING", "0")) or None
+DETECTOR_POOL_SIZE = int(os.getenv("DETECTOR_POOL_SIZE", "0")) or None
+# Deteccao numa copia com lado maior <= DETECT_MAX_SIDE; JPEGs com lado maior
+# >= 2x DECODE_MIN_SIDE sao lidos ja reduzidos (0 desliga cada otimizacao)
+DETECT_MAX_SIDE = int(os.getenv("DETECT_MAX_SIDE", "640"))
+DECODE_MIN_SIDE = int(os.getenv("DECODE_MIN_SIDE", "1600"))
+# Amostragem da pele: "bochecha" (uma regiao, padrao) ou "regioes" (bochechas, testa,
+# mandibula e pescoco com media aparada; a resposta ganha cor e qualidade por regiao)
+SKIN_SAMPLING = os.getenv("SKIN_SAMPLING", "bochecha")
+SKIN_SAMPLING_MAX_SAMPLES = int(os.getenv("SKIN_SAMPLING_MAX_SAMPLES", "4096"))
+if SKIN_SAMPLING not in ("bochecha", "regioes"):
+    raise ValueError(f"Amostragem de pele invalida: {SKIN_SAMPLING}")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "120"))
+# Imagem enviada ao Gemini: lado maior reduzido para GEMINI_MAX_SIDE e recodificada em JPEG (0 so converte o formato)
+GEMINI_MAX_SIDE = int(os.getenv("GEMINI_MAX_SIDE", "1536"))
+GEMINI_JPEG_QUALITY = int(os.getenv("GEMINI_JPEG_QUALITY", "90"))
+# Uploads de imagem unica: lidos em blocos, recusados acima do limite ou com dimensoes absurdas
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(15 * 1024 * 1024)))
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", "64000000"))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(256 * 1024)))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_DIR = os.getenv("CACHE_DIR") or None
+CACHE_DISK_MAX_BYTES = int(os.getenv("CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+CACHE_TTL_RGB = float(os.getenv("CACHE_TTL_RGB", "86400"))
+CACHE_TTL_MAKEUP = float(os.getenv("CACHE_TTL_MAKEUP", "3600"))
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "50"))
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))
+JOB_MAX = int(os.getenv("JOB_MAX", "1000"))
+MONK_LUT_PATH = os.getenv("MONK_LUT_PATH") or None
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "500"))
+BATCH_MAX_IMAGE_BYTES = int(os.getenv("BATCH_MAX_IMAGE_BYTES", str(15 * 1024 * 1024)))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(64 * 1024 * 1024)))
+BATCH_WINDOW = int(os.getenv("BATCH_WINDOW", "0"))
+LIVE_MAX_SESSIONS = int(os.getenv("LIVE_MAX_SESSIONS", "100"))
+LIVE_MAX_FRAME_BYTES = int(os.getenv("LIVE_MAX_FRAME_BYTES", str(512 * 1024)))
+LIVE_MAX_FRAME_PIXELS = int(os.getenv("LIVE_MAX_FRAME_PIXELS", "4000000"))
+LIVE_MAX_SIDE = int(os.getenv("LIVE_MAX_SIDE", "480"))
+LIVE_REDETECT_EVERY = int(os.getenv("LIVE_REDETECT_EVERY", "30"))
+LIVE_MAX_SAMPLES = int(os.getenv("LIVE_MAX_SAMPLES", "2048"))
+LIVE_WINDOW = int(os.getenv("LIVE_WINDOW", "15"))
+# Historico em analises/recomendacoes: gravado em lote em segundo plano (write-behind)
+PERSIST_ANALYSES = os.getenv("PERSIST_ANALYSES", "1") != "0"
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "200"))
+PERSIST_FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", "2"))
+PERSIST_MAX_PENDING = int(os.getenv("PERSIST_MAX_PENDING", "5000"))
+PERSIST_MAX_RETRIES = int(os.getenv("PERSIST_MAX_RETRIES", "3"))
+PERSIST_SPILL_DIR = os.getenv("PERSIST_SPILL_DIR") or None
+PERSIST_SPILL_MAX_BYTES = int(os.getenv("PERSIST_SPILL_MAX_BYTES", str(256 * 1024 * 1024)))
+PERSIST_DRAIN_TIMEOUT = float(os.getenv("PERSIST_DRAIN_TIMEOUT", "10"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Header Server-Timing com a duracao de cada etapa (desligado por padrao: expoe detalhes internos)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+# Sem token os endpoints /debug/profiler respondem 404
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN") or None
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logging.getLogger().addHandler(ErrorCountingHandler())
+# O httpx registra cada requisicao em INFO; as chamadas aos upstreams ja aparecem em /metrics
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
 
 def get_supabase_headers():
     return {
@@ -35,6 +120,122 @@ def get_supabase_headers():
         "Content-Type": "application/json"
     }
 
+# Clientes HTTP compartilhados: um pool de conexoes por upstream
+supabase = UpstreamClient("supabase", SUPABASE_URL, headers=get_supabase_headers(), timeout=SUPABASE_TIMEOUT,
+                          max_connections=HTTP_MAX_CONNECTIONS)
+gemini = UpstreamClient("gemini", GEMINI_BASE_URL, timeout=GEMINI_TIMEOUT, connect_timeout=10.0,
+                        max_connections=HTTP_MAX_CONNECTIONS)
+
+# =====================================================
+# CATALOGO DE PRODUTOS (cache em memoria)
+# =====================================================
+async def fetch_catalog_rows():
+    """Produtos ativos, so com as colunas usadas no matching, em paginas por id."""
+    params = product_params(CATALOG_COLUMNS)
+    return [row async for page in iter_pages(supabase, params, PRODUCTS_PAGE_SIZE) for row in page]
+
+async def probe_catalog_version():
+    """Marcador barato de versao do catalogo: maior updated_at + total de linhas."""
+    resp = await supabase.get("/rest/v1/produtos?select=updated_at&order=updated_at.desc.nullslast&limit=1",
+                              headers={"Prefer": "count=exact"})
+    resp.raise_for_status()
+    rows = resp.json()
+    return (rows[0]["updated_at"] if rows else None, resp.headers.get("content-range"))
+
+catalog = ProductCatalog(fetch_catalog_rows, probe_catalog_version, ttl=CATALOG_TTL, check_interval=CATALOG_CHECK_INTERVAL,
+                         use_index=CATALOG_SHADE_INDEX)
+
+# Cache de resultados por hash da imagem enviada (cor extraida e imagem com
+# maquiagem ficam em namespaces separados, cada um com seu TTL; o tom Monk
+# sai direto da LUT)
+result_cache = ResultCache(
+    {"rgb": CACHE_TTL_RGB, "makeup": CACHE_TTL_MAKEUP},
+    max_bytes=CACHE_MAX_BYTES, disk_dir=CACHE_DIR, disk_max_bytes=CACHE_DISK_MAX_BYTES,
+)
+
+# Jobs de /analyze-complete/jobs: a imagem do Gemini e gerada em segundo plano
+job_queue = JobQueue(InMemoryJobStore(ttl=JOB_TTL, max_jobs=JOB_MAX), concurrency=JOB_CONCURRENCY, max_queued=JOB_QUEUE_SIZE)
+
+# Pool limitado para decode + deteccao de rosto (CPU-bound, fora do event loop).
+# No modo processo cada worker carrega o proprio classificador no initializer.
+vision_executor = VisionExecutor(
+    VISION_EXECUTOR, VISION_WORKERS, VISION_MAX_PENDING,
+    initializer=init_detector_pool if VISION_EXECUTOR == "process" else None,
+)
+
+# Analises e recomendacoes enfileiradas para o Supabase sem atrasar a resposta
+persistence = PersistenceQueue(
+    supabase, batch_size=PERSIST_BATCH_SIZE, flush_interval=PERSIST_FLUSH_INTERVAL, max_pending=PERSIST_MAX_PENDING,
+    max_retries=PERSIST_MAX_RETRIES, spill_dir=PERSIST_SPILL_DIR, spill_max_bytes=PERSIST_SPILL_MAX_BYTES,
+    drain_timeout=PERSIST_DRAIN_TIMEOUT,
+)
+PERSIST_ENABLED = PERSIST_ANALYSES and bool(SUPABASE_URL and SUPABASE_KEY)
+
+# Contadores das sessoes de camera ao vivo (/ws/camera)
+live_stats = {"sessoes_ativas": 0, "sessoes": 0, "recusadas": 0, "frames": 0, "descartados": 0, "detectados": 0, "rastreados": 0}
+
+# Profiler por amostragem, ligado sob demanda em /debug/profiler
+profiler = SamplingProfiler(PROFILER_INTERVAL_MS / 1000)
+
+# Metricas Prometheus (GET /metrics). Tempos por etapa, HTTP e upstreams ficam
+# em metrics.py/http_clients.py; aqui entram deteccao e o estado das filas.
+FACE_DETECTIONS = REGISTRY.counter("skin_face_detections_total", "Deteccoes de rosto por resultado", ("resultado",))
+FACE_DETECTION_FALLBACKS = REGISTRY.counter("skin_face_detection_fallbacks_total", "Deteccoes que precisaram da segunda passada do classificador")
+REGISTRY.gauge("skin_vision_pending", "Tarefas de visao em execucao ou na fila").set_function(lambda: vision_executor.pending)
+REGISTRY.gauge("skin_jobs_queued", "Jobs de geracao aguardando na fila").set_function(lambda: job_queue.stats()["na_fila"])
+REGISTRY.gauge("skin_cache_in_flight", "Calculos em andamento no cache de resultados").set_function(lambda: result_cache.stats()["em_andamento"])
+REGISTRY.gauge("skin_camera_sessions", "Sessoes de camera ao vivo abertas").set_function(lambda: live_stats["sessoes_ativas"])
+REGISTRY.gauge("skin_catalog_age_seconds", "Idade do snapshot do catalogo").set_function(lambda: catalog.stats()["idade_segundos"])
+REGISTRY.gauge("skin_catalog_products", "Produtos no snapshot do catalogo").set_function(lambda: catalog.stats()["produtos"])
+REGISTRY.gauge("skin_persist_pending", "Analises aguardando gravacao no Supabase").set_function(lambda: persistence.stats()["pendentes"])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if vision_executor.kind == "thread":
+        init_detector_pool(DETECTOR_POOL_SIZE or vision_executor.workers)
+    await vision_executor.warm_up(warm_up_detector)
+    # Monta o indice Monk em segundo plano; ate ficar pronto a classificacao e exata
+    index_build = asyncio.create_task(asyncio.to_thread(monk_index.ensure_built, MONK_LUT_PATH))
+    job_queue.start()
+    if PERSIST_ENABLED:
+        persistence.start()
+    refresher = None
+    if SUPABASE_URL and SUPABASE_KEY:
+        refresher = asyncio.create_task(catalog.run_refresher())
+    yield
+    if refresher:
+        refresher.cancel()
+        try:
+            await refresher
+        except asyncio.CancelledError:
+            pass
+    await catalog.aclose()
+    await job_queue.stop()
+    # Depois dos jobs (que ainda podem enfileirar analises) e antes de fechar o cliente do Supabase
+    await persistence.stop()
+    await index_build
+    await asyncio.to_thread(profiler.stop)
+    vision_executor.shutdown()
+    await supabase.aclose()
+    await gemini.aclose()
+
+app = FastAPI(title="SkinTone Matcher API", lifespan=lifespan)
+
+# Rotas de imagem unica: corpo maior que o limite e recusado antes do parse do multipart
+UPLOAD_ROUTES = ("/analyze", "/analyze-complete", "/analyze-complete/jobs", "/generate-makeup")
+# O lote tem limite proprio para o corpo inteiro (arquivos e zips somados)
+app.add_middleware(UploadLimitMiddleware, limits={
+    **{path: UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD for path in UPLOAD_ROUTES},
+    "/analyze/batch": BATCH_MAX_BYTES + MULTIPART_OVERHEAD,
+})
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(MetricsMiddleware, server_timing=SERVER_TIMING)
+
 # =====================================================
 # ESCALA MONK SKIN TONE (Google)
 # =====================================================
@@ -71,38 +272,33 @@ MONK_SKIN_TONES = [
      "dicas": ["Bases com bastante pigmento vermelho", "Iluminadores cobre ou bronze", "Blush em tons de vinho ou berry"]}
 ]
 
+# Subtons (a regra de classificacao fica em monk_index.undertone_class)
+UNDERTONE_PROFILES = {
+    "quente": {"tipo_en": "warm", "descricao": "Tons dourados, amarelados ou pessego. Veias esverdeadas no pulso.",
+               "cores_ideais": ["dourado", "caramelo", "pessego", "coral", "bronze"]},
+    "frio": {"tipo_en": "cool", "descricao": "Tons rosados ou azulados. Veias azuladas ou roxas no pulso.",
+             "cores_ideais": ["rosa", "vinho", "ameixa", "prata", "berry"]},
+    "neutro": {"tipo_en": "neutral", "descricao": "Equilibrio entre tons quentes e frios.",
+               "cores_ideais": ["nude", "rose", "terracota suave", "champagne"]},
+    "oliva": {"tipo_en": "olive", "descricao": "Tom esverdeado sob a pele. Comum em brasileiros.",
+              "cores_ideais": ["terracota", "mostarda", "verde oliva", "bronze", "cobre"]},
+}
+
+# Indice quantizado RGB -> (tom Monk, subtom); montado no startup ou lido de MONK_LUT_PATH
+monk_index = MonkIndex([tone["rgb"] for tone in MONK_SKIN_TONES])
+
+# Tipos de produto considerados em cada grupo de recomendacao
+RECOMMENDATION_GROUPS = {
+    "bases": ("base",),
+    "corretivos": ("corretivo",),
+    "pos": ("po_compacto", "po_solto"),
+    "contornos": ("contorno",),
+    "iluminadores": ("iluminador",),
+}
+
 # =====================================================
 # FUNCOES AUXILIARES
 # =====================================================
-face_cascade = None
-
-def get_face_cascade():
-    global face_cascade
-    if face_cascade is None:
-        cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        face_cascade = cv2.CascadeClassifier(cascade_path)
-    return face_cascade
-
-def extract_skin_color_opencv(img):
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    cascade = get_face_cascade()
-    faces = cascade.detectMultiScale(gray, scaleFactor=1.05, minNeighbors=3, minSize=(50, 50), flags=cv2.CASCADE_SCALE_IMAGE)
-    if len(faces) == 0:
-        faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=2, minSize=(30, 30))
-    if len(faces) == 0:
-        return None, "Nenhum rosto detectado na imagem"
-    x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
-    cheek_region = img[y + int(h * 0.35):y + int(h * 0.65), x + int(w * 0.15):x + int(w * 0.85)]
-    if cheek_region.size == 0:
-        return None, "Nao foi possivel extrair a regiao da pele"
-    hsv = cv2.cvtColor(cheek_region, cv2.COLOR_BGR2HSV)
-    mask = cv2.inRange(hsv, np.array([0, 20, 70], dtype=np.uint8), np.array([50, 255, 255], dtype=np.uint8))
-    skin_pixels = cheek_region[mask > 0]
-    if len(skin_pixels) < 100:
-        skin_pixels = cheek_region.reshape(-1, 3)
-    avg_color = np.mean(skin_pixels, axis=0).astype(int)
-    return (int(avg_color[2]), int(avg_color[1]), int(avg_color[0])), None
-
 def hex_to_rgb(hex_color: str) -> tuple:
     hex_color = hex_color.lstrip("#")
     return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
@@ -118,42 +314,25 @@ def rgb_to_hsl(r: int, g: int, b: int) -> tuple:
 def calculate_color_distance(rgb1: tuple, rgb2: tuple) -> float:
     return np.sqrt(sum((a - b) ** 2 for a, b in zip(rgb1, rgb2)))
 
-def classify_monk_tone(r: int, g: int, b: int) -> dict:
-    min_distance = float('inf')
-    closest_tone = MONK_SKIN_TONES[4]
-    for tone in MONK_SKIN_TONES:
-        distance = calculate_color_distance((r, g, b), tone["rgb"])
-        if distance < min_distance:
-            min_distance = distance
-            closest_tone = tone
-    confidence = max(0, 100 - (min_distance / 441.67 * 100))
+def monk_tone_payload(tone_index: int, confidence: float) -> dict:
+    closest_tone = MONK_SKIN_TONES[tone_index]
     return {
         "tom": closest_tone["tom"], "codigo": closest_tone["codigo"], "nome": closest_tone["nome"],
         "hex_referencia": closest_tone["hex"], "fitzpatrick": closest_tone["fitzpatrick"],
         "descricao": closest_tone["descricao"], "undertones_comuns": closest_tone["undertones"],
-        "dicas": closest_tone["dicas"], "confianca": round(confidence, 1)
+        "dicas": closest_tone["dicas"], "confianca": confidence
     }
 
+def classify_monk_tone(r: int, g: int, b: int) -> dict:
+    tone_index, min_distance, _ = monk_index.classify(r, g, b)
+    confidence = max(0, 100 - (min_distance / 441.67 * 100))
+    return monk_tone_payload(tone_index, round(confidence, 1))
+
 def determine_undertone(r: int, g: int, b: int) -> dict:
-    h, s, l = rgb_to_hsl(r, g, b)
-    if r > b and (r - b) > 15:
-        undertone, undertone_en = "quente", "warm"
-        descricao = "Tons dourados, amarelados ou pessego. Veias esverdeadas no pulso."
-        cores_ideais = ["dourado", "caramelo", "pessego", "coral", "bronze"]
-    elif b > r and (b - r) > 15:
-        undertone, undertone_en = "frio", "cool"
-        descricao = "Tons rosados ou azulados. Veias azuladas ou roxas no pulso."
-        cores_ideais = ["rosa", "vinho", "ameixa", "prata", "berry"]
-    else:
-        undertone, undertone_en = "neutro", "neutral"
-        descricao = "Equilibrio entre tons quentes e frios."
-        cores_ideais = ["nude", "rose", "terracota suave", "champagne"]
-    if g > (r + b) / 2 * 0.9 and g < (r + b) / 2 * 1.1 and s < 50:
-        if undertone in ["quente", "neutro"]:
-            undertone, undertone_en = "oliva", "olive"
-            descricao = "Tom esverdeado sob a pele. Comum em brasileiros."
-            cores_ideais = ["terracota", "mostarda", "verde oliva", "bronze", "cobre"]
-    return {"tipo": undertone, "tipo_en": undertone_en, "descricao": descricao, "cores_ideais": cores_ideais}
+    undertone = UNDERTONE_CLASSES[monk_index.classify(r, g, b)[2]]
+    profile = UNDERTONE_PROFILES[undertone]
+    return {"tipo": undertone, "tipo_en": profile["tipo_en"], "descricao": profile["descricao"],
+            "cores_ideais": list(profile["cores_ideais"])}
 
 def analyze_skin_detailed(r: int, g: int, b: int) -> dict:
     h, s, l = rgb_to_hsl(r, g, b)
@@ -218,11 +397,15 @@ async def generate_makeup_image_gemini(image_bytes: bytes, prompt: str) -> Optio
         return None
 
     try:
+        # Reduz e recodifica antes do envio: payload e latencia menores
+        with stage("gemini_preparo"):
+            image_bytes = await run_vision(downscale_for_upload, image_bytes, GEMINI_MAX_SIDE, GEMINI_JPEG_QUALITY, wait_if_busy=True)
+
         # Converter imagem para base64
         image_base64 = base64.b64encode(image_bytes).decode('utf-8')
 
         # Preparar request para Gemini
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-exp-image-generation:generateContent?key={GOOGLE_API_KEY}"
+        url = f"/v1beta/models/gemini-2.0-flash-exp-image-generation:generateContent?key={GOOGLE_API_KEY}"
 
         payload = {
             "contents": [
@@ -246,27 +429,27 @@ async def generate_makeup_image_gemini(image_bytes: bytes, prompt: str) -> Optio
             }
         }
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(url, json=payload)
+        with stage("gemini"):
+            response = await gemini.post(url, json=payload)
 
-            if response.status_code != 200:
-                print(f"Gemini API error: {response.status_code} - {response.text}")
-                return None
+        if response.status_code != 200:
+            logger.warning("Gemini API error: %s - %s", response.status_code, response.text[:500])
+            return None
 
-            data = response.json()
+        data = response.json()
 
-            # Extrair imagem da resposta
-            if "candidates" in data and len(data["candidates"]) > 0:
-                candidate = data["candidates"][0]
-                if "content" in candidate and "parts" in candidate["content"]:
-                    for part in candidate["content"]["parts"]:
-                        if "inlineData" in part:
-                            return part["inlineData"]["data"]
+        # Extrair imagem da resposta
+        if "candidates" in data and len(data["candidates"]) > 0:
+            candidate = data["candidates"][0]
+            if "content" in candidate and "parts" in candidate["content"]:
+                for part in candidate["content"]["parts"]:
+                    if "inlineData" in part:
+                        return part["inlineData"]["data"]
 
-            return None
+        return None
 
     except Exception as e:
-        print(f"Erro ao gerar imagem com Gemini: {e}")
+        logger.exception("Erro ao gerar imagem com Gemini: %s", e)
         return None
 
 # =====================================================
@@ -282,27 +465,178 @@ async def health():
     supabase_ok = False
     if SUPABASE_URL and SUPABASE_KEY:
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(f"{SUPABASE_URL}/rest/v1/", headers=get_supabase_headers())
-                supabase_ok = resp.status_code == 200
+            resp = await supabase.get("/rest/v1/", retries=0)
+            supabase_ok = resp.status_code == 200
         except:
             pass
     return {"status": "healthy", "supabase_connected": supabase_ok, "gemini_enabled": bool(GOOGLE_API_KEY)}
 
+@app.get("/stats")
+async def get_stats():
+    return {
+        "catalogo": catalog.stats(),
+        "visao": {**vision_executor.stats(), "detectores": detector_pool_stats()},
+        "upstreams": {"supabase": supabase.stats(), "gemini": gemini.stats()},
+        "cache_resultados": result_cache.stats(),
+        "jobs": job_queue.stats(),
+        "gravacao": {"ativa": PERSIST_ENABLED, **persistence.stats()},
+        "indice_monk": monk_index.stats(),
+        "camera": live_stats,
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Metricas no formato texto do Prometheus."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def check_profiler_token(token: Optional[str]):
+    # Sem PROFILER_TOKEN configurado os endpoints nem aparecem
+    if not PROFILER_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if token != PROFILER_TOKEN:
+        raise HTTPException(status_code=403, detail="Token do profiler invalido")
+
+@app.post("/debug/profiler/start")
+async def start_profiler(intervalo_ms: Optional[float] = None, x_profiler_token: Optional[str] = Header(None)):
+    """Liga o profiler por amostragem (zera as amostras anteriores)."""
+    check_profiler_token(x_profiler_token)
+    if intervalo_ms is not None and not 1 <= intervalo_ms <= 1000:
+        raise HTTPException(status_code=400, detail="intervalo_ms deve estar entre 1 e 1000")
+    if not profiler.start(intervalo_ms / 1000 if intervalo_ms else None):
+        raise HTTPException(status_code=409, detail="Profiler ja esta ativo")
+    return profiler.stats()
+
+@app.post("/debug/profiler/stop")
+async def stop_profiler(x_profiler_token: Optional[str] = Header(None)):
+    check_profiler_token(x_profiler_token)
+    # stop() espera a thread de amostragem terminar o intervalo: fora do event loop
+    await asyncio.to_thread(profiler.stop)
+    return profiler.stats()
+
+@app.get("/debug/profiler")
+async def get_profile(x_profiler_token: Optional[str] = Header(None)):
+    """Pilhas amostradas no formato collapsed (flamegraph.pl / speedscope)."""
+    check_profiler_token(x_profiler_token)
+    return PlainTextResponse(profiler.collapsed())
+
 @app.get("/monk-scale")
 async def get_monk_scale():
     return {"escala": "Monk Skin Tone Scale", "fonte": "Google / Dr. Ellis Monk", "tons": MONK_SKIN_TONES}
 
+async def run_vision(fn, *args, wait_if_busy: bool = False):
+    """Executa `fn(*args)` no executor de visao.
+
+    Com a fila cheia responde 503 na hora ou, com `wait_if_busy` (lotes,
+    geracao em segundo plano), espera uma vaga.
+    """
+    delay = 0.05
+    while True:
+        try:
+            return await vision_executor.run(fn, *args)
+        except Overloaded:
+            if not wait_if_busy:
+                raise HTTPException(status_code=503, detail="Servidor ocupado, tente novamente em instantes", headers={"Retry-After": "1"})
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+async def read_upload(image: UploadFile) -> bytes:
+    """Le a imagem enviada em blocos, validando tamanho, formato e dimensoes pelo cabecalho."""
+    try:
+        with stage("upload"):
+            contents, _ = await read_image_upload(image, UPLOAD_MAX_BYTES, UPLOAD_MAX_PIXELS, UPLOAD_CHUNK_BYTES)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return contents
+
+async def extract_skin_color(contents: bytes, wait_if_busy: bool = False):
+    """Roda o pipeline de visao no executor (ver `run_vision` para fila cheia).
+
+    Retorna (rgb, erro, regioes); `regioes` so vem com SKIN_SAMPLING=regioes.
+    """
+    if SKIN_SAMPLING == "regioes":
+        rgb_color, sampling, error, timings = await run_vision(
+            analyze_image_regions, contents, DETECT_MAX_SIDE, DECODE_MIN_SIDE, SKIN_SAMPLING_MAX_SAMPLES,
+            wait_if_busy=wait_if_busy)
+    else:
+        sampling = None
+        rgb_color, error, timings = await run_vision(analyze_image_bytes, contents, DETECT_MAX_SIDE, DECODE_MIN_SIDE,
+                                                     wait_if_busy=wait_if_busy)
+    vision_executor.stages.record(timings)
+    record_stages(timings)
+    if "deteccao_fallback" in timings:
+        FACE_DETECTION_FALLBACKS.inc()
+    if "deteccao" in timings:
+        FACE_DETECTIONS.inc(resultado="sem_rosto" if error == NO_FACE_ERROR else "rosto")
+    return rgb_color, error, sampling
+
+async def extract_skin_color_cached(contents: bytes, image_key: str, wait_if_busy: bool = False):
+    """Cor da pele via cache; a configuracao da deteccao e da amostragem entra na chave."""
+    key = f"{image_key}:{DETECT_MAX_SIDE}:{DECODE_MIN_SIDE}:{SKIN_SAMPLING}"
+    return await result_cache.get_or_compute("rgb", key, lambda: extract_skin_color(contents, wait_if_busy))
+
+async def generate_makeup_image_cached(image_bytes: bytes, prompt: str) -> Optional[str]:
+    """Imagem do Gemini via cache (chave = imagem + prompt); falhas nao sao armazenadas."""
+    return await result_cache.get_or_compute(
+        "makeup", content_key(image_bytes, prompt),
+        lambda: generate_makeup_image_gemini(image_bytes, prompt),
+        cacheable=lambda image: image is not None,
+    )
+
+def validate_metric(metrica: str) -> str:
+    if metrica not in MATCH_METRICS:
+        raise HTTPException(status_code=400, detail=f"Metrica invalida. Use uma de: {', '.join(MATCH_METRICS)}")
+    return metrica
+
+def product_match_fields(score: float, distance: float, metrica: str) -> dict:
+    fields = {"match_score": score}
+    if metrica != "rgb":
+        fields["delta_e"] = round(distance, 2)
+    return fields
+
+def product_filters(subtom: Optional[str], acabamento: Optional[str]) -> tuple:
+    """Filtros opcionais de atributo para o ranking (ex: ?subtom=quente&acabamento=matte)."""
+    filters = tuple((column, (value,)) for column, value in (("subtom", subtom), ("acabamento", acabamento)) if value)
+    for column, (value,) in filters:
+        if value not in FILTER_VALUES[column]:
+            raise HTTPException(status_code=400, detail=f"{column.capitalize()} invalido. Use um de: {', '.join(FILTER_VALUES[column])}")
+    return filters
+
+def region_fields(sampling: Optional[dict]) -> dict:
+    """Qualidade e cor por regiao (hex, pixels de pele, qualidade) quando SKIN_SAMPLING=regioes."""
+    if not sampling:
+        return {}
+    return {"qualidade": sampling["qualidade"], "regioes": {
+        name: {"hex": rgb_to_hex(*region["rgb"]) if region["rgb"] else None, "pixels": region["pixels"],
+               "qualidade": region["qualidade"]}
+        for name, region in sampling["regioes"].items()
+    }}
+
+def persist_analysis(rgb, undertone: str, monk_data: dict, sampling: Optional[dict], recommendations: dict, **metadata):
+    """Enfileira a analise e as recomendacoes (grupo -> produtos) para gravacao em segundo plano."""
+    if not PERSIST_ENABLED:
+        return
+    record = analysis_record(rgb, undertone, monk_data, sampling, **metadata)
+    persistence.enqueue(record, [row for motivo, products in recommendations.items()
+                                 for row in recommendation_records(record["id"], products, motivo)])
+
+def base_recommendation(p: dict, score: float, distance: float, metrica: str) -> dict:
+    """Formato resumido de produto usado por /analyze e /analyze/batch."""
+    return {
+        "id": p.get("id"), "marca": p.get("marca"), "linha": p.get("linha"),
+        "cor_nome": p.get("cor_nome"), "hex": p.get("hex_code"),
+        "acabamento": p.get("acabamento"), **product_match_fields(score, distance, metrica)
+    }
+
 @app.post("/analyze")
-async def analyze_skin(image: UploadFile = File(...)):
+async def analyze_skin(image: UploadFile = File(...), metrica: str = "rgb",
+                       subtom: Optional[str] = None, acabamento: Optional[str] = None):
     if not image.content_type or not image.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem")
-    contents = await image.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    if img is None:
-        raise HTTPException(status_code=400, detail="Nao foi possivel processar a imagem")
-    rgb_color, error = extract_skin_color_opencv(img)
+    validate_metric(metrica)
+    filters = product_filters(subtom, acabamento)
+    contents = await read_upload(image)
+    image_key = content_key(contents)
+    rgb_color, error, sampling = await extract_skin_color_cached(contents, image_key)
     if error:
         raise HTTPException(status_code=400, detail=error)
     r, g, b = rgb_color
@@ -312,42 +646,209 @@ async def analyze_skin(image: UploadFile = File(...)):
     recommendations = []
     if SUPABASE_URL and SUPABASE_KEY:
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(f"{SUPABASE_URL}/rest/v1/produtos?select=*&ativo=eq.true&tipo=eq.base", headers=get_supabase_headers())
-                products = resp.json()
-            for p in products:
-                if not p.get("hex_code"): continue
-                product_rgb = hex_to_rgb(p["hex_code"])
-                diff = calculate_color_distance((r, g, b), product_rgb)
-                score = max(0, 100 - (diff / 4.41))
-                recommendations.append({
-                    "id": p.get("id"), "marca": p.get("marca"), "linha": p.get("linha"),
-                    "cor_nome": p.get("cor_nome"), "hex": p.get("hex_code"),
-                    "acabamento": p.get("acabamento"), "match_score": round(score, 1)
-                })
-            recommendations.sort(key=lambda x: x["match_score"], reverse=True)
+            with stage("catalogo"):
+                products = await catalog.snapshot()
+            with stage("ranking"):
+                for p, score, distance in products.top_k((r, g, b), ("base",), 5, metrica, filters):
+                    recommendations.append(base_recommendation(p, score, distance, metrica))
         except Exception as e:
-            print(f"Erro ao buscar produtos: {e}")
+            logger.exception("Erro ao buscar produtos: %s", e)
+    persist_analysis(rgb_color, undertone_data["tipo"], monk_data, sampling, {"base": recommendations[:5]},
+                     origem="analyze", metrica=metrica)
     return {
-        "skin_tone": {"hex": hex_color, "rgb": {"r": int(r), "g": int(g), "b": int(b)}, "undertone": undertone_data["tipo"]},
+        "skin_tone": {"hex": hex_color, "rgb": {"r": int(r), "g": int(g), "b": int(b)}, "undertone": undertone_data["tipo"],
+                      **region_fields(sampling)},
         "monk_tone": monk_data,
         "recommendations": recommendations[:5]
     }
 
-@app.post("/analyze-complete")
-async def analyze_skin_complete(image: UploadFile = File(...)):
-    """Analise completa com geracao automatica de imagem com maquiagem."""
-    if not image.content_type or not image.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem")
+@app.post("/analyze/batch")
+async def analyze_batch(images: List[UploadFile] = File(...), metrica: str = "rgb", ordem: str = "entrada",
+                        subtom: Optional[str] = None, acabamento: Optional[str] = None):
+    """Analisa varias imagens (arquivos e/ou .zip) e responde em NDJSON.
 
-    contents = await image.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    Uma linha por imagem, no mesmo formato de /analyze (mais `indice` e
+    `arquivo`), em ordem de entrada (`ordem=entrada`) ou conforme ficam
+    prontas (`ordem=conclusao`); a ultima linha traz o `resumo`. O
+    catalogo e lido uma vez e as cores prontas sao comparadas com os
+    produtos numa unica operacao vetorizada.
+    """
+    validate_metric(metrica)
+    filters = product_filters(subtom, acabamento)
+    if ordem not in ("entrada", "conclusao"):
+        raise HTTPException(status_code=400, detail="Ordem invalida. Use entrada ou conclusao")
+    try:
+        items = await collect_items(images, BATCH_MAX_IMAGES, BATCH_MAX_IMAGE_BYTES)
+    except BatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    if img is None:
-        raise HTTPException(status_code=400, detail="Nao foi possivel processar a imagem")
+    products = None
+    if SUPABASE_URL and SUPABASE_KEY:
+        try:
+            with stage("catalogo"):
+                products = await catalog.snapshot()
+        except Exception as e:
+            logger.exception("Erro ao buscar produtos: %s", e)
 
-    rgb_color, error = extract_skin_color_opencv(img)
+    async def analyze_item(item):
+        with stage("upload"):
+            contents = await item.read()
+        # Mesmas regras de /analyze (formato e pixels pelo cabecalho) antes de qualquer decode
+        try:
+            check_header(contents, UPLOAD_MAX_PIXELS, complete=True)
+        except UploadRejected as e:
+            return None, e.detail, None
+        return await extract_skin_color_cached(contents, content_key(contents), wait_if_busy=True)
+
+    async def lines():
+        start = time.perf_counter()
+        total = failed = 0
+        window = BATCH_WINDOW or 2 * vision_executor.workers
+        async for ready in run_window(items, analyze_item, window, ordered=ordem == "entrada"):
+            colors = [(index, item, rgb, sampling) for index, item, (rgb, error, sampling) in ready if not error]
+            if colors:
+                rgbs = np.array([rgb for _, _, rgb, _ in colors], dtype=np.int64)
+                tones, confidences, undertones = monk_index.classify_batch(rgbs)
+                with stage("ranking"):
+                    matches = products.top_k_batch(rgbs, ("base",), 5, metrica, filters) if products is not None else [[] for _ in colors]
+                analyzed = {}
+                for (index, _, (r, g, b), sampling), tone, confidence, undertone, match in zip(colors, tones, confidences, undertones, matches):
+                    analyzed[index] = {
+                        "skin_tone": {"hex": rgb_to_hex(r, g, b), "rgb": {"r": int(r), "g": int(g), "b": int(b)},
+                                      "undertone": UNDERTONE_CLASSES[undertone], **region_fields(sampling)},
+                        "monk_tone": monk_tone_payload(int(tone), float(confidence)),
+                        "recommendations": [base_recommendation(p, score, distance, metrica) for p, score, distance in match],
+                    }
+                    persist_analysis((r, g, b), UNDERTONE_CLASSES[undertone], analyzed[index]["monk_tone"], sampling,
+                                     {"base": analyzed[index]["recommendations"]}, origem="batch", metrica=metrica)
+            for index, item, (_, error, _) in ready:
+                total += 1
+                if error:
+                    failed += 1
+                    line = {"indice": index, "arquivo": item.name, "erro": error}
+                else:
+                    line = {"indice": index, "arquivo": item.name, **analyzed[index]}
+                yield json.dumps(line) + "\n"
+        yield json.dumps({"resumo": {
+            "total": total, "sucesso": total - failed, "erros": failed,
+            "duracao_ms": round((time.perf_counter() - start) * 1000, 1),
+        }}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+@app.websocket("/ws/camera")
+async def camera_stream(websocket: WebSocket, metrica: str = "rgb"):
+    """Frames da camera (mensagens binarias JPEG/PNG) -> tom estimado em tempo real.
+
+    Cada frame processado gera uma mensagem JSON com o rosto, a estimativa
+    suavizada e a estabilidade. Quando a estimativa fica estavel (e quando
+    muda alem do ruido), a mensagem traz tambem `analise` com Monk e
+    recomendacoes.
+    Frames que chegam enquanto outro esta em processamento substituem o
+    anterior: no maximo um frame por sessao ocupa o executor.
+    """
+    if metrica not in MATCH_METRICS or live_stats["sessoes_ativas"] >= LIVE_MAX_SESSIONS:
+        live_stats["recusadas"] += 1
+        await websocket.close(code=1008 if metrica not in MATCH_METRICS else 1013)
+        return
+    # Reserva a vaga antes do primeiro await: handshakes simultaneos nao passam do limite
+    live_stats["sessoes_ativas"] += 1
+    try:
+        await websocket.accept()
+        live_stats["sessoes"] += 1
+        await run_camera_session(websocket, metrica)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        live_stats["sessoes_ativas"] -= 1
+
+
+async def run_camera_session(websocket: WebSocket, metrica: str):
+    """Laco de uma sessao de /ws/camera ja aceita (a vaga e controlada por camera_stream)."""
+    latest = None
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        nonlocal latest
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            if not data:
+                continue
+            if len(data) > LIVE_MAX_FRAME_BYTES or latest is not None:
+                live_stats["descartados"] += 1
+            if len(data) <= LIVE_MAX_FRAME_BYTES:
+                latest = data
+                frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
+    state = TrackState()
+    smoother = ToneSmoother(window=LIVE_WINDOW)
+    frame_number = 0
+    last_analyzed = None
+    try:
+        while True:
+            waiter = asyncio.create_task(frame_ready.wait())
+            await asyncio.wait({receiver, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver.done():
+                waiter.cancel()
+                break
+            frame_ready.clear()
+            frame, latest = latest, None
+            frame_number += 1
+            start = time.perf_counter()
+            try:
+                result, state, timings = await vision_executor.run(
+                    process_frame, frame, state, LIVE_MAX_SIDE, DETECT_MAX_SIDE, LIVE_REDETECT_EVERY, LIVE_MAX_SAMPLES,
+                    LIVE_MAX_FRAME_PIXELS)
+            except Overloaded:
+                live_stats["descartados"] += 1
+                continue
+            vision_executor.stages.record(timings)
+            live_stats["frames"] += 1
+            if result.get("origem") == "detectado":
+                live_stats["detectados"] += 1
+            elif result.get("origem") == "rastreado":
+                live_stats["rastreados"] += 1
+            if result.get("cor") is not None:
+                smoother.add(result["cor"])
+            message = {"frame": frame_number, **{k: v for k, v in result.items() if k != "cor"}}
+            estimate = smoother.estimate()
+            if estimate is not None:
+                (r, g, b), stability, accepted = estimate
+                stable = smoother.is_stable(stability, accepted)
+                monk = classify_monk_tone(r, g, b)
+                message.update({
+                    "tom": {"hex": rgb_to_hex(r, g, b), "rgb": {"r": r, "g": g, "b": b},
+                            "undertone": determine_undertone(r, g, b)["tipo"], "monk": monk["codigo"]},
+                    "estabilidade": stability, "estavel": stable, "frames_aceitos": accepted,
+                })
+                # Reenvia a analise so se a estimativa andar mais que o ruido tolerado
+                if stable and (last_analyzed is None or math.dist((r, g, b), last_analyzed) > smoother.stable_spread):
+                    last_analyzed = (r, g, b)
+                    recommendations = []
+                    if SUPABASE_URL and SUPABASE_KEY:
+                        try:
+                            products = await catalog.snapshot()
+                            recommendations = [base_recommendation(p, score, distance, metrica)
+                                               for p, score, distance in products.top_k((r, g, b), ("base",), 5, metrica)]
+                        except Exception as e:
+                            logger.exception("Erro ao buscar produtos: %s", e)
+                    message["analise"] = {"monk_tone": monk, "recommendations": recommendations}
+            message["tempo_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            await websocket.send_json(message)
+    finally:
+        receiver.cancel()
+
+async def build_complete_analysis(contents: bytes, metrica: str):
+    """Parte rapida da analise completa (tudo menos a imagem do Gemini).
+
+    Retorna (resposta, prompt_gemini).
+    """
+    image_key = content_key(contents)
+    rgb_color, error, sampling = await extract_skin_color_cached(contents, image_key)
     if error:
         raise HTTPException(status_code=400, detail=error)
 
@@ -358,57 +859,124 @@ async def analyze_skin_complete(image: UploadFile = File(...)):
     detailed_analysis = analyze_skin_detailed(r, g, b)
 
     # Buscar produtos
-    recommendations = {"bases": [], "corretivos": [], "pos": [], "contornos": [], "iluminadores": []}
+    recommendations = {key: [] for key in RECOMMENDATION_GROUPS}
 
     if SUPABASE_URL and SUPABASE_KEY:
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(f"{SUPABASE_URL}/rest/v1/produtos?select=*&ativo=eq.true", headers=get_supabase_headers())
-                products = resp.json()
-
-            for p in products:
-                if not p.get("hex_code"): continue
-                product_rgb = hex_to_rgb(p["hex_code"])
-                diff = calculate_color_distance((r, g, b), product_rgb)
-                score = max(0, 100 - (diff / 4.41))
-                product_data = {
-                    "id": p.get("id"), "marca": p.get("marca"), "linha": p.get("linha"),
-                    "cor_nome": p.get("cor_nome"), "hex": p.get("hex_code"),
-                    "acabamento": p.get("acabamento"), "cobertura": p.get("cobertura"),
-                    "subtom": p.get("subtom"), "preco": p.get("preco"),
-                    "onde_comprar": p.get("onde_comprar"), "match_score": round(score, 1)
-                }
-                tipo = p.get("tipo", "base")
-                if tipo == "base": recommendations["bases"].append(product_data)
-                elif tipo == "corretivo": recommendations["corretivos"].append(product_data)
-                elif tipo in ["po_compacto", "po_solto"]: recommendations["pos"].append(product_data)
-                elif tipo == "contorno": recommendations["contornos"].append(product_data)
-                elif tipo == "iluminador": recommendations["iluminadores"].append(product_data)
-
-            for key in recommendations:
-                recommendations[key].sort(key=lambda x: x["match_score"], reverse=True)
-                recommendations[key] = recommendations[key][:5]
+            with stage("catalogo"):
+                products = await catalog.snapshot()
+            with stage("ranking"):
+                for key, tipos in RECOMMENDATION_GROUPS.items():
+                    recommendations[key] = [
+                        {
+                            "id": p.get("id"), "marca": p.get("marca"), "linha": p.get("linha"),
+                            "cor_nome": p.get("cor_nome"), "hex": p.get("hex_code"),
+                            "acabamento": p.get("acabamento"), "cobertura": p.get("cobertura"),
+                            "subtom": p.get("subtom"), "preco": p.get("preco"),
+                            "onde_comprar": p.get("onde_comprar"), **product_match_fields(score, distance, metrica)
+                        }
+                        for p, score, distance in products.top_k((r, g, b), tipos, 5, metrica)
+                    ]
         except Exception as e:
-            print(f"Erro ao buscar produtos: {e}")
+            logger.exception("Erro ao buscar produtos: %s", e)
 
     # Selecionar melhor base
     best_base = recommendations["bases"][0] if recommendations["bases"] else {}
-
-    # Gerar prompt e imagem com Gemini
     gemini_prompt = generate_makeup_prompt_for_gemini(monk_data, undertone_data, best_base)
-    makeup_image_base64 = await generate_makeup_image_gemini(contents, gemini_prompt)
+    persist_analysis(rgb_color, undertone_data["tipo"], monk_data, sampling, recommendations, origem="completa", metrica=metrica)
 
     return {
-        "tom_detectado": {"hex": hex_color, "rgb": {"r": int(r), "g": int(g), "b": int(b)}},
+        "tom_detectado": {"hex": hex_color, "rgb": {"r": int(r), "g": int(g), "b": int(b)}, **region_fields(sampling)},
         "monk_tone": monk_data,
         "undertone": undertone_data,
         "analise_detalhada": detailed_analysis,
         "recomendacoes": recommendations,
         "dicas_profissionais": monk_data.get("dicas", []),
         "prompt_ia": gemini_prompt,
-        "imagem_maquiagem": makeup_image_base64
+    }, gemini_prompt
+
+@app.post("/analyze-complete")
+async def analyze_skin_complete(image: UploadFile = File(...), metrica: str = "rgb"):
+    """Analise completa com geracao automatica de imagem com maquiagem."""
+    if not image.content_type or not image.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem")
+    validate_metric(metrica)
+
+    contents = await read_upload(image)
+    result, gemini_prompt = await build_complete_analysis(contents, metrica)
+
+    # Gerar imagem com Gemini
+    result["imagem_maquiagem"] = await generate_makeup_image_cached(contents, gemini_prompt)
+    return result
+
+@app.post("/analyze-complete/jobs", status_code=202)
+async def create_analysis_job(image: UploadFile = File(...), metrica: str = "rgb"):
+    """Analise completa assincrona: responde na hora com tom e recomendacoes.
+
+    A imagem com maquiagem e gerada em segundo plano; acompanhe por
+    GET /jobs/{id} (polling) ou GET /jobs/{id}/events (SSE).
+    """
+    if not image.content_type or not image.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem")
+    validate_metric(metrica)
+    if not job_queue.has_capacity():
+        raise HTTPException(status_code=503, detail="Fila de geracao cheia, tente novamente em instantes", headers={"Retry-After": "5"})
+
+    contents = await read_upload(image)
+    result, gemini_prompt = await build_complete_analysis(contents, metrica)
+    job = await job_queue.store.create(new_job(result))
+
+    async def generate():
+        return {"imagem_maquiagem": await generate_makeup_image_cached(contents, gemini_prompt)}
+
+    try:
+        job_queue.submit(job["id"], generate)
+    except Overloaded:
+        await job_queue.store.update(job["id"], status=JOB_FAILED, erro="Fila de geracao cheia")
+        raise HTTPException(status_code=503, detail="Fila de geracao cheia, tente novamente em instantes", headers={"Retry-After": "5"})
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "resultado": result,
+        "links": {"status": f"/jobs/{job['id']}", "eventos": f"/jobs/{job['id']}/events"},
     }
 
+async def get_job_or_404(job_id: str) -> dict:
+    job = await job_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job nao encontrado ou expirado")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return await get_job_or_404(job_id)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-Sent Events: um evento `status` a cada mudanca e `fim` com o job final."""
+    job = await get_job_or_404(job_id)
+
+    async def events():
+        current = job
+        last_status = None
+        while True:
+            if current is None:
+                yield "event: erro\ndata: {\"detail\": \"Job expirado\"}\n\n"
+                return
+            if current["status"] in FINAL_STATES:
+                yield f"event: fim\ndata: {json.dumps(current)}\n\n"
+                return
+            # Versao lida antes do yield: o que mudar enquanto o evento e enviado nao se perde no wait
+            version = current["atualizado_em"]
+            if current["status"] != last_status:
+                last_status = current["status"]
+                yield f"event: status\ndata: {json.dumps({'id': current['id'], 'status': last_status})}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            current = await job_queue.store.wait(job_id, timeout=15.0, since=version)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/generate-makeup")
 async def generate_makeup_custom(
     image: UploadFile = File(...),
@@ -424,10 +992,10 @@ async def generate_makeup_custom(
     if not prompt or len(prompt) < 10:
         raise HTTPException(status_code=400, detail="Prompt muito curto ou vazio")
 
-    contents = await image.read()
+    contents = await read_upload(image)
 
     # Gerar imagem com Gemini usando o prompt personalizado
-    generated_image = await generate_makeup_image_gemini(contents, prompt)
+    generated_image = await generate_makeup_image_cached(contents, prompt)
 
     if not generated_image:
         raise HTTPException(status_code=500, detail="Falha ao gerar imagem com IA. Tente novamente.")
@@ -439,17 +1007,74 @@ async def generate_makeup_custom(
     }
 
 @app.get("/products")
-async def list_products(tipo: Optional[str] = None):
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        return []
+async def list_products(
+    tipo: Optional[str] = None, marca: Optional[str] = None, acabamento: Optional[str] = None,
+    preco_min: Optional[float] = None, preco_max: Optional[float] = None,
+    campos: Optional[str] = None, formato: str = "completo",
+    limite: Optional[int] = None, cursor: Optional[str] = None,
+):
+    """Lista produtos ativos com filtros, projecao (`campos=marca,hex_code`) e paginacao.
+
+    Com `limite` responde uma pagina: {"itens": [...], "proximo_cursor": ...}
+    (passe o cursor de volta para a pagina seguinte). Sem `limite` devolve
+    todos os produtos como antes, em streaming pagina a pagina.
+    `formato=compacto` troca a lista de objetos por {"colunas", "linhas"}.
+    """
+    if formato not in ("completo", "compacto"):
+        raise HTTPException(status_code=400, detail="Formato invalido. Use completo ou compacto")
+    if limite is not None and not 1 <= limite <= PRODUCTS_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"Limite deve estar entre 1 e {PRODUCTS_PAGE_SIZE}")
     try:
-        url = f"{SUPABASE_URL}/rest/v1/produtos?select=*&ativo=eq.true"
-        if tipo: url += f"&tipo=eq.{tipo}"
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, headers=get_supabase_headers())
-            return resp.json()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
+        columns = parse_columns(campos)
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    compact = formato == "compacto"
+
+    def shape(rows, columns):
+        if compact:
+            return [[row.get(c) for c in columns] for row in rows]
+        if "id" in columns:
+            return rows
+        return [{c: row.get(c) for c in columns} for row in rows]
+
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        rows, last = [], None
+    else:
+        params = product_params(columns, tipo, marca, acabamento, preco_min, preco_max)
+        try:
+            # A primeira pagina vem antes da resposta para que falhas do Supabase virem 500
+            rows, last = await fetch_page(supabase, params, limite or PRODUCTS_PAGE_SIZE, after)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
+
+    if columns is None:
+        # Sem projecao: colunas de acordo com o que o Supabase devolveu
+        columns = tuple(rows[0]) if rows else ()
+    if limite is not None:
+        page = {"colunas": list(columns), "linhas": shape(rows, columns)} if compact else {"itens": shape(rows, columns)}
+        return {**page, "proximo_cursor": encode_cursor(last) if last is not None else None}
+
+    async def stream():
+        yield f'{{"colunas": {json.dumps(list(columns))}, "linhas": [' if compact else "["
+        first = True
+        pages = [rows]
+        next_after = last
+        while pages:
+            for item in shape(pages.pop(), columns):
+                yield ("" if first else ",") + json.dumps(item)
+                first = False
+            if next_after is not None:
+                try:
+                    page, next_after = await fetch_page(supabase, params, PRODUCTS_PAGE_SIZE, next_after)
+                except Exception as e:
+                    # Status ja enviado: o JSON fica truncado e o cliente percebe o erro
+                    logger.exception("Erro ao listar produtos: %s", e)
+                    return
+                pages.append(page)
+        yield "]}" if compact else "]"
+
+    return StreamingResponse(stream(), media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
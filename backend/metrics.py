@@ -0,0 +1,268 @@
+"""Metricas no formato texto do Prometheus (sem dependencias) e tempos por etapa.
+
+Contadores, gauges e histogramas com labels ficam num registro global e
+sao expostos em GET /metrics. As etapas de cada requisicao (upload,
+decode, deteccao, catalogo, ranking, gemini...) alimentam o histograma
+`skin_stage_seconds` e, quando habilitado, o header `Server-Timing`.
+"""
+import bisect
+import contextvars
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels_text(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Gauge com valor definido pelo codigo ou lido na hora da coleta (`set_function`)."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._function = None
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn):
+        """`fn()` retorna um numero ou, com labels, um dict {tupla_de_labels: numero}."""
+        self._function = fn
+
+    def _samples(self):
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                return []
+            values = value if isinstance(value, dict) else {(): value}
+            with self._lock:
+                self._values = {tuple(str(v) for v in k): val for k, val in values.items() if val is not None}
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, n)) for key, (counts, total, n) in self._values.items())
+        lines = []
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            labels = _labels_text(self.labelnames, key)
+            for bound, count in zip(self.buckets + (math.inf,), counts + [n - sum(counts)]):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("skin_stage_seconds", "Duracao de cada etapa do processamento", ("etapa",))
+HTTP_REQUESTS = REGISTRY.counter("skin_http_requests_total", "Requisicoes HTTP por rota e status", ("metodo", "rota", "status"))
+HTTP_SECONDS = REGISTRY.histogram("skin_http_request_seconds", "Latencia das requisicoes HTTP", ("metodo", "rota"))
+HTTP_IN_FLIGHT = REGISTRY.gauge("skin_http_in_flight", "Requisicoes HTTP em andamento")
+LOG_ERRORS = REGISTRY.counter("skin_log_errors_total", "Erros e avisos registrados no log", ("logger", "nivel"))
+
+# Etapas da requisicao atual (dict compartilhado com as tarefas filhas)
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def record_stage(name, seconds):
+    STAGE_SECONDS.observe(seconds, etapa=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def record_stages(timings):
+    for name, seconds in timings.items():
+        record_stage(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def server_timing_header(timings, total):
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latencia/status por rota, requisicoes em andamento e Server-Timing.
+
+    Usa o template da rota (ex: /jobs/{job_id}) como label para nao
+    explodir a cardinalidade. O recebimento do corpo (upload) vira a etapa
+    "recebimento". Com `server_timing`, as etapas ja concluidas quando os
+    headers saem vao no header `Server-Timing`.
+    """
+
+    def __init__(self, app, server_timing=False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = {"code": 500}
+        body = {"bytes": 0, "done": False}
+        HTTP_IN_FLIGHT.inc()
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request" and not body["done"]:
+                body["bytes"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    body["done"] = True
+                    if body["bytes"]:
+                        record_stage("recebimento", time.perf_counter() - start)
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if self.server_timing:
+                    header = server_timing_header(timings, time.perf_counter() - start)
+                    message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", header.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            _request_timings.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "desconhecida"
+            elapsed = time.perf_counter() - start
+            HTTP_SECONDS.observe(elapsed, metodo=scope["method"], rota=path)
+            HTTP_REQUESTS.inc(metodo=scope["method"], rota=path, status=status["code"])
+
+
+class ErrorCountingHandler(logging.Handler):
+    """Conta no Prometheus cada registro de log WARNING ou acima."""
+
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+
+    def emit(self, record):
+        LOG_ERRORS.inc(logger=record.name, nivel=record.levelname.lower())
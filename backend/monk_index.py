@@ -0,0 +1,230 @@
+"""Indice pre-calculado para classificar tom Monk e subtom a partir de uma cor RGB.
+
+O cubo RGB e quantizado em celulas (64^3 por padrao, 4 niveis por canal).
+Para cada celula guardamos os tons Monk que podem ser o mais proximo de
+alguma cor da celula (um ou, na fronteira, dois candidatos comparados na
+hora) e a classe de subtom quando ela e igual para TODAS as cores da
+celula. O que nao cabe nisso fica marcado como ambiguo e cai no calculo
+exato, entao o resultado e identico ao loop original.
+
+Gerar o arquivo para distribuir junto da API:
+    python -m monk_index monk_lut.npz
+"""
+import colorsys
+import math
+import sys
+import threading
+
+import numpy as np
+
+UNDERTONE_CLASSES = ("quente", "frio", "neutro", "oliva")
+_WARM, _COOL, _NEUTRAL, _OLIVE = range(4)
+AMBIGUOUS = 255
+
+
+def undertone_class(r: int, g: int, b: int) -> int:
+    """Classe de subtom exata (mesmas regras de determine_undertone)."""
+    s = int(colorsys.rgb_to_hls(r / 255.0, g / 255.0, b / 255.0)[2] * 100)
+    if r > b and (r - b) > 15:
+        undertone = _WARM
+    elif b > r and (b - r) > 15:
+        undertone = _COOL
+    else:
+        undertone = _NEUTRAL
+    if g > (r + b) / 2 * 0.9 and g < (r + b) / 2 * 1.1 and s < 50:
+        if undertone in (_WARM, _NEUTRAL):
+            undertone = _OLIVE
+    return undertone
+
+
+def _undertone_classes(r, g, b):
+    """Versao vetorizada de undertone_class para arrays inteiros.
+
+    Retorna (classes, ambiguo): `ambiguo` marca cores em que a saturacao fica
+    colada no limiar de 50%, onde o arredondamento do colorsys pode divergir.
+    """
+    rf, gf, bf = r / 255.0, g / 255.0, b / 255.0
+    maxc = np.maximum(np.maximum(rf, gf), bf)
+    minc = np.minimum(np.minimum(rf, gf), bf)
+    sumc = maxc + minc
+    rangec = maxc - minc
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.where(sumc / 2.0 <= 0.5, rangec / sumc, rangec / (2.0 - maxc - minc))
+    s = np.where(rangec == 0, 0.0, s) * 100
+    classes = np.full(r.shape, _NEUTRAL, dtype=np.uint8)
+    classes[(r > b) & ((r - b) > 15)] = _WARM
+    classes[(b > r) & ((b - r) > 15)] = _COOL
+    half = (r + b) / 2
+    olive = (g > half * 0.9) & (g < half * 1.1) & (s < 50) & (classes != _COOL)
+    classes[olive] = _OLIVE
+    ambiguous = np.abs(s - 50) < 1e-6
+    return classes, ambiguous
+
+
+def _nearest_tones(rgb, tones):
+    """Indice do tom mais proximo (distancia euclidiana, empate -> primeiro da lista).
+
+    Usa |x - t|^2 = |x|^2 - 2 x.t + |t|^2; o termo |x|^2 nao muda o argmin e,
+    em inteiros, a ordem (inclusive empates) e exatamente a do calculo direto.
+    """
+    tones = tones.astype(np.float64)
+    # Inteiros < 2^53: o produto em float64 (BLAS) e exato
+    return np.argmin((tones * tones).sum(axis=1) - 2 * (rgb.astype(np.float64) @ tones.T), axis=1)
+
+
+class MonkIndex:
+    def __init__(self, tone_rgbs, bits=6):
+        self.tones = np.asarray(tone_rgbs, dtype=np.int64)
+        self.bits = bits
+        self.shift = 8 - bits
+        self.tone_lut = None
+        self.tone_alt_lut = None
+        self.undertone_lut = None
+        self._tone_flat = None
+        self._tone_alt_flat = None
+        self._undertone_flat = None
+        self._tone_list = self.tones.tolist()
+        self._lock = threading.Lock()
+
+    # ---------- construcao ----------
+    def build(self):
+        cells = 1 << self.bits
+        step = 1 << self.shift
+        tone_lut = np.empty((cells, cells, cells), dtype=np.uint8)
+        tone_alt_lut = np.empty((cells, cells, cells), dtype=np.uint8)
+        undertone_lut = np.empty((cells, cells, cells), dtype=np.uint8)
+        gb = np.arange(256, dtype=np.int64)
+        g, b = np.meshgrid(gb, gb, indexing="ij")
+        for ci in range(cells):
+            # Uma fatia de `step` valores de R com todos os G e B
+            r = np.arange(ci * step, (ci + 1) * step, dtype=np.int64)[:, None, None]
+            rr, gg, bb = np.broadcast_arrays(r, g[None], b[None])
+            rgb = np.stack([rr.ravel(), gg.ravel(), bb.ravel()], axis=1)
+            tones = _nearest_tones(rgb, self.tones).astype(np.uint8).reshape(step, cells, step, cells, step)
+            under, ambiguous = _undertone_classes(rr.ravel(), gg.ravel(), bb.ravel())
+            under = np.where(ambiguous, AMBIGUOUS, under).astype(np.uint8).reshape(step, cells, step, cells, step)
+            tone_lut[ci], tone_alt_lut[ci] = self._reduce_cells(tones, candidates=2)
+            undertone_lut[ci], _ = self._reduce_cells(under)
+        self._set_luts(tone_lut, tone_alt_lut, undertone_lut)
+        return self
+
+    def _set_luts(self, tone_lut, tone_alt_lut, undertone_lut):
+        # Copias em bytes para a consulta escalar (indexar bytes e bem mais barato que ndarray)
+        self._tone_flat = tone_lut.tobytes()
+        self._tone_alt_flat = tone_alt_lut.tobytes()
+        self._undertone_flat = undertone_lut.tobytes()
+        self.tone_lut, self.tone_alt_lut, self.undertone_lut = tone_lut, tone_alt_lut, undertone_lut
+
+    @staticmethod
+    def _reduce_cells(values, candidates=1):
+        """(sr, G, sg, B, sb) -> (G, B) com (menor, maior) valor de cada celula.
+
+        Celulas com mais de `candidates` valores distintos viram AMBIGUOUS.
+        """
+        cells = values.transpose(1, 3, 0, 2, 4).reshape(values.shape[1], values.shape[3], -1)
+        lo, hi = cells.min(axis=2), cells.max(axis=2)
+        if candidates == 1:
+            ok = lo == hi
+        else:
+            ok = ((cells == lo[..., None]) | (cells == hi[..., None])).all(axis=2)
+        return np.where(ok, lo, AMBIGUOUS).astype(np.uint8), hi.astype(np.uint8)
+
+    def save(self, path):
+        self.ensure_built()
+        np.savez_compressed(path, tones=self.tones, bits=self.bits, tone_lut=self.tone_lut,
+                            tone_alt_lut=self.tone_alt_lut, undertone_lut=self.undertone_lut)
+
+    def load(self, path):
+        """Carrega um indice salvo; levanta ValueError se foi gerado para outra escala."""
+        data = np.load(path)
+        if int(data["bits"]) != self.bits or not np.array_equal(data["tones"], self.tones):
+            raise ValueError(f"Indice em {path} nao corresponde a escala Monk atual")
+        self._set_luts(data["tone_lut"], data["tone_alt_lut"], data["undertone_lut"])
+        return self
+
+    def ensure_built(self, path=None):
+        """Carrega de `path` (se valido) ou monta o indice; seguro entre threads."""
+        if self.tone_lut is not None:
+            return self
+        with self._lock:
+            if self.tone_lut is None:
+                try:
+                    if not path:
+                        raise FileNotFoundError
+                    self.load(path)
+                except (OSError, ValueError, KeyError):
+                    self.build()
+        return self
+
+    # ---------- consulta ----------
+    def _sq_distance(self, tone, r, g, b):
+        tr, tg, tb = self._tone_list[tone]
+        return (r - tr) ** 2 + (g - tg) ** 2 + (b - tb) ** 2
+
+    def classify(self, r: int, g: int, b: int):
+        """Retorna (indice_tom, distancia_ao_tom, classe_subtom) para uma cor.
+
+        Enquanto o indice nao estiver pronto, calcula tudo de forma exata.
+        """
+        if self._tone_flat is None:
+            tone = int(_nearest_tones(np.array([[r, g, b]], dtype=np.int64), self.tones)[0])
+            undertone = undertone_class(r, g, b)
+        else:
+            shift, bits = self.shift, self.bits
+            cell = (((r >> shift) << bits | (g >> shift)) << bits) | (b >> shift)
+            tone = self._tone_flat[cell]
+            if tone == AMBIGUOUS:
+                tone = int(_nearest_tones(np.array([[r, g, b]], dtype=np.int64), self.tones)[0])
+            else:
+                alt = self._tone_alt_flat[cell]
+                # Fronteira entre dois tons: o de menor indice vence empates, como no loop
+                if alt != tone and self._sq_distance(alt, r, g, b) < self._sq_distance(tone, r, g, b):
+                    tone = alt
+            undertone = self._undertone_flat[cell]
+            if undertone == AMBIGUOUS:
+                undertone = undertone_class(r, g, b)
+        # np.float64 (e nao float) para que round() arredonde como no calculo original
+        distance = np.float64(math.sqrt(self._sq_distance(tone, r, g, b)))
+        return tone, distance, undertone
+
+    def classify_batch(self, rgb):
+        """Versao em lote: `rgb` (N, 3) -> (indices_tom, confiancas, classes_subtom)."""
+        self.ensure_built()
+        rgb = np.asarray(rgb, dtype=np.int64).reshape(-1, 3)
+        q = rgb >> self.shift
+        tones = self.tone_lut[q[:, 0], q[:, 1], q[:, 2]].astype(np.intp)
+        alts = self.tone_alt_lut[q[:, 0], q[:, 1], q[:, 2]].astype(np.intp)
+        undertones = self.undertone_lut[q[:, 0], q[:, 1], q[:, 2]].astype(np.intp)
+        miss = tones == AMBIGUOUS
+        if miss.any():
+            tones[miss] = alts[miss] = _nearest_tones(rgb[miss], self.tones)
+        d_tone = ((rgb - self.tones[tones]) ** 2).sum(axis=1)
+        d_alt = ((rgb - self.tones[alts]) ** 2).sum(axis=1)
+        tones = np.where(d_alt < d_tone, alts, tones)
+        miss = undertones == AMBIGUOUS
+        if miss.any():
+            undertones[miss] = [undertone_class(*c) for c in rgb[miss].tolist()]
+        diff = rgb - self.tones[tones]
+        distances = np.sqrt((diff * diff).sum(axis=1))
+        confidences = np.round(np.maximum(0, 100 - (distances / 441.67 * 100)), 1)
+        return tones, confidences, undertones
+
+    def stats(self):
+        if self.tone_lut is None:
+            return {"construido": False}
+        return {
+            "construido": True,
+            "celulas": int(self.tone_lut.size),
+            "celulas_fronteira_tom": int(((self.tone_lut != AMBIGUOUS) & (self.tone_lut != self.tone_alt_lut)).sum()),
+            "celulas_ambiguas_tom": int((self.tone_lut == AMBIGUOUS).sum()),
+            "celulas_ambiguas_subtom": int((self.undertone_lut == AMBIGUOUS).sum()),
+            "bytes": int(self.tone_lut.nbytes + self.tone_alt_lut.nbytes + self.undertone_lut.nbytes),
+        }
+
+
+if __name__ == "__main__":
+    from main import MONK_SKIN_TONES
+
+    output = sys.argv[1] if len(sys.argv) > 1 else "monk_lut.npz"
+    MonkIndex([t["rgb"] for t in MONK_SKIN_TONES]).build().save(output)
+    print(f"Indice salvo em {output}")
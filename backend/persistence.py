@@ -0,0 +1,350 @@
+"""Gravacao write-behind das analises e recomendacoes no Supabase.
+
+Os endpoints so enfileiram (a resposta nao espera o Supabase); uma task em
+segundo plano junta os registros e grava em lote, um POST por tabela,
+quando o lote enche ou a cada `flush_interval`. A fila tem tamanho
+maximo: cheia, o registro e descartado e contado. Falhas transitorias sao
+repetidas com backoff; esgotadas as tentativas (ou de cara, em erros que
+nao sao de dado como 401/403/404), o lote vai para arquivos JSONL em `spill_dir` (sem diretorio, e descartado) e a gravacao direta fica
+suspensa por `probe_interval`, com os arquivos reenviados quando o upstream
+volta. Os ids sao gerados aqui (uuid4), entao reenviar um lote que ja tinha
+entrado nao duplica linhas (`resolution=ignore-duplicates`). No shutdown a
+fila e esvaziada por ate `drain_timeout` segundos; o que sobrar vai para o
+disco.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from collections import deque
+
+import httpx
+
+from color_science import srgb_to_lab
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+# Erros de linha (conflito, dado invalido): o lote e dividido para isolar a linha. Um 400 so conta
+# se for violacao de restricao do Postgres (codigo 23xxx); outros 400 (ex: PGRST204, coluna
+# inexistente) e 401/403/404 (credencial, RLS, tabela) valem para o lote todo: upstream falhou
+REJECT_STATUSES = {409, 422}
+# Subtons aceitos pela coluna analises.subtom; os demais vao como "neutro" (o original fica em metadata)
+SCHEMA_UNDERTONES = ("quente", "frio", "neutro")
+_PREFER = "return=minimal,resolution=ignore-duplicates"
+
+PERSIST_ROWS = REGISTRY.counter("skin_persist_rows_total", "Linhas gravadas pela fila write-behind", ("tabela",))
+PERSIST_DROPPED = REGISTRY.counter("skin_persist_dropped_total", "Analises ou linhas descartadas pela fila write-behind", ("motivo",))
+PERSIST_SPILLED = REGISTRY.counter("skin_persist_spilled_total", "Analises gravadas em disco com o upstream fora")
+PERSIST_FLUSH_SECONDS = REGISTRY.histogram("skin_persist_flush_seconds", "Duracao da gravacao de cada lote")
+
+
+def analysis_record(rgb, undertone, monk_tone, sampling=None, **metadata):
+    """Linha de `analises` (id uuid4 gerado aqui) para a cor `rgb` ja classificada.
+
+    `sampling` e o resultado de skin_sampling.sample_regions, quando houver;
+    `metadata` vai para a coluna JSONB.
+    """
+    lab_l, lab_a, lab_b = (round(float(v), 4) for v in srgb_to_lab(rgb))
+    regions = (sampling or {}).get("regioes", {})
+
+    def region_hex(*names):
+        colors = [regions[n] for n in names if regions.get(n) and regions[n]["rgb"]]
+        if not colors:
+            return None
+        r, g, b = max(colors, key=lambda region: region["qualidade"])["rgb"]
+        return f"#{int(r):02x}{int(g):02x}{int(b):02x}"
+
+    if undertone not in SCHEMA_UNDERTONES:
+        metadata["subtom_original"] = undertone
+    r, g, b = rgb
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": None,
+        "imagem_url": None,
+        "hex_pele": f"#{int(r):02x}{int(g):02x}{int(b):02x}",
+        "lab_l": lab_l,
+        "lab_a": lab_a,
+        "lab_b": lab_b,
+        "subtom": undertone if undertone in SCHEMA_UNDERTONES else "neutro",
+        "monk_scale": monk_tone.get("tom"),
+        "roi_mandibula_hex": region_hex("mandibula"),
+        "roi_bochecha_hex": region_hex("bochecha_esquerda", "bochecha_direita"),
+        "roi_pescoco_hex": region_hex("pescoco"),
+        "metodo_calibracao": "nenhum",
+        "qualidade_imagem": round(sampling["qualidade"] * 100, 2) if sampling else None,
+        "metadata": metadata,
+    }
+
+
+def recommendation_records(analysis_id, products, motivo):
+    """Linhas de `recomendacoes` para os produtos ranqueados (formato das respostas da API)."""
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "analise_id": analysis_id,
+            "produto_id": p.get("id"),
+            "delta_e": p.get("delta_e"),
+            "ranking": position,
+            "motivo": f"{motivo} (match {p.get('match_score')})",
+        }
+        for position, p in enumerate(products, start=1)
+        if p.get("id")
+    ]
+
+
+def _row_rejected(resp):
+    """True se o erro e de alguma linha do lote (e nao do lote ou do upstream)."""
+    if resp.status_code in REJECT_STATUSES:
+        return True
+    if resp.status_code != 400:
+        return False
+    try:
+        code = resp.json().get("code")
+    except (ValueError, AttributeError):
+        return False
+    return isinstance(code, str) and code.startswith("23")
+
+
+class PersistenceQueue:
+    """Fila write-behind limitada; `enqueue` nunca bloqueia nem faz I/O."""
+
+    def __init__(self, client, batch_size=200, flush_interval=2.0, max_pending=5000, max_retries=3, backoff=0.5,
+                 probe_interval=30.0, spill_dir=None, spill_max_bytes=256 * 1024 * 1024, drain_timeout=10.0):
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.probe_interval = probe_interval
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self.drain_timeout = drain_timeout
+        self._pending = deque()
+        self._in_flight = []
+        self._rejected_ids = set()
+        self._wake = asyncio.Event()
+        self._task = None
+        self._closing = False
+        self._down_until = 0.0
+        self._spill_bytes = 0
+        self.enqueued = 0
+        self.written = {"analises": 0, "recomendacoes": 0}
+        self.batches = 0
+        self.retried = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.spilled = 0
+        self.replayed = 0
+
+    def enqueue(self, analysis, recommendations=()):
+        """Enfileira uma analise e suas recomendacoes; False se a fila estiver cheia (descartada)."""
+        if self._closing or len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            PERSIST_DROPPED.inc(motivo="fila_cheia")
+            return False
+        self._pending.append({"analise": analysis, "recomendacoes": list(recommendations)})
+        self.enqueued += 1
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def start(self):
+        if self._task is None:
+            if self.spill_dir:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                self._spill_bytes = sum(size for _, size in self._spill_files())
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Grava o que estiver na fila (ate `drain_timeout`) e manda o restante para o disco."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._task, self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Fila de gravacao nao esvaziou em %.1fs; restante vai para o disco", self.drain_timeout)
+        except Exception as e:
+            logger.exception("Erro ao esvaziar a fila de gravacao: %s", e)
+        self._task = None
+        leftover = self._in_flight + list(self._pending)
+        self._in_flight = []
+        self._pending.clear()
+        await self._spill(leftover)
+
+    # ---------- worker ----------
+    async def _run(self):
+        while True:
+            if not self._closing and len(self._pending) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                try:
+                    await self._flush(batch)
+                except Exception as e:
+                    logger.exception("Erro ao gravar lote de %d analises: %s", len(batch), e)
+                    self._in_flight = []
+                    self.dropped += len(batch)
+                    PERSIST_DROPPED.inc(len(batch), motivo="erro")
+            if self._closing:
+                return
+            try:
+                await self._replay_spilled()
+            except Exception as e:
+                logger.exception("Erro ao reenviar analises gravadas em disco: %s", e)
+
+    async def _flush(self, batch):
+        if time.monotonic() < self._down_until:
+            await self._spill(batch)
+            return
+        # Se a task for cancelada no meio do envio, stop() manda o lote em voo para o disco
+        self._in_flight = batch
+        start = time.perf_counter()
+        ok = await self._write(batch)
+        self._in_flight = []
+        if ok:
+            self.batches += 1
+            PERSIST_FLUSH_SECONDS.observe(time.perf_counter() - start)
+        else:
+            self._down_until = time.monotonic() + self.probe_interval
+            await self._spill(batch)
+
+    async def _write(self, entries):
+        """Grava as analises e depois as recomendacoes (chave estrangeira); False se o upstream falhou."""
+        self._rejected_ids.clear()
+        if not await self._insert("analises", [e["analise"] for e in entries]):
+            return False
+        # Recomendacoes de analises recusadas falhariam pela chave estrangeira
+        recommendations = [r for e in entries if e["analise"]["id"] not in self._rejected_ids for r in e["recomendacoes"]]
+        return not recommendations or await self._insert("recomendacoes", recommendations)
+
+    async def _insert(self, table, rows):
+        """Insert em lote com retry; linhas recusadas (ver _row_rejected) sao isoladas e descartadas."""
+        error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                resp = await self.client.post(f"/rest/v1/{table}", json=rows, headers={"Prefer": _PREFER})
+            except httpx.HTTPError as e:
+                error = repr(e)
+            else:
+                if resp.status_code < 300:
+                    self.written[table] += len(rows)
+                    PERSIST_ROWS.inc(len(rows), tabela=table)
+                    return True
+                if _row_rejected(resp):
+                    return await self._reject(table, rows, resp)
+                error = f"HTTP {resp.status_code}: {resp.text[:200]}"
+                if resp.status_code not in RETRY_STATUSES:
+                    # Repetir nao resolve; o lote inteiro vai para o disco
+                    break
+            if attempt < self.max_retries:
+                self.retried += 1
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+        logger.warning("Falha ao gravar %d linhas em %s: %s", len(rows), table, error)
+        return False
+
+    async def _reject(self, table, rows, resp):
+        # Uma linha invalida derruba o lote inteiro no PostgREST: divide ao meio ate isola-la
+        if len(rows) > 1:
+            mid = len(rows) // 2
+            return await self._insert(table, rows[:mid]) and await self._insert(table, rows[mid:])
+        logger.error("Linha recusada em %s (HTTP %d): %s", table, resp.status_code, resp.text[:200])
+        self.rejected += 1
+        self._rejected_ids.add(rows[0].get("id"))
+        PERSIST_DROPPED.inc(motivo="recusada")
+        return True
+
+    # ---------- disco ----------
+    def _spill_files(self):
+        """(caminho, bytes) dos arquivos pendentes, do mais antigo para o mais novo."""
+        try:
+            names = sorted(n for n in os.listdir(self.spill_dir) if n.endswith(".jsonl"))
+        except OSError:
+            return []
+        files = []
+        for name in names:
+            path = os.path.join(self.spill_dir, name)
+            try:
+                files.append((path, os.path.getsize(path)))
+            except OSError:
+                pass
+        return files
+
+    def _write_spill(self, entries):
+        data = "".join(json.dumps(e) + "\n" for e in entries).encode("utf-8")
+        if self._spill_bytes + len(data) > self.spill_max_bytes:
+            return False
+        path = os.path.join(self.spill_dir, f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.jsonl")
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._spill_bytes += len(data)
+        return True
+
+    async def _spill(self, entries):
+        if not entries:
+            return
+        reason = "upstream_fora"
+        if self.spill_dir:
+            try:
+                if await asyncio.to_thread(self._write_spill, entries):
+                    self.spilled += len(entries)
+                    PERSIST_SPILLED.inc(len(entries))
+                    return
+                reason = "disco_cheio"
+            except OSError as e:
+                logger.exception("Erro ao gravar analises em disco: %s", e)
+                reason = "erro_disco"
+        logger.warning("%d analises descartadas (%s)", len(entries), reason)
+        self.dropped += len(entries)
+        PERSIST_DROPPED.inc(len(entries), motivo=reason)
+
+    def _read_spill(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    async def _replay_spilled(self):
+        """Reenvia o arquivo mais antigo do disco quando o upstream esta de volta e a fila esta vazia."""
+        if not self.spill_dir or self._pending or time.monotonic() < self._down_until:
+            return
+        files = await asyncio.to_thread(self._spill_files)
+        if not files:
+            return
+        path, size = files[0]
+        entries = await asyncio.to_thread(self._read_spill, path)
+        for i in range(0, len(entries), self.batch_size):
+            if self._closing or not await self._write(entries[i:i + self.batch_size]):
+                # O arquivo fica inteiro; o que ja entrou e ignorado no proximo reenvio (mesmos ids)
+                if not self._closing:
+                    self._down_until = time.monotonic() + self.probe_interval
+                return
+        await asyncio.to_thread(os.remove, path)
+        self._spill_bytes = max(0, self._spill_bytes - size)
+        self.replayed += len(entries)
+
+    def stats(self):
+        return {
+            "pendentes": len(self._pending),
+            "max_pendentes": self.max_pending,
+            "enfileiradas": self.enqueued,
+            "gravadas": dict(self.written),
+            "lotes": self.batches,
+            "retries": self.retried,
+            "descartadas": self.dropped,
+            "recusadas": self.rejected,
+            "em_disco": {"gravadas": self.spilled, "reenviadas": self.replayed, "bytes": self._spill_bytes} if self.spill_dir else None,
+            "upstream_fora": time.monotonic() < self._down_until,
+        }
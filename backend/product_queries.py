@@ -0,0 +1,97 @@
+"""Consultas de produtos no PostgREST: projecao, filtros e paginacao por chave (keyset).
+
+A paginacao usa `id > ultimo_id` com `order=id.asc` em vez de offset, entao
+o custo de cada pagina nao cresce com a posicao e nenhuma linha e pulada
+ou repetida quando o catalogo muda entre uma pagina e outra.
+"""
+import base64
+import binascii
+
+# Colunas que podem ser pedidas em /products?campos=
+PRODUCT_COLUMNS = (
+    "id", "marca", "linha", "cor_nome", "hex_code", "lab_l", "lab_a", "lab_b", "acabamento", "tipo",
+    "cobertura", "subtom", "monk_tone_min", "monk_tone_max", "preco", "onde_comprar", "url_compra",
+    "imagem_url", "categoria", "ativo", "created_at", "updated_at",
+)
+
+# Colunas usadas pelo matching e pelas respostas de /analyze*
+CATALOG_COLUMNS = (
+    "id", "marca", "linha", "cor_nome", "hex_code", "lab_l", "lab_a", "lab_b", "acabamento", "tipo",
+    "cobertura", "subtom", "preco", "onde_comprar",
+)
+
+
+def parse_columns(campos):
+    """'marca,hex_code' -> ('marca', 'hex_code'); None (todas) sem campos.
+
+    Levanta ValueError com colunas desconhecidas.
+    """
+    if not campos:
+        return None
+    columns = tuple(dict.fromkeys(c.strip() for c in campos.split(",") if c.strip()))
+    unknown = [c for c in columns if c not in PRODUCT_COLUMNS]
+    if unknown or not columns:
+        raise ValueError(f"Campos invalidos: {', '.join(unknown) or campos}")
+    return columns
+
+
+def encode_cursor(last_id) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        value = base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        value = None
+    if not value:
+        raise ValueError("Cursor invalido")
+    return value
+
+
+def product_params(columns, tipo=None, marca=None, acabamento=None, preco_min=None, preco_max=None):
+    """Parametros PostgREST (lista de pares; `preco` pode aparecer duas vezes).
+
+    `columns=None` seleciona todas as colunas.
+    """
+    if columns is None:
+        select = "*"
+    else:
+        # O id entra sempre: e a chave da paginacao
+        select = ",".join(columns if "id" in columns else ("id",) + tuple(columns))
+    params = [("select", select), ("ativo", "eq.true")]
+    for column, value in (("tipo", tipo), ("marca", marca), ("acabamento", acabamento)):
+        if value:
+            params.append((column, f"eq.{value}"))
+    if preco_min is not None:
+        params.append(("preco", f"gte.{preco_min}"))
+    if preco_max is not None:
+        params.append(("preco", f"lte.{preco_max}"))
+    return params
+
+
+async def fetch_page(client, params, limit, after=None):
+    """Uma pagina ordenada por id; retorna (linhas, id_da_ultima ou None se acabou).
+
+    Pede uma linha a mais so para saber se existe proxima pagina.
+    """
+    page_params = list(params) + [("order", "id.asc"), ("limit", str(limit + 1))]
+    if after is not None:
+        page_params.append(("id", f"gt.{after}"))
+    resp = await client.get("/rest/v1/produtos", params=page_params)
+    resp.raise_for_status()
+    rows = resp.json()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1]["id"]
+    return rows, None
+
+
+async def iter_pages(client, params, page_size, after=None):
+    """Percorre todas as paginas; so uma pagina fica em memoria por vez."""
+    while True:
+        rows, after = await fetch_page(client, params, page_size, after)
+        if rows:
+            yield rows
+        if after is None:
+            return
@@ -0,0 +1,92 @@
+"""Profiler por amostragem que pode ser ligado e desligado com a API rodando.
+
+Uma thread le a pilha de todas as threads do processo (`sys._current_frames`)
+a cada intervalo e conta as pilhas iguais. O resultado sai no formato
+"collapsed" (uma pilha por linha com a contagem no fim), aceito pelo
+flamegraph.pl e pelo speedscope. So enxerga as threads deste processo: com
+VISION_EXECUTOR=process o trabalho dos workers de visao nao aparece.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.01, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=None):
+        """Zera as contagens e comeca a amostrar; False se ja estava rodando."""
+        if self.running:
+            return False
+        if interval:
+            self.interval = interval
+        with self._lock:
+            self._counts.clear()
+            self.samples = 0
+        self._stop.clear()
+        self.started_at, self.stopped_at = time.time(), None
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.stopped_at = time.time()
+        return True
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None and len(labels) < self.max_depth:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)))
+                stacks.append(";".join(reversed(labels)))
+            with self._lock:
+                self._counts.update(stacks)
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        with self._lock:
+            items = self._counts.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def stats(self):
+        end = self.stopped_at or time.time()
+        return {
+            "ativo": self.running,
+            "intervalo_ms": round(self.interval * 1000, 1),
+            "amostras": self.samples,
+            "pilhas_distintas": len(self._counts),
+            "duracao_segundos": round(end - self.started_at, 1) if self.started_at else None,
+        }
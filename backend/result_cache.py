@@ -0,0 +1,208 @@
+"""Cache de resultados por hash do conteudo enviado.
+
+Dois niveis: LRU em memoria limitado por bytes e, opcionalmente, disco
+(um arquivo JSON por entrada). Cada namespace (ex: "rgb", "makeup") tem
+seu proprio TTL. Requisicoes concorrentes com a mesma chave sao
+coalescidas: so a primeira executa o calculo e as demais aguardam o mesmo
+resultado.
+"""
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def content_key(data: bytes, *extra: str) -> str:
+    """sha256 dos bytes enviados (+ textos extras, ex: o prompt)."""
+    h = hashlib.sha256(data)
+    for part in extra:
+        h.update(b"\0")
+        h.update(part.encode("utf-8"))
+    return h.hexdigest()
+
+
+class _NamespaceStats:
+    def __init__(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def as_dict(self):
+        total = self.hits + self.disk_hits + self.misses
+        return {
+            "hits_memoria": self.hits,
+            "hits_disco": self.disk_hits,
+            "misses": self.misses,
+            "coalescidas": self.coalesced,
+            "hit_rate": round((self.hits + self.disk_hits) / total, 4) if total else None,
+        }
+
+
+class ResultCache:
+    def __init__(self, ttls, max_bytes=64 * 1024 * 1024, disk_dir=None, disk_max_bytes=1024 * 1024 * 1024):
+        self.ttls = dict(ttls)
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # (namespace, key) -> (expira_em, tamanho, valor)
+        self._bytes = 0
+        self._disk_written = 0
+        self._inflight = {}
+        self._stats = {ns: _NamespaceStats() for ns in self.ttls}
+
+    # ---------- memoria ----------
+    def _get_memory(self, ns, key):
+        entry = self._entries.get((ns, key))
+        if entry is None:
+            return _MISSING
+        expires, size, value = entry
+        if expires < time.time():
+            self._drop((ns, key))
+            return _MISSING
+        self._entries.move_to_end((ns, key))
+        return value
+
+    def _drop(self, item):
+        _, size, _ = self._entries.pop(item)
+        self._bytes -= size
+
+    def _set_memory(self, ns, key, value, expires, size):
+        if size > self.max_bytes:
+            return
+        if (ns, key) in self._entries:
+            self._drop((ns, key))
+        self._entries[(ns, key)] = (expires, size, value)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    # ---------- disco ----------
+    def _path(self, ns, key):
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, ns, name[:2], name + ".json")
+
+    def _read_disk(self, ns, key):
+        path = self._path(ns, key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return _MISSING
+        if entry["expira_em"] < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return _MISSING
+        return entry["expira_em"], entry["valor"]
+
+    def _write_disk(self, ns, key, value, expires):
+        path = self._path(ns, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"expira_em": expires, "valor": value}, f)
+        os.replace(tmp, path)
+        self._disk_written += os.path.getsize(path)
+        if self._disk_written > self.disk_max_bytes // 10:
+            self._disk_written = 0
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Remove expirados e, se preciso, os arquivos mais antigos ate caber no limite."""
+        files = []
+        now = time.time()
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        ttl_max = max(self.ttls.values(), default=0)
+        for mtime, size, path in sorted(files):
+            if total <= self.disk_max_bytes and mtime + ttl_max >= now:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    # ---------- API ----------
+    async def get(self, ns, key):
+        value = self._get_memory(ns, key)
+        if value is not _MISSING:
+            self._stats[ns].hits += 1
+            return value
+        if self.disk_dir:
+            entry = await asyncio.to_thread(self._read_disk, ns, key)
+            if entry is not _MISSING:
+                expires, value = entry
+                self._stats[ns].disk_hits += 1
+                self._set_memory(ns, key, value, expires, len(json.dumps(value)))
+                return value
+        return _MISSING
+
+    async def set(self, ns, key, value):
+        expires = time.time() + self.ttls[ns]
+        serialized_size = len(json.dumps(value))
+        self._set_memory(ns, key, value, expires, serialized_size)
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, ns, key, value, expires)
+            except OSError as e:
+                logger.warning("Erro ao gravar cache em disco: %s", e)
+
+    async def get_or_compute(self, ns, key, compute, cacheable=None):
+        """Retorna o valor em cache ou executa `compute()` uma unica vez por chave.
+
+        `compute` pode retornar um valor ou um awaitable. Valores para os quais
+        `cacheable(valor)` e falso sao devolvidos mas nao armazenados; excecoes
+        sao propagadas a todos os que aguardam e nada e armazenado.
+        """
+        value = await self.get(ns, key)
+        if value is not _MISSING:
+            return value
+        task = self._inflight.get((ns, key))
+        if task is not None:
+            self._stats[ns].coalesced += 1
+            return await asyncio.shield(task)
+        self._stats[ns].misses += 1
+
+        async def run():
+            try:
+                result = compute()
+                if inspect.isawaitable(result):
+                    result = await result
+                if cacheable is None or cacheable(result):
+                    await self.set(ns, key, result)
+                return result
+            finally:
+                self._inflight.pop((ns, key), None)
+
+        # A tarefa segue mesmo se o cliente original desconectar; outros podem estar aguardando
+        task = asyncio.ensure_future(run())
+        self._inflight[(ns, key)] = task
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "entradas_memoria": len(self._entries),
+            "bytes_memoria": self._bytes,
+            "max_bytes_memoria": self.max_bytes,
+            "disco": self.disk_dir,
+            "em_andamento": len(self._inflight),
+            "namespaces": {ns: {"ttl_segundos": self.ttls[ns], **st.as_dict()} for ns, st in self._stats.items()},
+        }
@@ -0,0 +1,51 @@
+"""Indice de vizinhos mais proximos (k-d tree) para catalogos grandes de tons.
+
+Usa o cKDTree do SciPy quando instalado; sem ele o catalogo continua na
+varredura linear. O indice so e usado para achar candidatos: o ranking
+final e sempre recalculado com as formulas originais, entao o resultado e
+identico ao da varredura completa.
+"""
+import hashlib
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+    KDTREE_AVAILABLE = True
+except ImportError:
+    cKDTree = None
+    KDTREE_AVAILABLE = False
+
+# Abaixo disso a varredura vetorizada e mais rapida que consultar a arvore
+INDEX_MIN_ROWS = 2048
+
+# Metricas com limite inferior conhecido em funcao da distancia no espaco indexado.
+# CIEDE2000 nao tem, entao segue na varredura linear.
+INDEX_SPACES = {"rgb": "rgb", "cie76": "lab", "cie94": "lab"}
+
+
+def fingerprint(points) -> str:
+    """Identifica o conteudo (e a ordem) das cores de um grupo."""
+    h = hashlib.sha1(np.ascontiguousarray(points).tobytes())
+    h.update(str(points.shape).encode())
+    return h.hexdigest()
+
+
+class ShadeIndex:
+    def __init__(self, points):
+        self.size = len(points)
+        self.tree = cKDTree(np.asarray(points, dtype=np.float64))
+
+    def nearest(self, queries, k):
+        """Distancias (M, k) aos k vizinhos mais proximos de cada consulta."""
+        dist, _ = self.tree.query(queries, k=k)
+        return np.asarray(dist).reshape(len(queries), -1)
+
+    def within(self, queries, radii):
+        """Posicoes (em ordem crescente) dentro do raio de cada consulta."""
+        found = self.tree.query_ball_point(queries, radii)
+        return [np.sort(np.asarray(ids, dtype=np.intp)) for ids in found]
+
+    def nbytes(self):
+        # Pontos + permutacao + nos (estimativa: ~ 2 nos por folha de 16 pontos)
+        return int(self.tree.data.nbytes + self.tree.indices.nbytes + (self.size // 16 + 1) * 2 * 96)
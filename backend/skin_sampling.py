@@ -0,0 +1,130 @@
+"""Amostragem da pele em varias regioes do rosto numa unica passada vetorizada.
+
+As regioes (bochechas, testa, mandibula e pescoco) sao retangulos relativos
+a caixa do rosto. O retangulo que envolve todas e amostrado uma vez, com
+passo, para caber no mesmo orcamento de pixels da amostragem de uma
+bochecha; a conversao HSV e a mascara de pele rodam uma vez sobre essa
+amostra e cada pixel recebe o rotulo da sua regiao. Um unico bincount gera
+os histogramas de todas as regioes e canais, e deles saem a media aparada
+(robusta a sombras e reflexos), o espalhamento e a cobertura de pele.
+"""
+import math
+
+import cv2
+import numpy as np
+
+# (nome, x0, x1, y0, y1) relativos a caixa do rosto; esquerda/direita na imagem
+REGIONS = (
+    ("testa", 0.30, 0.70, 0.06, 0.20),
+    ("bochecha_esquerda", 0.15, 0.36, 0.48, 0.70),
+    ("bochecha_direita", 0.64, 0.85, 0.48, 0.70),
+    ("mandibula", 0.32, 0.68, 0.88, 1.00),
+    ("pescoco", 0.35, 0.65, 1.10, 1.30),
+)
+# Regioes que formam a cor principal (o pescoco costuma ficar na sombra do queixo)
+FACE_REGIONS = ("testa", "bochecha_esquerda", "bochecha_direita", "mandibula")
+# Mesma faixa HSV de pele da amostragem da bochecha
+SKIN_LOWER = np.array([0, 20, 70], dtype=np.uint8)
+SKIN_UPPER = np.array([50, 255, 255], dtype=np.uint8)
+MIN_REGION_PIXELS = 25
+# Distancia RGB maxima entre uma regiao e a mediana das regioes do rosto
+MAX_REGION_DISTANCE = 48
+
+_BOUNDS = (min(r[1] for r in REGIONS), max(r[2] for r in REGIONS), min(r[3] for r in REGIONS), max(r[4] for r in REGIONS))
+_FACE_MASK = np.array([name in FACE_REGIONS for name, *_ in REGIONS])
+_VALUES = np.arange(256, dtype=np.float64)
+
+
+def cheek_budget(face):
+    """Linhas e colunas lidas pela amostragem de uma bochecha (vision.sample_cheek)."""
+    _, _, w, h = face
+    return int(h * 0.65) - int(h * 0.35), int(w * 0.85) - int(w * 0.15)
+
+
+def _histograms(labels, bgr, n_regions):
+    """Histogramas (regiao, canal BGR, valor) e total de pixels por regiao; rotulo 0 fica de fora."""
+    idx = (labels[..., None].astype(np.int32) * 3 + np.arange(3, dtype=np.int32)) * 256 + bgr
+    hist = np.bincount(idx.ravel(), minlength=(n_regions + 1) * 3 * 256).reshape(n_regions + 1, 3, 256)[1:]
+    return hist, hist[:, 0, :].sum(axis=1)
+
+
+def _robust_stats(hist, counts, trim):
+    """Media aparada (descarta `trim` de cada cauda) e intervalo interquartil medio por regiao."""
+    n = counts[:, None, None].astype(np.float64)
+    cdf = np.cumsum(hist, axis=2)
+    lo, hi = trim * n, (1 - trim) * n
+    weights = np.clip(cdf, lo, hi) - np.clip(cdf - hist, lo, hi)
+    means = (weights * _VALUES).sum(axis=2) / np.maximum(hi - lo, 1e-9)[..., 0]
+    q1 = np.argmax(cdf >= 0.25 * n, axis=2)
+    q3 = np.argmax(cdf >= 0.75 * n, axis=2)
+    return means, (q3 - q1).mean(axis=1)
+
+
+def sample_regions(img, face, max_samples=4096, trim=0.2):
+    """Cor robusta de cada regiao da pele a partir da caixa `face` (x, y, w, h).
+
+    Le no maximo `max_samples` pixels (e nunca mais do que a amostragem de
+    uma bochecha leria). Retorna {"rgb", "qualidade", "regioes"}: `rgb` e a
+    media das regioes do rosto ponderada por pixels e qualidade, sem as que
+    fogem da mediana (None sem pele), e cada regiao traz rgb (None com menos de MIN_REGION_PIXELS de
+    pele), pixels de pele, cobertura e qualidade (0-1: cobertura de pele
+    reduzida pelo espalhamento das cores).
+    """
+    x, y, w, h = face
+    height, width = img.shape[:2]
+    bx0, bx1 = max(0, x + int(w * _BOUNDS[0])), min(width, x + int(w * _BOUNDS[1]))
+    by0, by1 = max(0, y + int(h * _BOUNDS[2])), min(height, y + int(h * _BOUNDS[3]))
+    rows, cols = cheek_budget(face)
+    budget = min(max_samples, rows * cols) if max_samples else rows * cols
+    area = max(0, by1 - by0) * max(0, bx1 - bx0)
+    step = max(1, math.ceil(math.sqrt(area / max(budget, 1))))
+
+    # Unica copia: a amostra com passo do retangulo envolvente
+    bgr = np.ascontiguousarray(img[by0:by1:step, bx0:bx1:step])
+    labels = np.zeros(bgr.shape[:2], dtype=np.uint8)
+    for i, (_, rx0, rx1, ry0, ry1) in enumerate(REGIONS, start=1):
+        r0, r1 = (max(0, -(-(y + int(h * v) - by0) // step)) for v in (ry0, ry1))
+        c0, c1 = (max(0, -(-(x + int(w * v) - bx0) // step)) for v in (rx0, rx1))
+        labels[r0:r1, c0:c1] = i
+    totals = np.bincount(labels.ravel(), minlength=len(REGIONS) + 1)[1:]
+
+    if bgr.size:
+        skin = cv2.inRange(cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV), SKIN_LOWER, SKIN_UPPER) > 0
+    else:
+        skin = np.zeros(labels.shape, dtype=bool)
+    hist, counts = _histograms(np.where(skin, labels, 0), bgr, len(REGIONS))
+    fallback = not (counts[_FACE_MASK] >= MIN_REGION_PIXELS).any()
+    if fallback:
+        # Pouca pele pela mascara HSV (luz colorida): usa todos os pixels, como a amostragem da bochecha
+        hist, counts = _histograms(labels, bgr, len(REGIONS))
+    means, spread = _robust_stats(hist, counts, trim)
+
+    valid = counts >= MIN_REGION_PIXELS
+    coverage = counts / np.maximum(totals, 1)
+    quality = np.where(valid, coverage * np.clip(1 - spread / 64, 0, 1), 0.0)
+    if fallback:
+        quality *= 0.5
+    regions = {}
+    for i, (name, *_) in enumerate(REGIONS):
+        b, g, r = means[i]
+        regions[name] = {
+            "rgb": (int(round(r)), int(round(g)), int(round(b))) if valid[i] else None,
+            "pixels": int(counts[i]),
+            "cobertura": round(float(coverage[i]), 2),
+            "qualidade": round(float(quality[i]), 2),
+        }
+
+    use = valid & _FACE_MASK
+    if not use.any():
+        return {"rgb": None, "qualidade": 0.0, "regioes": regions}
+    # Regioes longe da mediana das demais (cabelo, barba, sombra forte) ficam fora da cor principal
+    distance = np.linalg.norm(means - np.median(means[use], axis=0), axis=1)
+    if (use & (distance <= MAX_REGION_DISTANCE)).any():
+        use &= distance <= MAX_REGION_DISTANCE
+    weights = counts[use] * np.maximum(quality[use], 0.05)
+    combined = (means[use] * weights[:, None]).sum(axis=0) / weights.sum()
+    # Qualidade geral: media das regioes do rosto pela area (descartadas contam 0), reduzida pela discordancia
+    agreement = max(0.0, 1 - float(np.linalg.norm(means[use] - combined, axis=1).max()) / MAX_REGION_DISTANCE)
+    overall = float((quality[use] * totals[use]).sum() / max(totals[_FACE_MASK].sum(), 1)) * agreement
+    b, g, r = combined
+    return {"rgb": (int(round(r)), int(round(g)), int(round(b))), "qualidade": round(overall, 2), "regioes": regions}
@@ -0,0 +1,33 @@
+import asyncio
+import os
+import sys
+
+import cv2
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Sem upstreams reais: catalogo, gravacao e Gemini ficam desligados nos testes da API
+for name in ("SUPABASE_URL", "SUPABASE_KEY", "GOOGLE_API_KEY"):
+    os.environ.pop(name, None)
+
+
+@pytest.fixture(scope="session")
+def face_jpeg():
+    from benchmarks.corpus import synthetic_face
+    return cv2.imencode(".jpg", synthetic_face(320, (160, 126, 86)))[1].tobytes()
+
+
+@pytest.fixture
+def call_api():
+    """Roda `fn(client)` contra a app (com lifespan) via transporte ASGI."""
+    import main
+
+    def run(fn):
+        async def go():
+            async with main.app.router.lifespan_context(main.app):
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://api") as client:
+                    return await fn(client)
+        return asyncio.run(go())
+
+    return run
@@ -0,0 +1,61 @@
+import io
+import json
+import zipfile
+
+import cv2
+import numpy as np
+
+import main
+
+
+def test_batch_item_error_does_not_abort_stream(call_api, face_jpeg, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_MAX_IMAGE_BYTES", len(face_jpeg) + 10)
+    big = face_jpeg + b"\0" * 100
+
+    async def post(client):
+        return await client.post("/analyze/batch", files=[
+            ("images", ("ok.jpg", face_jpeg, "image/jpeg")),
+            ("images", ("grande.jpg", big, "image/jpeg")),
+        ])
+
+    resp = call_api(post)
+    assert resp.status_code == 200
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert len(lines) == 3
+    assert lines[0]["arquivo"] == "ok.jpg" and "skin_tone" in lines[0]
+    assert lines[1]["arquivo"] == "grande.jpg" and "maior que" in lines[1]["erro"]
+    assert lines[2]["resumo"] == {**lines[2]["resumo"], "total": 2, "sucesso": 1, "erros": 1}
+
+
+def test_batch_body_over_limit_is_refused_before_parsing(call_api, face_jpeg, monkeypatch):
+    from uploads import UploadLimitMiddleware
+    middleware = next(m for m in main.app.user_middleware if m.cls is UploadLimitMiddleware)
+    monkeypatch.setitem(middleware.kwargs["limits"], "/analyze/batch", len(face_jpeg))
+
+    async def go(client):
+        files = [("images", (f"{i}.jpg", face_jpeg, "image/jpeg")) for i in range(2)]
+        return await client.post("/analyze/batch", files=files)
+    assert call_api(go).status_code == 413
+
+
+def test_batch_items_go_through_header_checks(call_api, face_jpeg, monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_MAX_PIXELS", 1000)
+    bmp = cv2.imencode(".bmp", np.zeros((10, 10, 3), np.uint8))[1].tobytes()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("rosto.jpg", face_jpeg)
+        z.writestr("ignorada.bmp", bmp)
+
+    async def post(client):
+        return await client.post("/analyze/batch", files=[
+            ("images", ("grande.jpg", face_jpeg, "image/jpeg")),
+            ("images", ("imagem.bmp", bmp, "image/bmp")),
+            ("images", ("lote.zip", archive.getvalue(), "application/zip")),
+        ])
+
+    lines = [json.loads(line) for line in call_api(post).text.splitlines()]
+    assert [line.get("arquivo") for line in lines[:-1]] == ["grande.jpg", "imagem.bmp", "lote.zip/rosto.jpg"]
+    assert "pixels" in lines[0]["erro"]
+    assert "Formato" in lines[1]["erro"]
+    assert "pixels" in lines[2]["erro"]
+    assert lines[-1]["resumo"]["erros"] == 3
@@ -0,0 +1,65 @@
+import asyncio
+
+from catalog import CatalogSnapshot, ProductCatalog
+
+ROWS = [{"id": "1", "tipo": "base", "hex_code": "#c89678"}, {"id": "2", "tipo": "base", "hex_code": "#604134"}]
+
+
+def make_catalog(ttl=300.0, delay=0.01):
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        await asyncio.sleep(delay)
+        return ROWS
+
+    async def probe():
+        return ("v1", "0-1/2")
+
+    return ProductCatalog(loader, probe, ttl=ttl, use_index=False), loads
+
+
+def test_concurrent_cold_misses_load_once():
+    catalog, loads = make_catalog()
+
+    async def run():
+        return await asyncio.gather(*(catalog.snapshot() for _ in range(20)))
+
+    snaps = asyncio.run(run())
+    assert len(loads) == 1
+    assert all(s is snaps[0] for s in snaps)
+
+
+def test_expired_snapshot_is_served_while_reloading():
+    catalog, loads = make_catalog(ttl=0.05, delay=0.2)
+
+    async def run():
+        first = await catalog.snapshot()
+        await asyncio.sleep(0.06)
+        stale = await asyncio.gather(*(catalog.snapshot() for _ in range(10)))
+        assert all(s is first for s in stale)
+        await catalog._background
+        fresh = await catalog.snapshot()
+        assert fresh is not first
+        await catalog.aclose()
+
+    asyncio.run(run())
+    assert len(loads) == 2
+
+
+def test_unknown_filter_values_are_not_cached():
+    rows = [{"id": str(i), "hex_code": f"#{i:02x}8060", "tipo": "base", "subtom": "quente", "acabamento": "matte"}
+            for i in range(10)]
+    snap = CatalogSnapshot(rows, use_index=False)
+    snap.top_k((200, 150, 120), ("base",), 3, filters=(("subtom", ("quente",)),))
+    for i in range(5):
+        assert snap.top_k((200, 150, 120), ("base",), 3, filters=(("subtom", (f"x{i}",)),)) == []
+    assert len(snap._groups) == 1
+
+
+def test_analyze_rejects_filter_outside_schema(call_api, face_jpeg):
+    async def go(client):
+        return await client.post("/analyze", params={"subtom": "azul"}, files={"image": ("f.jpg", face_jpeg, "image/jpeg")})
+    resp = call_api(go)
+    assert resp.status_code == 400
+    assert "quente" in resp.json()["detail"]
@@ -0,0 +1,55 @@
+import asyncio
+import socket
+
+import pytest
+
+from benchmarks.standins import Latency, StandinServer, create_app
+from http_clients import UpstreamClient
+
+K = 20
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def standins():
+    supabase = Latency()
+    server = StandinServer(create_app(products=10, supabase=supabase), free_port()).start()
+    try:
+        yield server, supabase
+    finally:
+        server.stop()
+
+
+def test_sequential_requests_reuse_connections(standins):
+    server, _ = standins
+
+    async def go():
+        client = UpstreamClient("supabase", server.url, http2=False)
+        try:
+            for _ in range(K):
+                assert (await client.get("/rest/v1/")).status_code == 200
+                assert (await client.post("/rest/v1/analises", json=[{"id": "1"}])).status_code == 201
+            return client.connections_opened
+        finally:
+            await client.aclose()
+    assert 1 <= asyncio.run(go()) < K
+
+
+def test_post_is_not_retried_on_503(standins):
+    server, supabase = standins
+    supabase.error_rate = 1.0
+
+    async def go():
+        client = UpstreamClient("supabase", server.url, http2=False, backoff=0)
+        try:
+            resp = await client.post("/rest/v1/analises", json=[{"id": "1"}])
+            calls = (await client.get("/_calls")).json()
+            return resp.status_code, client.retried, calls["supabase"]
+        finally:
+            await client.aclose()
+    assert asyncio.run(go()) == (503, 0, 1)
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from jobs import JOB_FAILED, JOB_RUNNING, InMemoryJobStore, JobQueue, JobStore, new_job
+
+
+def test_wait_returns_at_once_when_job_changed_since_last_seen():
+    async def go():
+        store = InMemoryJobStore()
+        job = await store.create(new_job())
+        seen = job["atualizado_em"]
+        await asyncio.sleep(0.01)
+        await store.update(job["id"], status=JOB_RUNNING)
+        return await asyncio.wait_for(store.wait(job["id"], timeout=5.0, since=seen), 1.0)
+    assert asyncio.run(go())["status"] == JOB_RUNNING
+
+
+def test_stop_fails_running_and_queued_jobs():
+    async def go():
+        store = InMemoryJobStore()
+        queue = JobQueue(store, concurrency=1, max_queued=5)
+        queue.start()
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(60)
+            return {}
+        jobs = [await store.create(new_job()) for _ in range(3)]
+        for job in jobs:
+            queue.submit(job["id"], slow)
+        await started.wait()
+        await queue.stop()
+        return [(await store.get(job["id"]))["status"] for job in jobs]
+    assert asyncio.run(go()) == [JOB_FAILED] * 3
+
+
+def test_job_store_is_abstract():
+    with pytest.raises(TypeError):
+        JobStore()
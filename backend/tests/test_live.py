@@ -0,0 +1,13 @@
+from live import TrackState, process_frame
+
+
+def test_frame_over_pixel_limit_is_refused_before_decode(face_jpeg):
+    result, _, timings = process_frame(face_jpeg, TrackState(), max_pixels=100)
+    assert "erro" in result
+    assert "decode" not in timings
+
+
+def test_frame_within_limits_is_processed(face_jpeg):
+    result, _, timings = process_frame(face_jpeg, TrackState())
+    assert "erro" not in result
+    assert "decode" in timings
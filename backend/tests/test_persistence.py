@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+import httpx
+
+from persistence import PersistenceQueue
+
+
+def run_write(handler, rows, tmp_path):
+    """Grava `rows` como analises contra um PostgREST simulado; retorna (fila, ok, POSTs)."""
+    posts = []
+
+    def record(request):
+        posts.append(json.loads(request.content))
+        return handler(posts[-1])
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(record), base_url="http://supabase") as client:
+            queue = PersistenceQueue(client, backoff=0, spill_dir=str(tmp_path))
+            ok = await queue._write([{"analise": row, "recomendacoes": []} for row in rows])
+            return queue, ok
+    queue, ok = asyncio.run(go())
+    return queue, ok, posts
+
+
+def test_invalid_row_is_isolated_by_bisection(tmp_path):
+    rows = [{"id": str(i)} for i in range(4)]
+    queue, ok, _ = run_write(lambda body: httpx.Response(422 if any(r["id"] == "2" for r in body) else 201), rows, tmp_path)
+    assert ok
+    assert queue.rejected == 1
+    assert queue.written["analises"] == 3
+
+
+def test_auth_error_fails_whole_batch_without_bisecting(tmp_path):
+    rows = [{"id": str(i)} for i in range(4)]
+    queue, ok, posts = run_write(lambda body: httpx.Response(403, text="permission denied"), rows, tmp_path)
+    assert not ok
+    assert len(posts) == 1
+    assert queue.rejected == 0
+    assert queue.retried == 0
+
+
+def test_constraint_violation_400_is_isolated(tmp_path):
+    rows = [{"id": str(i)} for i in range(4)]
+
+    def handler(body):
+        if any(r["id"] == "1" for r in body):
+            return httpx.Response(400, json={"code": "23502", "message": "null value in column"})
+        return httpx.Response(201)
+    queue, ok, _ = run_write(handler, rows, tmp_path)
+    assert ok
+    assert queue.rejected == 1
+    assert queue.written["analises"] == 3
+
+
+def test_schema_error_400_fails_whole_batch(tmp_path):
+    rows = [{"id": str(i)} for i in range(4)]
+    error = {"code": "PGRST204", "message": "Could not find the 'x' column of 'analises' in the schema cache"}
+    queue, ok, posts = run_write(lambda body: httpx.Response(400, json=error), rows, tmp_path)
+    assert not ok
+    assert len(posts) == 1
+    assert queue.rejected == 0
@@ -0,0 +1,82 @@
+import asyncio
+import socket
+
+import httpx
+import pytest
+
+import main
+from benchmarks.standins import StandinServer, create_app
+from http_clients import UpstreamClient
+from product_queries import decode_cursor, encode_cursor
+
+PRODUCTS = 10
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def products_api(monkeypatch):
+    """GET em /products com o Supabase trocado pelos stand-ins (paginas de 4 linhas)."""
+    server = StandinServer(create_app(products=PRODUCTS), free_port()).start()
+    monkeypatch.setattr(main, "SUPABASE_URL", server.url)
+    monkeypatch.setattr(main, "SUPABASE_KEY", "teste")
+    monkeypatch.setattr(main, "PRODUCTS_PAGE_SIZE", 4)
+
+    def get(**params):
+        async def go():
+            monkeypatch.setattr(main, "supabase", UpstreamClient("supabase", server.url, http2=False))
+            try:
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://api") as client:
+                    return await client.get("/products", params=params)
+            finally:
+                await main.supabase.aclose()
+        return asyncio.run(go())
+
+    try:
+        yield get
+    finally:
+        server.stop()
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("00000007")) == "00000007"
+
+
+def test_pages_follow_cursor_without_gaps(products_api):
+    ids, cursor = [], None
+    while True:
+        page = products_api(limite=3, **({"cursor": cursor} if cursor else {})).json()
+        ids += [item["id"] for item in page["itens"]]
+        cursor = page["proximo_cursor"]
+        if cursor is None:
+            break
+    assert ids == sorted(ids) and len(ids) == len(set(ids)) == PRODUCTS
+
+
+def test_malformed_cursor_is_400(products_api):
+    assert products_api(limite=3, cursor="%%%").status_code == 400
+
+
+def test_projection_keeps_only_requested_columns(products_api):
+    items = products_api(limite=2, campos="marca,hex_code").json()["itens"]
+    assert [set(item) for item in items] == [{"marca", "hex_code"}] * 2
+
+
+def test_compact_page_shape(products_api):
+    page = products_api(limite=2, campos="id,hex_code", formato="compacto").json()
+    assert page["colunas"] == ["id", "hex_code"]
+    assert len(page["linhas"]) == 2 and all(len(row) == 2 for row in page["linhas"])
+    assert page["proximo_cursor"] is not None
+
+
+def test_streaming_spans_pages(products_api):
+    full = products_api(campos="id,marca").json()
+    compact = products_api(campos="id,marca", formato="compacto").json()
+    assert [item["id"] for item in full] == sorted(item["id"] for item in full)
+    assert len(full) == PRODUCTS
+    assert compact["colunas"] == ["id", "marca"]
+    assert compact["linhas"] == [[item["id"], item["marca"]] for item in full]
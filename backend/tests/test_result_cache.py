@@ -0,0 +1,54 @@
+import asyncio
+
+import main
+from result_cache import ResultCache
+
+
+def fake_gemini(monkeypatch, results):
+    """Troca a chamada ao Gemini por respostas fixas; retorna a lista de chamadas."""
+    calls = []
+
+    async def generate(image_bytes, prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        return results[min(len(calls), len(results)) - 1]
+
+    monkeypatch.setattr(main, "generate_makeup_image_gemini", generate)
+    monkeypatch.setattr(main, "result_cache", ResultCache({"rgb": 60, "makeup": 60}))
+    return calls
+
+
+def test_concurrent_identical_requests_call_gemini_once(monkeypatch):
+    calls = fake_gemini(monkeypatch, ["imagem"])
+
+    async def go():
+        return await asyncio.gather(*(main.generate_makeup_image_cached(b"rosto", "prompt") for _ in range(5)))
+    assert asyncio.run(go()) == ["imagem"] * 5
+    assert asyncio.run(main.generate_makeup_image_cached(b"rosto", "prompt")) == "imagem"
+    assert len(calls) == 1
+
+
+def test_failed_generation_is_not_cached(monkeypatch):
+    calls = fake_gemini(monkeypatch, [None, "imagem"])
+
+    async def go():
+        return [await main.generate_makeup_image_cached(b"rosto", "prompt") for _ in range(2)]
+    assert asyncio.run(go()) == [None, "imagem"]
+    assert len(calls) == 2
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"r": 1, "g": 2, "b": 3}
+
+    async def go():
+        first = await ResultCache({"rgb": 60}, disk_dir=str(tmp_path)).get_or_compute("rgb", "k", compute)
+        second = ResultCache({"rgb": 60}, disk_dir=str(tmp_path))
+        return first, await second.get_or_compute("rgb", "k", compute), second.stats()["namespaces"]["rgb"]
+    first, second, stats = asyncio.run(go())
+    assert first == second
+    assert len(calls) == 1
+    assert stats["hits_disco"] == 1
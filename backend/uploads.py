@@ -0,0 +1,113 @@
+"""Leitura de uploads de imagem com limite de tamanho e rejeicao antecipada.
+
+O arquivo e lido em blocos: passa do limite de bytes e a leitura para na
+hora, e o formato real e as dimensoes saem do cabecalho (image_header)
+assim que os primeiros bytes chegam, antes de qualquer decode. O
+UploadLimitMiddleware recusa pelo Content-Length (ou pela contagem do
+corpo recebido) antes mesmo do FastAPI processar o multipart.
+"""
+from fastapi import HTTPException
+
+from image_header import detect_format, read_image_header
+
+ALLOWED_FORMATS = ("jpeg", "png", "webp")
+# Bytes minimos para reconhecer a assinatura do formato
+_SIGNATURE_BYTES = 12
+# Folga para os cabecalhos do multipart e campos de texto (ex: prompt)
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadRejected(ValueError):
+    """Upload recusado; `status_code` e `detail` viram a resposta HTTP."""
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def check_header(data, max_pixels, complete):
+    """Valida formato e dimensoes; None se ainda faltam bytes para decidir."""
+    if len(data) < _SIGNATURE_BYTES and not complete:
+        return None
+    fmt = detect_format(data)
+    if fmt not in ALLOWED_FORMATS:
+        raise UploadRejected(415, f"Formato de imagem nao suportado. Use {', '.join(ALLOWED_FORMATS)}")
+    header = read_image_header(data)
+    if header is None:
+        # JPEG com EXIF grande: as dimensoes ainda nao chegaram
+        if not complete:
+            return None
+        raise UploadRejected(400, "Nao foi possivel ler as dimensoes da imagem")
+    _, width, height = header
+    if width == 0 or height == 0:
+        raise UploadRejected(400, "Dimensoes da imagem invalidas")
+    if width * height > max_pixels:
+        raise UploadRejected(413, f"Imagem grande demais ({width}x{height}); maximo de {max_pixels} pixels")
+    return header
+
+
+async def read_image_upload(upload, max_bytes, max_pixels, chunk_size=256 * 1024):
+    """Le o upload em blocos de `chunk_size`; retorna (bytes, (formato, largura, altura)).
+
+    Levanta UploadRejected acima de `max_bytes`, com formato fora de
+    ALLOWED_FORMATS ou com mais de `max_pixels` pixels.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadRejected(413, f"Imagem maior que {max_bytes} bytes")
+    data = bytearray()
+    header = None
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        data += chunk
+        if len(data) > max_bytes:
+            raise UploadRejected(413, f"Imagem maior que {max_bytes} bytes")
+        if header is None:
+            header = check_header(data, max_pixels, complete=False)
+    if header is None:
+        header = check_header(data, max_pixels, complete=True)
+    return bytes(data), header
+
+
+class UploadLimitMiddleware:
+    """Recusa com 413 corpos maiores que o limite da rota (dict caminho -> bytes).
+
+    Checa o Content-Length antes de chamar a aplicacao e conta os bytes
+    recebidos (corpos chunked ou Content-Length mentiroso).
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            await self._reject(send, limit)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Dentro do parse do formulario o FastAPI repassa HTTPException como resposta
+                    raise HTTPException(status_code=413, detail=f"Corpo da requisicao maior que {limit} bytes")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send, limit):
+        body = ('{"detail":"Corpo da requisicao maior que %d bytes"}' % limit).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                                (b"connection", b"close")]})
+        await send({"type": "http.response.body", "body": body})
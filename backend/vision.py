@@ -0,0 +1,242 @@
+"""Pipeline de visao (decode + deteccao de rosto + amostragem da pele).
+
+Funcoes sincronas e CPU-bound: devem rodar no VisionExecutor, nunca direto
+no event loop. Ficam num modulo separado de main.py para que o pool de
+processos possa importa-las sem carregar a aplicacao inteira.
+"""
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from image_header import read_image_header
+from skin_sampling import sample_regions
+
+# Fatores de reducao suportados pelo decoder JPEG (escala no proprio DCT)
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+NO_FACE_ERROR = "Nenhum rosto detectado na imagem"
+
+CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+
+class CascadePool:
+    """Pool de CascadeClassifier carregados antecipadamente.
+
+    CascadeClassifier nao e seguro para uso concorrente, entao cada chamador
+    pega uma instancia exclusiva com `acquire()` e a devolve ao terminar.
+    """
+
+    def __init__(self, size, path=CASCADE_PATH):
+        self.size = size
+        self.path = path
+        self.load_seconds = None
+        self._queue = queue.Queue()
+
+    def load(self):
+        start = time.perf_counter()
+        for _ in range(self.size):
+            cascade = cv2.CascadeClassifier(self.path)
+            if cascade.empty():
+                raise RuntimeError(f"Nao foi possivel carregar o classificador: {self.path}")
+            self._queue.put(cascade)
+        self.load_seconds = time.perf_counter() - start
+        return self
+
+    @contextmanager
+    def acquire(self):
+        cascade = self._queue.get()
+        try:
+            yield cascade
+        finally:
+            self._queue.put(cascade)
+
+    def stats(self):
+        return {
+            "tamanho": self.size,
+            "disponiveis": self._queue.qsize(),
+            "carga_ms": round(self.load_seconds * 1000, 1) if self.load_seconds is not None else None,
+        }
+
+
+detector_pool = None
+_detector_pool_lock = threading.Lock()
+
+def init_detector_pool(size=1):
+    """Cria e carrega o pool do processo atual (lifespan ou initializer do pool de processos)."""
+    global detector_pool
+    detector_pool = CascadePool(size).load()
+    return detector_pool
+
+def get_detector_pool():
+    if detector_pool is None:
+        # Uso fora da API (scripts, benchmarks): pool minimo carregado sob demanda
+        with _detector_pool_lock:
+            if detector_pool is None:
+                init_detector_pool(1)
+    return detector_pool
+
+def detector_pool_stats():
+    return detector_pool.stats() if detector_pool is not None else None
+
+def warm_up_detector():
+    """Roda uma deteccao em imagem vazia para aquecer o worker; retorna o pid."""
+    with get_detector_pool().acquire() as cascade:
+        cascade.detectMultiScale(np.zeros((64, 64), dtype=np.uint8))
+    return os.getpid()
+
+def decode_image(contents: bytes, min_side=0):
+    """Decodifica a imagem; JPEGs grandes usam os flags de leitura reduzida.
+
+    Escolhe o maior fator (2, 4 ou 8) que ainda deixa o lado maior com pelo
+    menos `min_side` pixels. Com min_side=0 decodifica sempre em resolucao cheia.
+    """
+    flags = cv2.IMREAD_COLOR
+    if min_side:
+        header = read_image_header(contents)
+        if header and header[0] == "jpeg":
+            longest = max(header[1], header[2])
+            for factor, reduced in _REDUCED_FLAGS:
+                if longest // factor >= min_side:
+                    flags = reduced
+                    break
+    return cv2.imdecode(np.frombuffer(contents, np.uint8), flags)
+
+def downscale_for_upload(contents: bytes, max_side, quality=90):
+    """JPEG com lado maior <= `max_side` para enviar a APIs externas (Gemini).
+
+    JPEGs que ja cabem voltam intactos; os demais (e PNG/WebP, ja que o
+    payload declara image/jpeg) sao reduzidos e recodificados. Com
+    max_side=0 so converte o formato. Se o decode falhar, devolve o original.
+    """
+    header = read_image_header(contents)
+    if header and header[0] == "jpeg" and (not max_side or max(header[1], header[2]) <= max_side):
+        return contents
+    img = decode_image(contents, max_side)
+    if img is None:
+        return contents
+    height, width = img.shape[:2]
+    if max_side and max(height, width) > max_side:
+        scale = max_side / max(height, width)
+        img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes() if ok else contents
+
+def detect_face(img, max_side=0, timings=None):
+    """Detecta o maior rosto numa copia reduzida e devolve (x, y, w, h) na escala de `img`.
+
+    O cinza e calculado uma unica vez (ja reduzido) e reaproveitado nas duas
+    passadas; os tamanhos minimos acompanham a escala. Com `timings`, registra
+    "deteccao_principal" e, se a segunda passada rodar, "deteccao_fallback".
+    """
+    height, width = img.shape[:2]
+    scale = min(1.0, max_side / max(height, width)) if max_side else 1.0
+    if scale < 1.0:
+        small = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    else:
+        small = img
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    min_first = max(1, int(50 * scale))
+    min_fallback = max(1, int(30 * scale))
+    with get_detector_pool().acquire() as cascade:
+        start = time.perf_counter()
+        faces = cascade.detectMultiScale(gray, scaleFactor=1.05, minNeighbors=3, minSize=(min_first, min_first), flags=cv2.CASCADE_SCALE_IMAGE)
+        if timings is not None:
+            timings["deteccao_principal"] = time.perf_counter() - start
+        if len(faces) == 0:
+            start = time.perf_counter()
+            faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=2, minSize=(min_fallback, min_fallback))
+            if timings is not None:
+                timings["deteccao_fallback"] = time.perf_counter() - start
+    if len(faces) == 0:
+        return None
+    x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+    if scale < 1.0:
+        x, y = int(x / scale), int(y / scale)
+        w, h = min(int(w / scale), width - x), min(int(h / scale), height - y)
+    return int(x), int(y), int(w), int(h)
+
+def sample_cheek(img, face):
+    """Cor media da pele na faixa das bochechas da caixa `face`; None se a regiao for vazia."""
+    x, y, w, h = face
+    cheek_region = img[y + int(h * 0.35):y + int(h * 0.65), x + int(w * 0.15):x + int(w * 0.85)]
+    if cheek_region.size == 0:
+        return None
+    hsv = cv2.cvtColor(cheek_region, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, np.array([0, 20, 70], dtype=np.uint8), np.array([50, 255, 255], dtype=np.uint8))
+    skin_pixels = cheek_region[mask > 0]
+    if len(skin_pixels) < 100:
+        skin_pixels = cheek_region.reshape(-1, 3)
+    avg_color = np.mean(skin_pixels, axis=0).astype(int)
+    return int(avg_color[2]), int(avg_color[1]), int(avg_color[0])
+
+def extract_skin_color_opencv(img, timings=None, detect_max_side=0):
+    start = time.perf_counter()
+    face = detect_face(img, detect_max_side, timings)
+    if timings is not None:
+        timings["deteccao"] = time.perf_counter() - start
+    if face is None:
+        return None, NO_FACE_ERROR
+    start = time.perf_counter()
+    rgb_color = sample_cheek(img, face)
+    if timings is not None:
+        timings["amostragem"] = time.perf_counter() - start
+    if rgb_color is None:
+        return None, "Nao foi possivel extrair a regiao da pele"
+    return rgb_color, None
+
+def extract_skin_regions_opencv(img, timings=None, detect_max_side=0, max_samples=4096):
+    """Como extract_skin_color_opencv, mas amostra varias regioes do rosto (skin_sampling).
+
+    Retorna (rgb, amostragem, erro); `amostragem` e o resultado de
+    sample_regions (cor e qualidade por regiao).
+    """
+    start = time.perf_counter()
+    face = detect_face(img, detect_max_side, timings)
+    if timings is not None:
+        timings["deteccao"] = time.perf_counter() - start
+    if face is None:
+        return None, None, NO_FACE_ERROR
+    start = time.perf_counter()
+    sampling = sample_regions(img, face, max_samples)
+    if timings is not None:
+        timings["amostragem"] = time.perf_counter() - start
+    if sampling["rgb"] is None:
+        return None, None, "Nao foi possivel extrair a regiao da pele"
+    return sampling["rgb"], sampling, None
+
+def _decode_timed(contents, decode_min_side, timings):
+    start = time.perf_counter()
+    img = decode_image(contents, decode_min_side)
+    timings["decode"] = time.perf_counter() - start
+    return img
+
+def analyze_image_bytes(contents: bytes, detect_max_side=0, decode_min_side=0):
+    """Decodifica a imagem e extrai a cor da pele.
+
+    `detect_max_side` limita o lado maior da copia usada na deteccao e
+    `decode_min_side` habilita a leitura reduzida de JPEGs grandes (0 desliga).
+    Retorna (rgb, erro, tempos) onde `tempos` mapeia etapa -> segundos.
+    """
+    timings = {}
+    img = _decode_timed(contents, decode_min_side, timings)
+    if img is None:
+        return None, "Nao foi possivel processar a imagem", timings
+    rgb_color, error = extract_skin_color_opencv(img, timings, detect_max_side)
+    return rgb_color, error, timings
+
+def analyze_image_regions(contents: bytes, detect_max_side=0, decode_min_side=0, max_samples=4096):
+    """Como analyze_image_bytes, com amostragem em varias regioes.
+
+    Retorna (rgb, amostragem, erro, tempos).
+    """
+    timings = {}
+    img = _decode_timed(contents, decode_min_side, timings)
+    if img is None:
+        return None, None, "Nao foi possivel processar a imagem", timings
+    rgb_color, sampling, error = extract_skin_regions_opencv(img, timings, detect_max_side, max_samples)
+    return rgb_color, sampling, error, timings